@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# NPrinting API v2 for asyncio, so that one event loop monitors many tasks and metadata reloads
+import time
+import asyncio
+from requests.exceptions import ConnectionError
+
+from Qlik.NPrinting import (NPrinting, check_execution, parse_connection_status, check_meta_reload, parse_task_info,
+                            parse_start, parse_execution, completion_time, check_abort, timeout_error)
+from Qlik.Polling import PollScheduler
+from Qlik.Sessions import get_credentials, new_async_client, timeout as http_timeout
+
+
+class AsyncNPrinting:
+    '''NPrinting client with the same methods as NPrinting as coroutines, using a connection-pooled httpx client
+    (optional httpx and httpx-ntlm packages). The waits are asyncio sleeps, so a waiting task can be cancelled.'''
+    __auth = 'np_authorization'     # Airflow variable with the url/userid/password, loaded on first use
+    # seconds between the status checks of the task executions and metadata reloads
+    poll_interval = NPrinting.poll_interval
+    meta_poll_interval = NPrinting.meta_poll_interval
+    # the methods without I/O are shared with NPrinting
+    _record_run = NPrinting._record_run
+
+    def __init__(self, baseURL=None, history=None, max_connections=100):
+        baseURL = baseURL or get_credentials(self.__auth)['url']
+        self.baseURL = baseURL
+        self.history = history      # optional RunHistory to predict the run time of the tasks
+        self.max_connections = max_connections
+        self.api_baseURL = baseURL + '/api/v1'
+        self.client = None
+        self.status_code = None
+        self.connection_id = None
+        self.connection_name = None
+        self.connection_status = None
+        self.task_id = None
+        self.task_name = None
+        self.task_enabled = None
+        self.task_status = None
+        self.task_completed = None
+
+    def __repr__(self):
+        return f"<{self.api_baseURL} AsyncNPrinting object for API connection>"
+
+    async def __aenter__(self):
+        return await self.connect() if self.client is None else self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self, userid=None, password=None):
+        if userid is None or password is None:
+            # Variable.get queries the Airflow metadata database, so it is kept off the event loop
+            auth = await asyncio.to_thread(get_credentials, self.__auth)
+            userid, password = userid or auth['userid'], password or auth['password']
+        self.client = new_async_client(userid, password, max_connections=self.max_connections)
+        await self.login()
+        self.status_code = 200
+        return self
+
+    async def login(self):
+        # set up connection to the NPrinting server
+        r = await self.client.get(self.api_baseURL + '/login/ntlm', timeout=http_timeout(10, 30))
+        token = r.cookies.get('NPWEBCONSOLE_XSRF-TOKEN') or self.client.cookies.get('NPWEBCONSOLE_XSRF-TOKEN')
+        if token is None:
+            raise ConnectionError(f'Login to the NPrinting server {self.baseURL} failed.')
+        self.client.headers.update({"Upgrade-Insecure-Requests": "1", "Content-Type": "application/x-www-form-urlencoded",
+                                    "withCredentials": "True", "X-XSRF-TOKEN": token})
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method, path, timeout=(3, 5), **kwargs):
+        '''Send the request for the path (e.g. /tasks/{taskId}) to the API'''
+        return await self.client.request(method, self.api_baseURL + path, timeout=http_timeout(*timeout), **kwargs)
+
+    async def get_connection_status(self, connId):
+        conn = await self.request('GET', f'/connections/{connId}')
+        return parse_connection_status(conn, connId)
+
+    async def get_task_info(self, taskId):
+        task_info = await self.request('GET', f'/tasks/{taskId}')
+        return parse_task_info(task_info, taskId)
+
+    async def reload_meta(self, connId, timeout=5*60):
+        self.connection_id = connId
+        # reload the metadata connection unless it is reloading already
+        connection_status = (await self.get_connection_status(connId))['cacheStatus']
+        if connection_status not in ['Enqueued', 'Generating']:
+            check_meta_reload(await self.request('POST', f'/connections/{connId}/reload'), connId)
+
+        async for i in PollScheduler(interval=self.meta_poll_interval, timeout=timeout):
+            conn_data = await self.get_connection_status(connId)
+            self.connection_name = conn_data['name']
+            self.connection_status = conn_data['cacheStatus']
+            # Enqueued/Generating/Generated/Aborted/Failed
+            if self.connection_status == 'Generated':
+                return True
+            elif self.connection_status == 'Aborted' or self.connection_status == 'Failed':
+                raise Exception(
+                    f'Reload metadata is {self.connection_status}!')
+        raise TimeoutError(
+            f'Timed out after {timeout} seconds while waiting the metadata reload for "{self.connection_name}" to complete.')
+
+    async def execute_task(self, taskId, timeout=8*3600):
+        self.task_id = taskId
+        task_info = await self.request('GET', f'/tasks/{taskId}')
+        if task_info.status_code == 200:
+            self.task_name = task_info.json()['data']['name']
+            self.task_enabled = task_info.json()['data']['enabled']
+        # execute the task
+        execId = await self.start_task(taskId)
+        started = time.time()
+        first_check = self.history.first_check(taskId, self.poll_interval, timeout=timeout) if self.history else None
+        i = 0
+        async for i in PollScheduler(interval=self.poll_interval, timeout=timeout, backoff=1/60,
+                                     first_check=first_check):
+            exec_data = await self.get_execution(taskId, execId)
+            self.task_status = exec_data['status']
+            # Running/Aborted/Completed/CompletedwithWarning
+            if check_execution(exec_data):
+                self.task_completed = completion_time(exec_data)
+                self._record_run(taskId, started, self.task_status, i + 1, execId)
+                return self.task_status
+        # Abort the execution so that it does not keep holding an NPrinting engine
+        self._record_run(taskId, started, 'Timeout', i + 1, execId)
+        if await self.abort_execution(taskId, execId):
+            raise timeout_error(timeout, taskId, execId)
+
+    async def start_task(self, taskId):
+        '''Start an execution of the task and return its execution ID'''
+        task = await self.request('POST', f'/tasks/{taskId}/executions')
+        return parse_start(task, taskId)
+
+    async def get_execution(self, taskId, execId):
+        '''Return the status data of the task execution'''
+        task_status = await self.request('GET', f'/tasks/{taskId}/executions/{execId}')
+        return parse_execution(task_status, taskId)
+
+    async def abort_execution(self, taskId, execId):
+        '''Abort the running execution of the task, freeing its NPrinting engine'''
+        r = await self.request('PUT', f'/tasks/{taskId}/executions/{execId}/abort')
+        return check_abort(r, taskId, execId)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Qliksense API v2 for asyncio, so that one event loop monitors many tasks and reloads
+import time
+import asyncio
+from dateutil import parser
+from requests.exceptions import ConnectionError
+
+from Qlik.Polling import PollScheduler
+from Qlik.Qliksense import (Qliksense, xrf, headers, null_time, all_status, check_execution, log, health_checks,
+                            active_columns, check_health_results, parse_task_info, parse_app_info, reload_time,
+                            table_request, check_table_response, active_executions_filter, active_execution,
+                            add_active_execution, execution_path, parse_executions, parse_execution, parse_start,
+                            check_stop, app_busy_error, timeout_error)
+from Qlik.Sessions import get_credentials, new_async_client, timeout as http_timeout
+
+
+class AsyncQliksense:
+    '''Qliksense client with the same methods as Qliksense as coroutines, using a connection-pooled httpx client
+    (optional httpx and httpx-ntlm packages). The waits are asyncio sleeps, so a waiting task can be cancelled.'''
+    __auth = 'qs_authorization'     # Airflow variable with the url/userid/password, loaded on first use
+    # metadata and health checks shared with the Qliksense instances of the process
+    metadata_cache = Qliksense.metadata_cache
+    health_cache = Qliksense.health_cache
+    # seconds between the status checks of the running executions and reloads
+    poll_interval = 10
+    # the methods without I/O are shared with Qliksense
+    cache_task_info = Qliksense.cache_task_info
+    invalidate = Qliksense.invalidate
+    _record_run = Qliksense._record_run
+
+    def __init__(self, baseURL=None, history=None, max_connections=100):
+        baseURL = baseURL or get_credentials(self.__auth)['url']
+        self.baseURL = baseURL
+        self.history = history      # optional RunHistory to predict the run time of tasks and app reloads
+        self.max_connections = max_connections
+        self.api_baseURL = baseURL + '/qrs{}?xrfkey={}'
+        self.client = None
+        self.status_code = None
+        self.app_id = None
+        self.app_name = None
+        self.app_lastReload = None
+        self.task_id = None
+        self.task_name = None
+        self.task_enabled = None
+
+    def __repr__(self):
+        return f"<{self.api_baseURL} AsyncQliksense object for API connection>"
+
+    async def __aenter__(self):
+        return await self.connect() if self.client is None else self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self, userid=None, password=None):
+        if userid is None or password is None:
+            # Variable.get queries the Airflow metadata database, so it is kept off the event loop
+            auth = await asyncio.to_thread(get_credentials, self.__auth)
+            userid, password = userid or auth['userid'], password or auth['password']
+        self.client = new_async_client(userid, password, headers, self.max_connections)
+        await self.check_health()
+        self.status_code = 200
+        return self
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method, path, timeout=(3, 5), **kwargs):
+        '''Send the request for the path (e.g. /qrs/about?xrfkey=...) to the baseURL'''
+        return await self.client.request(method, self.baseURL + path, timeout=http_timeout(*timeout), **kwargs)
+
+    async def check_health(self, refresh=False):
+        '''Check the health of Qliksense server, with the three checks at once and the result cached for
+        health_cache.ttl seconds unless refresh'''
+        if not refresh and self.health_cache.get(self.baseURL):
+            return True
+        responses = await asyncio.gather(*(self.request('GET', f'{path}?xrfkey={xrf}', timeout=(5, 10))
+                                           for path in health_checks.values()))
+        check_health_results([r.status_code for r in responses])
+        return self.health_cache.set(self.baseURL, True)
+
+    async def get_task_info(self, taskId, refresh=False):
+        '''Return the app and task metadata of the reloadtask, cached for metadata_cache.ttl seconds unless refresh'''
+        task_info = None if refresh else self.metadata_cache.get((self.baseURL, 'reloadtask', taskId))
+        if task_info:
+            return task_info
+        t = await self.request('GET', f'/qrs/reloadtask/{taskId}?xrfkey={xrf}')
+        return self.cache_task_info(parse_task_info(t, taskId))
+
+    async def get_app_info(self, appId, refresh=False):
+        '''Return the app metadata, cached for metadata_cache.ttl seconds unless refresh'''
+        key = (self.baseURL, 'app', appId)
+        app_info = None if refresh else self.metadata_cache.get(key)
+        if app_info:
+            return app_info
+        r = await self.request('GET', f'/qrs/app/{appId}?xrfkey={xrf}')
+        return self.metadata_cache.set(key, parse_app_info(r, appId))
+
+    async def iter_table(self, qrs_type, columns, filter=None, page_size=200, sort_column=None, ascending=True):
+        '''Yield the QRS objects as dicts of the columns (properties), requesting one page of page_size rows at a time
+        from the /table endpoint'''
+        skip = 0
+        while True:
+            path, body = table_request(qrs_type, columns, filter, skip, page_size, sort_column, ascending)
+            r = await self.request('POST', path, timeout=(3, 30), content=body)
+            check_table_response(r, qrs_type, filter)
+            rows = r.json()['rows']
+            for row in rows:
+                yield dict(zip(columns, row))
+            if len(rows) < page_size:
+                break
+            skip = skip + page_size
+
+    async def get_active_execution(self, appId):
+        '''Return (execution ID, task ID) of the running execution for the app, or None if there is none'''
+        async for exec in self.iter_table('executionresult', active_columns, active_executions_filter([appId]),
+                                          page_size=50, sort_column='startTime', ascending=False):
+            active_exec = active_execution(exec)
+            if active_exec:
+                return active_exec
+
+    async def get_active_executions(self, appIds, batch_size=50):
+        '''Return {app ID: (execution ID, task ID)} of the running executions for many apps with batched requests'''
+        appIds = list(appIds)
+        active_execs = {}
+        for n in range(0, len(appIds), batch_size):
+            async for exec in self.iter_table('executionresult', active_columns,
+                                              active_executions_filter(appIds[n:n + batch_size]),
+                                              sort_column='startTime', ascending=False):
+                add_active_execution(active_execs, exec)
+        return active_execs
+
+    async def get_executions(self, execIds, batch_size=50):
+        '''Fetch the execution results of several task executions with one batched request, keyed by execution ID'''
+        execIds = list(execIds)
+        executions = {}
+        for n in range(0, len(execIds), batch_size):
+            batch = execIds[n:n + batch_size]
+            executions.update(parse_executions(await self.request('GET', execution_path(batch)), batch))
+        return executions
+
+    async def reload_app(self, appId, timeout=21600):
+        '''A task with the name "Manually triggered reload of ..." will be created automatically in QMC if not exists, otherwise
+        the existing "Manually triggered reload of ..." task will be started'''
+        self.app_id = appId
+        app_info = await self.get_app_info(appId, refresh=True)
+        self.app_name = app_info['name']
+        lastRT = reload_time(app_info)
+        reload = await self.request('POST', f'/qrs/app/{appId}/reload?xrfkey={xrf}')
+        self.invalidate(appId=appId)
+        if reload.status_code == 204:
+            started = time.time()
+            first_check = self.history.first_check(appId, self.poll_interval, timeout=timeout) if self.history else None
+            i = 0
+            async for i in PollScheduler(interval=self.poll_interval, timeout=timeout, backoff=1/60,
+                                         first_check=first_check):
+                app_info = await self.get_app_info(appId, refresh=True)
+                newRT = reload_time(app_info)
+                if newRT > lastRT:
+                    self.app_lastReload = newRT.strftime('%Y-%m-%d %H:%M:%S')
+                    self._record_run(appId, 'app', started, 'Reloaded', True, i + 1)
+                    return True
+            self._record_run(appId, 'app', started, 'Timeout', False, i + 1)
+            raise TimeoutError(
+                f'Timed out after {timeout} s while waiting the data reload for the app "{self.app_name}" to complete.')
+        else:
+            raise ConnectionError(
+                f'Attemp to request the reload for the app "{self.app_name}" with the app ID {appId} failed.')
+
+    async def start_task(self, taskId):
+        t = await self.request('POST', f'/qrs/task/{taskId}/start/synchronous?xrfkey={xrf}')
+        self.invalidate(taskId=taskId)
+        return parse_start(t, taskId)
+
+    async def stop_task(self, taskId):
+        t = await self.request('POST', f'/qrs/task/{taskId}/stop?xrfkey={xrf}')
+        self.invalidate(taskId=taskId)
+        await asyncio.sleep(5)
+        check_stop(t, taskId)
+        app = (await self.get_task_info(taskId))['app']
+        return check_stop(t, taskId, await self.get_active_execution(app['id']), app['name'])
+
+    async def loop_execution_status(self, execId, timeout=36000):
+        path = execution_path([execId])
+        exec_result = parse_execution(await self.request('GET', path), execId)
+        taskId = exec_result['taskID']
+        appName = (await self.get_task_info(taskId))['app']['name']
+
+        # Stay idle until shortly before the expected finish time if the task has a run history
+        started = time.time()
+        if exec_result['startTime'] != null_time:
+            started = min(started, parser.parse(exec_result['startTime']).timestamp())
+        first_check, envelope = None, None
+        if self.history:
+            first_check = self.history.first_check(taskId, self.poll_interval, elapsed=time.time() - started,
+                                                   timeout=timeout)
+            envelope = self.history.envelope(taskId)
+
+        i = 0
+        async for i in PollScheduler(interval=self.poll_interval, timeout=timeout, backoff=1/60,
+                                     first_check=first_check):
+            exec_result = parse_execution(await self.request('GET', path), execId)
+            try:
+                status = check_execution(exec_result, appName)
+            except ChildProcessError:
+                self._record_run(taskId, 'task', started, all_status[exec_result['status']], False, i + 1, execId,
+                                 exec_result)
+                raise
+            if status:
+                self._record_run(taskId, 'task', started, status, True, i + 1, execId, exec_result)
+                app_info = await self.get_app_info(exec_result['appID'], refresh=True)
+                self.app_lastReload = reload_time(app_info).strftime('%Y-%m-%d %H:%M:%S')
+                return status
+            if envelope and time.time() - started > envelope:
+                log.warning(
+                    f'The task {taskId} with execution {execId} for the app "{appName}" has been running for {time.time() - started:.0f}s, longer than its usual run time of {envelope:.0f}s.')
+                envelope = None
+        self._record_run(taskId, 'task', started, 'Timeout', False, i + 1, execId, exec_result)
+        if await self.stop_task(taskId):
+            raise timeout_error(timeout, taskId, appName)
+
+    # action=proceed/skip/wait/stop/error
+    async def execute_task(self, taskId, action='proceed', timeout=36000):
+        self.task_id = taskId
+        task_info = await self.get_task_info(taskId)
+        self.task_name = task_info['task']['name']
+        self.task_enabled = task_info['task']['enabled']
+        self.app_id = task_info['app']['id']
+        self.app_name = task_info['app']['name']
+        options = ['proceed', 'skip', 'wait', 'stop', 'error']
+
+        if not task_info['task']['enabled']:
+            raise PermissionError(
+                f'{self.task_name} with task ID {taskId} is not enabled to execute!')
+        active_exec = await self.get_active_execution(self.app_id)
+        if not active_exec:
+            execId = await self.start_task(taskId)
+            return await self.loop_execution_status(execId, timeout)
+        active_execId, active_taskId = active_exec
+        # Proceed with the active running task by monitoring its status
+        if action == 'proceed' or action not in options:
+            status = await self.loop_execution_status(active_execId, timeout)
+            return f'{status} with the active execution {active_execId} for the task {active_taskId} instead'
+        # Skip the active running task without monitoring its status
+        if action == 'skip':
+            return f'Skipped with another task {active_taskId} running'
+        # Wait to execute the new task until the active running task is completed
+        if action == 'wait':
+            if await self.loop_execution_status(active_execId):
+                execId = await self.start_task(taskId)
+                status = await self.loop_execution_status(execId, timeout)
+                return f'{status} after another running task {active_taskId} is completed'
+            raise app_busy_error(taskId, active_taskId, self.app_name)
+        # Stop the active running task and then execute the new task
+        if action == 'stop':
+            if await self.stop_task(active_taskId):
+                execId = await self.start_task(taskId)
+                status = await self.loop_execution_status(execId, timeout)
+                return f'{status} by stopping another running task {active_taskId}'
+            raise RuntimeError(
+                f'Attempt to stop the active task with task ID {active_taskId} for the app {self.app_name} failed.')
+        # Raise error if there is an active running task
+        raise app_busy_error(taskId, active_taskId, self.app_name)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Offline benchmark of the Qliksense/NPrinting API clients against the local MockQlikServer
+#   python -m Qlik.Benchmark --tasks 10 100 300 --duration 2 --interval 0.5 --output bench.json
+#   python -m Qlik.Benchmark --baseline bench.json   # exit with 1 on a regression
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+from Qlik.MockServer import MockQlikServer
+from Qlik.NPrinting import NPrinting
+from Qlik.Qliksense import Qliksense
+
+# lower is better for all of them
+compared_measures = ('overhead', 'requests_per_task', 'cpu_per_task')
+
+
+def serve(conn, kwargs):
+    '''Run MockQlikServer and answer the commands of ServerProcess until "stop"'''
+    with MockQlikServer(**kwargs) as server:
+        conn.send(server.baseURL)
+        for command in iter(conn.recv, 'stop'):
+            if command == 'clear':
+                server.counts.clear()
+            conn.send(server.total_requests)
+
+
+class ServerProcess:
+    '''MockQlikServer running in a child process, so that the CPU time of the benchmark process is the client's only,
+    including its poller and health check threads'''
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.duration = kwargs['duration']
+        self.baseURL = None
+        self.conn = None
+        self.process = None
+
+    def __enter__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.get_context('spawn').Process(target=serve, args=(child_conn, self.kwargs),
+                                                                    daemon=True)
+        self.process.start()
+        self.baseURL = self.conn.recv()
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.send('stop')
+        self.process.join(10)
+
+    def clear_counts(self):
+        self.conn.send('clear')
+        self.conn.recv()
+
+    @property
+    def total_requests(self):
+        self.conn.send('count')
+        return self.conn.recv()
+
+
+def measure(server, name, n, run):
+    '''Run the scenario and return its measures: wall-clock overhead over the task duration, requests per completed
+    task and CPU seconds of the client per waiting task. The mock server runs in another process, so the CPU time of
+    this process is the client's.'''
+    server.clear_counts()
+    start, cpu_start = time.monotonic(), time.process_time()
+    failures = run()
+    wall, cpu = time.monotonic() - start, time.process_time() - cpu_start
+    completed = max(n - failures, 1)
+    requests = server.total_requests
+    return dict(scenario=name, tasks=n, failures=failures, duration=server.duration, wall=round(wall, 3),
+                overhead=round(wall - server.duration, 3), requests=requests,
+                requests_per_task=round(requests / completed, 2), cpu_per_task=round(cpu / n, 6))
+
+
+def run_benchmarks(sizes=(10, 100, 300), duration=2.0, interval=0.5, latency=0.0, concurrency=None):
+    '''Return the measures of the single task/reload scenarios and of execute_tasks for every number of tasks'''
+    intervals = Qliksense.poll_interval, NPrinting.poll_interval, NPrinting.meta_poll_interval
+    Qliksense.poll_interval = NPrinting.poll_interval = NPrinting.meta_poll_interval = interval
+    results = []
+    try:
+        with ServerProcess(duration=duration, latency=latency) as server:
+            qs = Qliksense(baseURL=server.baseURL).connect('benchmark', 'benchmark')
+            np = NPrinting(baseURL=server.baseURL).connect('benchmark', 'benchmark')
+
+            def count_failures(results):
+                return sum(isinstance(result, Exception) for taskId, result in results)
+
+            results.append(measure(server, 'qliksense.execute_task', 1,
+                                   lambda: int(qs.execute_task('single-task') is None)))
+            results.append(measure(server, 'qliksense.reload_app', 1,
+                                   lambda: int(not qs.reload_app('single-app'))))
+            results.append(measure(server, 'nprinting.execute_task', 1,
+                                   lambda: int(np.execute_task('single-report') == 'Aborted')))
+            results.append(measure(server, 'nprinting.reload_meta', 1,
+                                   lambda: int(not np.reload_meta('single-connection'))))
+            for n in sizes:
+                taskIds = [f'batch{n}-task-{i}' for i in range(n)]
+                results.append(measure(server, f'qliksense.execute_tasks[{n}]', n, lambda: count_failures(
+                    qs.execute_tasks(taskIds, max_concurrency=concurrency or n, timeout=duration * 10 + 60))))
+                reportIds = [f'batch{n}-report-{i}' for i in range(n)]
+                results.append(measure(server, f'nprinting.execute_tasks[{n}]', n, lambda: count_failures(
+                    (taskId, result) for taskId, result, completed in
+                    np.execute_tasks(reportIds, max_concurrency=concurrency or n, timeout=duration * 10 + 60))))
+    finally:
+        Qliksense.poll_interval, NPrinting.poll_interval, NPrinting.meta_poll_interval = intervals
+    return results
+
+
+def compare(results, baseline, tolerance=0.5, measures=compared_measures):
+    '''Return the regressions of the results against the baseline results, where a measure is worse than the
+    baseline by more than the tolerance (a fraction of the baseline value)'''
+    baseline = {result['scenario']: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['scenario'])
+        if not base:
+            continue
+        for measure in measures:
+            limit = base[measure] * (1 + tolerance) if base[measure] > 0 else base[measure] + tolerance
+            if result[measure] > limit:
+                regressions.append(f'{result["scenario"]}: {measure} {result[measure]} > {base[measure]} (baseline)')
+    return regressions
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Offline benchmark of the Qliksense/NPrinting API clients')
+    args.add_argument('--tasks', type=int, nargs='+', default=[10, 100, 300],
+                      help='numbers of concurrent task executions to measure')
+    args.add_argument('--duration', type=float, default=2.0, help='seconds every task execution or reload takes')
+    args.add_argument('--interval', type=float, default=0.5, help='poll interval of the clients in seconds')
+    args.add_argument('--latency', type=float, default=0.0, help='response time of the mock server in seconds')
+    args.add_argument('--concurrency', type=int, default=None,
+                      help='max_concurrency of execute_tasks, all tasks at once by default')
+    args.add_argument('--output', help='file to save the results as JSON')
+    args.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    args.add_argument('--tolerance', type=float, default=0.5, help='allowed regression against the baseline')
+    args = args.parse_args(argv)
+
+    results = run_benchmarks(args.tasks, args.duration, args.interval, args.latency, args.concurrency)
+    columns = ('scenario', 'tasks', 'failures', 'wall', 'overhead', 'requests', 'requests_per_task', 'cpu_per_task')
+    print(' '.join(f'{column:>18}' for column in columns))
+    for result in results:
+        print(' '.join(f'{str(result[column]):>18}' for column in columns))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('Regression', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In-process metadata cache for the Qliksense/NPrinting API clients
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    '''Thread-safe cache whose entries expire ttl seconds after they are set.
+    Once maxsize entries are cached, the least recently used entry is evicted.'''
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()      # key -> (expiry time, value)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<TTLCache with {len(self._data)}/{self.maxsize} entries and ttl {self.ttl}s>"
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses = self.misses + 1
+                return default
+            self._data.move_to_end(key)
+            self.hits = self.hits + 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Qlik Engine JSON API (websocket) client to reload apps with progress events
+import ssl
+import json
+import asyncio
+
+try:
+    # optional, websockets >= 13
+    from websockets.asyncio.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+
+class EngineError(RuntimeError):
+    pass
+
+
+class EngineSession:
+    '''JSON-RPC session over an open Engine websocket, matching the responses to the requests by id'''
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.next_id = 0
+        self.pending = {}
+        self.reader = asyncio.get_running_loop().create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for message in self.ws:
+                data = json.loads(message)
+                # notifications such as OnConnected have no id
+                future = self.pending.pop(data.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in data:
+                    future.set_exception(EngineError(
+                        f'{data["error"].get("message")} ({data["error"].get("code")}): {data["error"].get("parameter", "")}'))
+                else:
+                    future.set_result(data.get('result', {}))
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('The Engine websocket is closed.'))
+
+    async def send(self, method, handle=-1, params=None):
+        '''Send the request and return (request id, future of its result)'''
+        self.next_id = requestId = self.next_id + 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[requestId] = future
+        request = dict(jsonrpc='2.0', id=requestId, method=method, handle=handle, params=params or {})
+        await self.ws.send(json.dumps(request))
+        return requestId, future
+
+    async def call(self, method, handle=-1, params=None):
+        return await (await self.send(method, handle, params))[1]
+
+    async def close(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.reader.cancel()
+        await self.ws.close()
+
+
+class QlikEngine:
+    '''Reload apps through the Qlik Engine JSON API instead of polling QRS.
+
+    The reload is started with DoReload and its progress is read with GetProgress while it runs, so the caller gets
+    the progress messages and the completion as events as soon as they happen. client is a connected Qliksense
+    instance whose proxy session cookie authenticates the websocket; url (ws:// or wss:// base URL) and headers can
+    be given instead, e.g. for a local stand-in server.'''
+
+    def __init__(self, client=None, url=None, headers=None, verify=False):
+        if ws_connect is None:
+            raise ImportError('The websockets package (>= 13) is required to use the Qlik Engine API.')
+        self.client = client
+        self.url = url or client.baseURL.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+        self.headers = dict(headers or {})
+        if client is not None:
+            from Qlik.Qliksense import xrf
+            cookies = '; '.join(f'{name}={value}' for name, value in client.session.cookies.items())
+            self.headers.update({'X-Qlik-xrfkey': xrf, 'User-Agent': 'Windows'})
+            if cookies:
+                self.headers['Cookie'] = cookies
+        self.ssl = None
+        if self.url.startswith('wss://'):
+            self.ssl = ssl.create_default_context()
+            if not verify:
+                self.ssl.check_hostname = False
+                self.ssl.verify_mode = ssl.CERT_NONE
+
+    def __repr__(self):
+        return f"<{self.url} QlikEngine object for Engine API connection>"
+
+    def app_url(self, appId):
+        query = f'?xrfkey={self.headers["X-Qlik-xrfkey"]}' if 'X-Qlik-xrfkey' in self.headers else ''
+        return f'{self.url}/app/{appId}{query}'
+
+    async def reload_events(self, appId, timeout=21600, progress_interval=0.5, partial=False, save=True):
+        '''Reload the app and yield the events as dicts:
+        {"event": "progress", "message": ..., "data": qProgressData} while the reload runs,
+        {"event": "reloaded", "success": True/False} when the reload finishes and {"event": "saved"} after DoSave.'''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with ws_connect(self.app_url(appId), additional_headers=self.headers, ssl=self.ssl,
+                              max_size=None, open_timeout=30) as ws:
+            session = EngineSession(ws)
+            try:
+                doc = await session.call('OpenDoc', -1, [appId])
+                handle = doc['qReturn']['qHandle']
+                reloadId, reload = await session.send('DoReload', handle, dict(qMode=0, qPartial=partial, qDebug=False))
+                last_message = None
+                while not reload.done():
+                    wait = min(progress_interval, deadline - loop.time())
+                    if wait <= 0:
+                        await session.call('CancelReload', -1)
+                        raise TimeoutError(
+                            f'Timed out after {timeout} s while waiting the data reload for the app {appId} to complete.')
+                    await asyncio.wait({reload}, timeout=wait)
+                    if reload.done():
+                        break
+                    progress = (await session.call('GetProgress', -1, dict(qRequestId=reloadId)))['qProgressData']
+                    message = progress.get('qPersistentProgress') or progress.get('qTransientProgress')
+                    if message and message != last_message:
+                        last_message = message
+                        yield dict(event='progress', message=message, data=progress)
+                success = reload.result()['qReturn']
+                yield dict(event='reloaded', success=success)
+                if success and save:
+                    await session.call('DoSave', handle)
+                    yield dict(event='saved')
+            finally:
+                await session.close()
+
+    async def reload(self, appId, on_event=None, timeout=21600, **kwargs):
+        '''Reload the app, passing every event to on_event (a function or a coroutine function), and return True.
+        ChildProcessError is raised if the reload fails.'''
+        async for event in self.reload_events(appId, timeout=timeout, **kwargs):
+            if on_event is not None:
+                result = on_event(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            if event['event'] == 'reloaded' and not event['success']:
+                raise ChildProcessError(f'The data reload for the app {appId} failed in the Qlik Engine.')
+        return True
+
+    def reload_sync(self, appId, on_event=None, timeout=21600, **kwargs):
+        '''Blocking version of reload'''
+        return asyncio.run(self.reload(appId, on_event, timeout, **kwargs))
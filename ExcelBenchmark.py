@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Offline benchmark of the ExcelScripts highlighters and sheet copies on generated P&L-shaped workbooks
+#   python -m Qlik.ExcelBenchmark --rows 1000 10000 100000 --sheets 2 --output excel.json
+#   python -m Qlik.ExcelBenchmark --baseline excel.json   # exit with 1 on a regression
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import WriteOnlyCell
+from openpyxl.styles import Border, Font, PatternFill, Side
+
+from Qlik import ExcelScripts
+from Qlik.Benchmark import compare
+
+try:
+    # optional, not available on Windows
+    import resource
+except ImportError:
+    resource = None
+
+# lower is better for all of them
+compared_measures = ('wall', 'peak_rss_mb', 'output_kb')
+scenarios = ('highlight_cells', 'highlight_sheet_cells', 'highlight_sheet_cells[conditional]', 'copy_sheet',
+             'copy_sheet[interned]', 'stream_sheets')
+
+
+def make_workbook(path, rows=1000, sheets=1, delta_cols=2, variance_cols=2, style_density=0.5, seed=0):
+    '''Write a P&L workbook like the NPrinting exports: a title row, the Group header row with Actual, *TD Variance
+    and Delta % columns, the Income and Expense sections of rows/2 accounts each and the NOI row. style_density is
+    the share of the number cells with their own font, fill, border and number format.'''
+    random.seed(seed)
+    wb = Workbook(write_only=True)
+    styles = [(Font(bold=bold, color=color), PatternFill('solid', start_color=fill, end_color=fill), number_format)
+              for bold in (False, True) for color in ('FF000000', 'FF1F4E79')
+              for fill in ('FFF2F2F2', 'FFDDEBF7') for number_format in ('#,##0;[Red](#,##0)', '0.0%')]
+    border = Border(bottom=Side('thin'))
+    for i in range(sheets):
+        ws = wb.create_sheet(f'Property {i + 1}')
+        ws.column_dimensions['A'].width = 40
+        ws.freeze_panes = 'B3'
+        header = ['Group']
+        for j in range(max(delta_cols, variance_cols, 1)):
+            header.append(f'Actual {j + 1}')
+            if j < variance_cols:
+                header.append(('MTD', 'QTD', 'YTD')[j % 3] + ' Variance')
+            if j < delta_cols:
+                header.append('Delta %')
+        ws.merged_cells.add('A1:C1')
+        ws.append([f'P&L Property {i + 1}'])
+        ws.append(header)
+
+        def cell(value):
+            if random.random() >= style_density:
+                return value
+            font, fill, number_format = random.choice(styles)
+            c = WriteOnlyCell(ws, value)
+            c.font, c.fill, c.border, c.number_format = font, fill, border, number_format
+            return c
+
+        def number(title):
+            if title == 'Delta %':
+                return random.uniform(-0.1, 0.1)
+            if title.endswith('TD Variance'):
+                return random.uniform(-1000, 1000)
+            return random.uniform(0, 100000)
+
+        for section in ('Income', 'Expense'):
+            ws.append([section])
+            for r in range(rows // 2):
+                ws.append([f'{section} account {r + 1}'] + [cell(number(title)) for title in header[1:]])
+        ws.append(['NOI'] + [cell(number(title)) for title in header[1:]])
+    wb.save(path)
+
+
+def run_scenario(name, source, work_dir):
+    '''Run the scenario on a copy of the source workbook in this process and return (wall seconds, output bytes)'''
+    output = os.path.join(work_dir, name.replace('[', '-').replace(']', '') + '.xlsx')
+    shutil.copyfile(source, output)
+    start = time.perf_counter()
+    if name.startswith('highlight'):
+        getattr(ExcelScripts, name.split('[')[0])(output, conditional=name.endswith('[conditional]'))
+    elif name.startswith('copy_sheet'):
+        source_wb = load_workbook(source)
+        target_wb = Workbook()
+        target_wb.remove(target_wb.active)
+        style_map = ExcelScripts.StyleMap(source_wb, target_wb) if name.endswith('[interned]') else None
+        for source_sheet in source_wb.worksheets:
+            ExcelScripts.copy_sheet(source_sheet, target_wb.create_sheet(source_sheet.title), style_map)
+        target_wb.save(output)
+    else:
+        ExcelScripts.stream_sheets([source], output)
+    return time.perf_counter() - start, os.path.getsize(output)
+
+
+def measured_scenario(name, source, work_dir):
+    wall, size = run_scenario(name, source, work_dir)
+    # KB on Linux; the process runs only this scenario
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    return wall, size, rss
+
+
+def measure(name, source, work_dir, rows, sheets):
+    '''Run the scenario in a new process, so that its peak RSS is not hidden by the earlier ones, and return its
+    measures: wall-clock seconds, peak RSS in MB and output size in KB'''
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        wall, size, rss = executor.submit(measured_scenario, name, source, work_dir).result()
+    return dict(scenario=f'{name}[{rows}x{sheets}]', rows=rows, sheets=sheets, wall=round(wall, 3),
+                peak_rss_mb=rss and round(rss, 1), output_kb=round(size / 1024, 1))
+
+
+def run_benchmarks(sizes=(1000, 10000), sheets=1, delta_cols=2, variance_cols=2, style_density=0.5,
+                   names=scenarios):
+    '''Return the measures of every scenario for every number of rows'''
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in sizes:
+            source = os.path.join(work_dir, f'pl-{rows}.xlsx')
+            make_workbook(source, rows, sheets, delta_cols, variance_cols, style_density)
+            for name in names:
+                results.append(measure(name, source, work_dir, rows, sheets))
+    return results
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Offline benchmark of the ExcelScripts highlighters and sheet copies')
+    args.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='numbers of account rows per sheet')
+    args.add_argument('--sheets', type=int, default=1, help='number of sheets per workbook')
+    args.add_argument('--delta', type=int, default=2, help='number of "Delta %%" columns')
+    args.add_argument('--variance', type=int, default=2, help='number of "TD Variance" columns')
+    args.add_argument('--style-density', type=float, default=0.5, help='share of the number cells with a style')
+    args.add_argument('--scenarios', nargs='+', choices=scenarios, default=list(scenarios),
+                      help='functions to measure')
+    args.add_argument('--output', help='file to save the results as JSON')
+    args.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    args.add_argument('--tolerance', type=float, default=0.5, help='allowed regression against the baseline')
+    args = args.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.sheets, args.delta, args.variance, args.style_density, args.scenarios)
+    columns = ('scenario', 'wall', 'peak_rss_mb', 'output_kb')
+    print(' '.join(f'{column:>40}' if column == 'scenario' else f'{column:>12}' for column in columns))
+    for result in results:
+        print(' '.join(f'{str(result[column]):>40}' if column == 'scenario' else f'{str(result[column]):>12}'
+                       for column in columns))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, compared_measures)
+        for regression in regressions:
+            print('Regression', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
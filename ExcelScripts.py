@@ -1,7 +1,24 @@
 import openpyxl
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import Cell, WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Border, Font, PatternFill
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.fills import Fill
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import MultiCellRange
+from openpyxl.worksheet.dimensions import ColumnDimension
+from openpyxl.worksheet.merge import MergedCellRange
+import os
+import time
+import shutil
+import operator
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from copy import copy
+from xml.etree.ElementTree import iterparse
 
 
 def is_number(s):
@@ -11,109 +28,150 @@ def is_number(s):
     except:
         return False
 
-def highlight_cells(path):
-    '''Note: This is the customized code, not for general use'''
-    wb = load_workbook(path, data_only=True)
-    sheet = wb.active
-    max_row = sheet.max_row
-    max_column = sheet.max_column
-    yellow = "00FFFF00"
-
-    grp0_row, grp1_row, grp2_row, last_row = 0, 0, 0, 0
-    for i in range(max_row):
-        if sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'Group':
-            grp0_row = i + 1
-        elif sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'Income':
-            grp1_row = i + 1
-        elif sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'Expense':
-            grp2_row = i + 1
-        elif sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'NOI':
-            last_row = i + 1
-            break
-    cols = []
-    for row in sheet.iter_rows(min_row=grp0_row, max_row=grp0_row, min_col=1, max_col=max_column):
-        for cell in row:
-            if cell.value and cell.value.strip() == 'Delta %':
-                cols.append(cell.column)
+# Rule of the P&L highlighter: the cells of the row section ('Income' or 'Expense') in the columns whose header in
+# the 'Group' row matches (a string equal to the stripped header, or a predicate of it) get the style (PatternFill,
+# Font or Border) if their value is a number meeting the condition, an (operator, limit) pair like ('<=', -0.05)
+Rule = namedtuple('Rule', 'section header condition style')
 
-    # Highlight cells in "Income" group
-    for row in sheet.iter_rows(min_row=grp1_row, max_row=grp2_row-1, min_col=cols[0], max_col=cols[-1]):
-        for cell in row:
-            if is_number(cell.value) and cell.column in cols and cell.value <= -0.05:
-                cell.fill = PatternFill(
-                    start_color=yellow, end_color=yellow, fill_type='solid')
+yellow = PatternFill(start_color="00FFFF00", end_color="00FFFF00", fill_type='solid')
+delta_rules = [Rule('Income', 'Delta %', ('<=', -0.05), yellow),
+               Rule('Expense', 'Delta %', ('>=', 0.05), yellow)]
+variance_rules = delta_rules + [Rule(section, lambda h: 'TD Variance' in h, ('<=', -500), yellow)
+                                for section in ('Income', 'Expense')]
+operators = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq,
+             '<>': operator.ne}
+style_ids = ((Fill, '_fills', 'fillId'), (Font, '_fonts', 'fontId'), (Border, '_borders', 'borderId'))
 
-    # Highlight cells in "Expense" group
-    for row in sheet.iter_rows(min_row=grp2_row, max_row=last_row, min_col=cols[0], max_col=cols[-1]):
-        for cell in row:
-            if is_number(cell.value) and cell.column in cols and cell.value >= 0.05:
-                cell.fill = PatternFill(
-                    start_color=yellow, end_color=yellow, fill_type='solid')
 
-    wb.save(path)
+def match_header(header, value):
+    if not isinstance(value, str):
+        return False
+    return header(value.strip()) if callable(header) else value.strip() == header
 
-def highlight_sheet_cells(path):
-    '''Note: This is the customized code, not for general use'''
-    wb = load_workbook(path, data_only=True)
-    
-    for sht_name in wb.sheetnames:
-        sheet = wb[sht_name]
-        max_row = sheet.max_row
-        max_column = sheet.max_column
-        yellow = "00FFFF00"
-
-        grp0_row, grp1_row, grp2_row, last_row = 0, 0, 0, 0
-        for i in range(max_row):
-            if sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'Group':
-                grp0_row = i + 1
-            elif sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'Income':
-                grp1_row = i + 1
-            elif sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'Expense':
-                grp2_row = i + 1
-            elif sheet[f'A{i+1}'].value and sheet[f'A{i+1}'].value.strip() == 'NOI':
-                last_row = i + 1
+def find_sections(sheet):
+    '''Return the header row and {section: (first row, last row)} of the Income and Expense groups, looking at
+    column A once down to the NOI row'''
+    cells = sheet._cells
+    rows = dict.fromkeys(('Group', 'Income', 'Expense', 'NOI'), 0)
+    for i in range(1, sheet.max_row + 1):
+        cell = cells.get((i, 1))
+        value = cell._value.strip() if cell is not None and isinstance(cell._value, str) else None
+        if value in rows:
+            rows[value] = i
+            if value == 'NOI':
                 break
-        cols = []   # Delta % columns
-        cols_ = []  # *TD Variance columns
-        for row in sheet.iter_rows(min_row=grp0_row, max_row=grp0_row, min_col=1, max_col=max_column):
-            for cell in row:
-                if cell.value and cell.value.strip() == 'Delta %':
-                    cols.append(cell.column)
-                if cell.value and 'TD Variance' in cell.value.strip():
-                    cols_.append(cell.column)
-
-        # Highlight cells in "Income" group
-        for row in sheet.iter_rows(min_row=grp1_row, max_row=grp2_row-1, min_col=cols_[0], max_col=cols[-1]):
-            for cell in row:
-                if is_number(cell.value) and cell.column in cols and cell.value <= -0.05:
-                    cell.fill = PatternFill(start_color=yellow, end_color=yellow, fill_type='solid')
-                if is_number(cell.value) and cell.column in cols_ and cell.value <= -500:
-                    cell.fill = PatternFill(start_color=yellow, end_color=yellow, fill_type='solid')
-
-        # Highlight cells in "Expense" group
-        for row in sheet.iter_rows(min_row=grp2_row, max_row=last_row, min_col=cols_[0], max_col=cols[-1]):
-            for cell in row:
-                if is_number(cell.value) and cell.column in cols and cell.value >= 0.05:
-                    cell.fill = PatternFill(start_color=yellow, end_color=yellow, fill_type='solid')
-                if is_number(cell.value) and cell.column in cols_ and cell.value <= -500:
-                    cell.fill = PatternFill(start_color=yellow, end_color=yellow, fill_type='solid')
+    return rows['Group'], {'Income': (rows['Income'], rows['Expense'] - 1), 'Expense': (rows['Expense'], rows['NOI'])}
+
+def locate_rules(sheet, rules, span=None):
+    '''Yield (rule, column, first row, last row) for every column range the rules apply to.
+
+    span is an optional (first header, last header) pair limiting the rules to the columns from the first column
+    matching the first header to the last one matching the second header.'''
+    header_row, sections = find_sections(sheet)
+    cells = sheet._cells
+    headers = {}
+    for col in range(1, sheet.max_column + 1):
+        cell = cells.get((header_row, col))
+        if cell is not None and cell._value is not None:
+            headers[col] = cell._value
+    min_col, max_col = 1, sheet.max_column
+    if span:
+        firsts = [col for col, value in headers.items() if match_header(span[0], value)]
+        lasts = [col for col, value in headers.items() if match_header(span[1], value)]
+        if not firsts or not lasts:
+            return
+        min_col, max_col = firsts[0], lasts[-1]
+    for rule in rules:
+        first_row, last_row = sections[rule.section]
+        for col, value in headers.items():
+            if min_col <= col <= max_col and match_header(rule.header, value):
+                yield rule, col, first_row, last_row
+
+def apply_rules(sheet, rules, span=None):
+    '''Highlight the cells of the sheet by the rules and return the number of cells styled'''
+    cells = sheet._cells
+    wb = sheet.parent
+    indexes = {}
+    styled = 0
+    for rule, col, first_row, last_row in locate_rules(sheet, rules, span):
+        # the style objects are added to the workbook once, the cells only get their index
+        collection, key = next((coll, key) for base, coll, key in style_ids if isinstance(rule.style, base))
+        if id(rule) not in indexes:
+            indexes[id(rule)] = getattr(wb, collection).add(rule.style)
+        compare, limit = operators[rule.condition[0]], rule.condition[1]
+        for row in range(first_row, last_row + 1):
+            cell = cells.get((row, col))
+            if cell is None:
+                continue
+            value = cell._value
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and compare(value, limit):
+                setattr(cell._style, key, indexes[id(rule)])
+                styled += 1
+    return styled
+
+def add_conditional_rules(sheet, rules, span=None):
+    '''Attach the rules to their column ranges as Excel conditional formatting instead of styling the cells, so
+    the cost does not depend on the number of rows and the highlights follow later edits. Return the number of
+    ranges formatted.'''
+    ranges = 0
+    for rule, col, first_row, last_row in locate_rules(sheet, rules, span):
+        if first_row > last_row:
+            continue
+        first_cell = f'{get_column_letter(col)}{first_row}'
+        formula = f'AND(ISNUMBER({first_cell}),{first_cell}{rule.condition[0]}{rule.condition[1]!r})'
+        style = {base.__name__.lower(): rule.style for base in (Fill, Font, Border) if isinstance(rule.style, base)}
+        sheet.conditional_formatting.add(f'{first_cell}:{get_column_letter(col)}{last_row}',
+                                         FormulaRule(formula=[formula], **style))
+        ranges += 1
+    return ranges
 
+def highlight(path, rules, all_sheets=False, span=None, conditional=False):
+    '''Apply the rules to the active sheet, or to every sheet with all_sheets, and save the workbook. With
+    conditional, the rules are saved as conditional formatting rather than cell styles.'''
+    wb = load_workbook(path, data_only=True)
+    for sheet in (wb.worksheets if all_sheets else [wb.active]):
+        (add_conditional_rules if conditional else apply_rules)(sheet, rules, span)
     wb.save(path)
 
+def highlight_cells(path, conditional=False):
+    '''Note: This is the customized code, not for general use'''
+    highlight(path, delta_rules, conditional=conditional)
+
+def highlight_sheet_cells(path, conditional=False):
+    '''Note: This is the customized code, not for general use'''
+    # from the first *TD Variance column to the last Delta % column
+    highlight(path, variance_rules, all_sheets=True, span=(variance_rules[-1].header, 'Delta %'),
+              conditional=conditional)
+
 
 ### Note: General scripts to copy spreadsheet and keep the style format
-def copy_sheet(source_sheet, target_sheet):
-    copy_cells(source_sheet, target_sheet)             # copy all the cell values and styles
-    copy_sheet_attributes(source_sheet, target_sheet)
+def copy_sheet(source_sheet, target_sheet, style_map=None):
+    '''With a StyleMap of the two workbooks, the styles are mapped by index instead of copied per cell; reuse the
+    same StyleMap for all the sheets copied between the same workbooks'''
+    if style_map is None:
+        copy_cells(source_sheet, target_sheet)             # copy all the cell values and styles
+    else:
+        copy_cells_interned(source_sheet, target_sheet, style_map)
+    copy_sheet_attributes(source_sheet, target_sheet, style_map)
 
-def copy_sheet_attributes(source_sheet, target_sheet):
+def copy_sheet_attributes(source_sheet, target_sheet, style_map=None):
     target_sheet.sheet_format = copy(source_sheet.sheet_format)
     target_sheet.sheet_properties = copy(source_sheet.sheet_properties)
-    target_sheet.merged_cells = copy(source_sheet.merged_cells)
     target_sheet.page_margins = copy(source_sheet.page_margins)
     target_sheet.freeze_panes = copy(source_sheet.freeze_panes)
     target_sheet._images = copy(source_sheet._images)
 
+    if style_map is not None:
+        # the merged ranges and dimensions all at once, bound to the target sheet and with their style mapped
+        target_sheet.merged_cells = MultiCellRange([MergedCellRange(target_sheet, cell_range.coord)
+                                                    for cell_range in source_sheet.merged_cells.ranges])
+        target_sheet.row_dimensions.update({index: style_map.copy_dimension(dim, target_sheet)
+                                            for index, dim in source_sheet.row_dimensions.items()})
+        target_sheet.column_dimensions.update({key: style_map.copy_dimension(dim, target_sheet)
+                                               for key, dim in source_sheet.column_dimensions.items()})
+        return
+    target_sheet.merged_cells = copy(source_sheet.merged_cells)
+
     # set row dimensions
     # So you cannot copy the row_dimensions attribute. Does not work (because of meta data in the attribute I think). So we copy every row's row_dimensions. That seems to work.
     for rn in range(len(source_sheet.row_dimensions)):
@@ -152,4 +210,202 @@ def copy_cells(source_sheet, target_sheet):
             target_cell._hyperlink = copy(source_cell.hyperlink)
 
         if source_cell.comment:
-            target_cell.comment = copy(source_cell.comment)
\ No newline at end of file
+            target_cell.comment = copy(source_cell.comment)
+
+class StyleMap:
+    '''Map of the style indexes of the source workbook to those of the target workbook. Every distinct cell style
+    is looked up once: its font, fill, border, number format, protection and alignment are added to the target
+    workbook, which keeps one instance of each, and the cells get the mapped indexes.'''
+
+    def __init__(self, source_wb, target_wb):
+        self.source_wb = source_wb
+        self.target_wb = target_wb
+        self.styles = {}
+
+    def map(self, style_array):
+        key = tuple(style_array)
+        mapped = self.styles.get(key)
+        if mapped is None:
+            if self.source_wb is self.target_wb:
+                mapped = StyleArray(style_array)
+            else:
+                source, target = self.source_wb, self.target_wb
+                mapped = StyleArray([
+                    target._fonts.add(source._fonts[style_array.fontId]),
+                    target._fills.add(source._fills[style_array.fillId]),
+                    target._borders.add(source._borders[style_array.borderId]),
+                    self.map_number_format(style_array.numFmtId),
+                    target._protections.add(source._protections[style_array.protectionId]),
+                    target._alignments.add(source._alignments[style_array.alignmentId]),
+                    style_array.pivotButton,
+                    style_array.quotePrefix,
+                    self.map_named_style(style_array.xfId)])
+            self.styles[key] = mapped
+        return mapped
+
+    def map_number_format(self, numFmtId):
+        if numFmtId < BUILTIN_FORMATS_MAX_SIZE:
+            return numFmtId
+        number_format = self.source_wb._number_formats[numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+        return self.target_wb._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+
+    def map_named_style(self, xfId):
+        # the named styles are not copied, a style missing in the target falls back to Normal
+        if xfId >= len(self.source_wb._named_styles):
+            return 0
+        name = self.source_wb._named_styles[xfId].name
+        return self.target_wb._named_styles.names.index(name) if name in self.target_wb._named_styles.names else 0
+
+    def copy_dimension(self, dim, target_sheet):
+        '''Copy of the row or column dimension for the target sheet'''
+        target_dim = dim.__new__(dim.__class__)
+        target_dim.__init__(**dict(dim.__dict__, worksheet=target_sheet))
+        if dim._style is not None:
+            target_dim._style = StyleArray(self.map(dim._style))
+        return target_dim
+
+def copy_cells_interned(source_sheet, target_sheet, style_map):
+    '''copy_cells with the styles mapped by the StyleMap'''
+    target_cells = target_sheet._cells
+    for (row, col), source_cell in source_sheet._cells.items():
+        target_cell = Cell(target_sheet, row=row, column=col,
+                           style_array=style_map.map(source_cell._style) if source_cell.has_style else None)
+        target_cell._value = source_cell._value
+        target_cell.data_type = source_cell.data_type
+        target_cells[(row, col)] = target_cell
+
+        if source_cell.hyperlink:
+            target_cell._hyperlink = copy(source_cell.hyperlink)
+
+        if source_cell.comment:
+            target_cell.comment = copy(source_cell.comment)
+
+
+### Note: Streaming copy for the sheets too large to be loaded, reading row by row and writing as it goes
+def read_sheet_layout(archive, worksheet_path):
+    '''Return the column widths, frozen cell and merged ranges of the sheet, parsing its XML incrementally so that
+    the rows are discarded as they are read'''
+    cols, freeze_panes, merged = [], None, []
+    sheet_data = None
+    with archive.open(worksheet_path) as f:
+        for event, element in iterparse(f, events=('start', 'end')):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag == 'sheetData':
+                    sheet_data = element
+            elif tag == 'row':
+                sheet_data.clear()
+            elif tag == 'col':
+                cols.append(dict(element.attrib))
+            elif tag == 'pane' and element.get('state') in ('frozen', 'frozenSplit'):
+                freeze_panes = element.get('topLeftCell')
+            elif tag == 'mergeCell':
+                merged.append(element.get('ref'))
+    return cols, freeze_panes, merged
+
+def stream_sheet(source_sheet, target_wb, style_map, title=None):
+    '''Append a copy of the read-only source sheet to the write-only target workbook, with the values, styles,
+    column widths, frozen panes and merged ranges'''
+    target_sheet = target_wb.create_sheet(title or source_sheet.title)
+    cols, freeze_panes, merged = read_sheet_layout(source_sheet.parent._archive, source_sheet._worksheet_path)
+    # the columns and panes have to be set before the first row is written
+    for col in cols:
+        first, last = int(col['min']), int(col['max'])
+        dim = ColumnDimension(target_sheet, index=get_column_letter(first), min=first, max=last,
+                              width=float(col.get('width', 13)), hidden=col.get('hidden') in ('1', 'true'),
+                              customWidth=col.get('customWidth') in ('1', 'true'),
+                              outlineLevel=int(col.get('outlineLevel', 0)))
+        if col.get('style'):
+            dim._style = StyleArray(style_map.map(source_sheet.parent._cell_styles[int(col['style'])]))
+        target_sheet.column_dimensions[dim.index] = dim
+    target_sheet.freeze_panes = freeze_panes
+    for cell_range in merged:
+        target_sheet.merged_cells.add(cell_range)
+
+    styles = {}     # mapped style per source style ID
+    for row in source_sheet.iter_rows():
+        values = []
+        for cell in row:
+            style_id = getattr(cell, '_style_id', 0)     # none for the empty cells
+            if not style_id:
+                values.append(cell.value)
+                continue
+            style = styles.get(style_id)
+            if style is None:
+                style = styles[style_id] = style_map.map(cell.style_array)
+            target_cell = WriteOnlyCell(target_sheet, cell.value)
+            target_cell._style = style      # never changed once written
+            values.append(target_cell)
+        target_sheet.append(values)
+    return target_sheet
+
+def stream_sheets(sources, target_path):
+    '''Copy sheets into a new workbook with a memory use independent of their number of rows. sources are paths of
+    workbooks to copy all their sheets, or (path, sheet name) pairs; the sheets keep their names, made unique.'''
+    target_wb = Workbook(write_only=True)
+    workbooks = {}
+    try:
+        for source in sources:
+            path, sheetname = (source, None) if isinstance(source, str) else source
+            if path not in workbooks:
+                source_wb = load_workbook(path, read_only=True)
+                workbooks[path] = (source_wb, StyleMap(source_wb, target_wb))
+            source_wb, style_map = workbooks[path]
+            for name in ([sheetname] if sheetname else source_wb.sheetnames):
+                stream_sheet(source_wb[name], target_wb, style_map)
+        target_wb.save(target_path)
+    finally:
+        for source_wb, style_map in workbooks.values():
+            source_wb.close()
+
+
+### Note: Batch processing of many workbooks, one process per core since openpyxl is CPU-bound
+def process_workbook(operation, path, target_path=None):
+    '''Run operation(path), e.g. highlight_cells, on a temporary copy of the workbook and rename it onto target_path
+    (the workbook itself by default), so that the file is either fully processed or left as it was'''
+    target_path = target_path or path
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_path)), prefix='.',
+                                    suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        shutil.copyfile(path, tmp_path)
+        operation(tmp_path)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def timed_process_workbook(operation, path, target_path=None):
+    '''Return (seconds, None) or (seconds, exception) of process_workbook'''
+    start = time.perf_counter()
+    try:
+        process_workbook(operation, path, target_path)
+    except Exception as e:
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
+
+def process_workbooks(paths, operation, output_dir=None, max_workers=None):
+    '''Run process_workbook on the workbooks in a process pool, one worker per core by default, and yield
+    (path, seconds, exception or None) as each finishes; a failed workbook does not stop the others.
+    operation must be picklable: a module-level function or a functools.partial of one. With output_dir, the
+    processed workbooks are written there under the same names and the sources are left unchanged, so their names
+    have to be unique (ValueError otherwise).'''
+    paths = list({os.path.realpath(path): path for path in paths}.values())
+    if not paths:
+        return
+    if output_dir:
+        names = [os.path.basename(path) for path in paths]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f'Workbooks with the same names would overwrite one another in {output_dir}: '
+                             f'{", ".join(duplicates)}.')
+        os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or min(len(paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(timed_process_workbook, operation, path,
+                                   os.path.join(output_dir, os.path.basename(path)) if output_dir else None): path
+                   for path in paths}
+        for future in as_completed(futures):
+            # the pool itself can fail, e.g. a worker killed for lack of memory
+            error = future.exception()
+            yield (futures[future], None, error) if error else (futures[future], *future.result())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Bulk inventory of the Qliksense reload tasks, apps and streams
+import time
+
+
+class TaskRecord:
+    __slots__ = ('id', 'name', 'enabled', 'isManuallyTriggered', 'appId', 'modifiedDate')
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.name = data['name']
+        self.enabled = data['enabled']
+        self.isManuallyTriggered = data['isManuallyTriggered']
+        self.appId = data['app']['id'] if data.get('app') else None
+        self.modifiedDate = data['modifiedDate']
+
+    def __repr__(self):
+        return f"<TaskRecord {self.name} ({self.id})>"
+
+
+class AppRecord:
+    __slots__ = ('id', 'name', 'published', 'streamId', 'lastReloadTime', 'modifiedDate')
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.name = data['name']
+        self.published = data.get('published', False)
+        self.streamId = data['stream']['id'] if data.get('stream') else None
+        self.lastReloadTime = data.get('lastReloadTime')
+        self.modifiedDate = data['modifiedDate']
+
+    def __repr__(self):
+        return f"<AppRecord {self.name} ({self.id})>"
+
+
+class StreamRecord:
+    __slots__ = ('id', 'name', 'modifiedDate')
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.name = data['name']
+        self.modifiedDate = data['modifiedDate']
+
+    def __repr__(self):
+        return f"<StreamRecord {self.name} ({self.id})>"
+
+
+class QRSInventory:
+    '''In-memory index of all reload tasks, apps and streams of a Qliksense site, loaded with one bulk /full request
+    per object type. refresh() only fetches the objects modified since the previous load, so resolving any number
+    of task or app names costs at most three requests. Deleted objects are dropped by refresh(full=True).'''
+    types = {'reloadtask': TaskRecord, 'app': AppRecord, 'stream': StreamRecord}
+
+    def __init__(self, client):
+        self.client = client            # connected Qliksense instance
+        self.records = {qrs_type: {} for qrs_type in self.types}
+        self.modified_since = {}        # latest modifiedDate loaded per object type
+        self.refreshed_at = None
+        self.tasks_by_name = {}
+        self.apps_by_name = {}
+        self.streams_by_name = {}
+        self.app_tasks = {}
+
+    def __repr__(self):
+        return f"<QRSInventory with {len(self.tasks)} tasks, {len(self.apps)} apps and {len(self.streams)} streams>"
+
+    @property
+    def tasks(self):
+        return self.records['reloadtask']
+
+    @property
+    def apps(self):
+        return self.records['app']
+
+    @property
+    def streams(self):
+        return self.records['stream']
+
+    def age(self):
+        return None if self.refreshed_at is None else time.monotonic() - self.refreshed_at
+
+    def fetch(self, qrs_type, since=None):
+        '''Return the raw /qrs/{qrs_type}/full objects, only those modified since the given QRS timestamp if any'''
+        return self.client.get_full(qrs_type, f"modifiedDate ge '{since}'" if since else None)
+
+    def refresh(self, full=False):
+        for qrs_type, record_type in self.types.items():
+            since = None if full else self.modified_since.get(qrs_type)
+            objects = self.fetch(qrs_type, since)
+            if since is None:
+                self.records[qrs_type] = {}
+            records = self.records[qrs_type]
+            for data in objects:
+                records[data['id']] = record_type(data)
+                if qrs_type == 'reloadtask':
+                    # share the task metadata with get_task_info
+                    self.client.cache_task_info(data)
+            if records:
+                self.modified_since[qrs_type] = max(record.modifiedDate for record in records.values())
+        self.build_indexes()
+        self.refreshed_at = time.monotonic()
+        return self
+
+    def build_indexes(self):
+        self.tasks_by_name, self.apps_by_name, self.streams_by_name, self.app_tasks = {}, {}, {}, {}
+        for task in self.tasks.values():
+            self.tasks_by_name.setdefault(task.name, []).append(task)
+            self.app_tasks.setdefault(task.appId, []).append(task)
+        for app in self.apps.values():
+            self.apps_by_name.setdefault(app.name, []).append(app)
+        for stream in self.streams.values():
+            self.streams_by_name.setdefault(stream.name, []).append(stream)
+
+    @staticmethod
+    def _single(matches, kind, name):
+        if not matches:
+            raise LookupError(f'No {kind} with the name "{name}" is found.')
+        if len(matches) > 1:
+            raise LookupError(
+                f'{len(matches)} {kind}s with the name "{name}" are found: {", ".join(match.id for match in matches)}.')
+        return matches[0]
+
+    def resolve_stream(self, name):
+        return self._single(self.streams_by_name.get(name, []), 'stream', name).id
+
+    def resolve_app(self, name, stream=None):
+        '''Return the ID of the app with the name, within the stream (name) if the app name is not unique'''
+        matches = self.apps_by_name.get(name, [])
+        if stream is not None:
+            streamId = self.resolve_stream(stream)
+            matches = [app for app in matches if app.streamId == streamId]
+        return self._single(matches, 'app', name).id
+
+    def resolve_task(self, name, app=None):
+        '''Return the ID of the reload task with the name, for the app (ID or name) if the task name is not unique'''
+        matches = self.tasks_by_name.get(name, [])
+        if app is not None:
+            appIds = {app} if app in self.apps else {match.id for match in self.apps_by_name.get(app, [])}
+            matches = [task for task in matches if task.appId in appIds]
+        return self._single(matches, 'task', name).id
+
+    def resolve_tasks(self, names):
+        '''Return {name: task ID} for the task names'''
+        return {name: self.resolve_task(name) for name in names}
+
+    def get_app_tasks(self, appId):
+        return list(self.app_tasks.get(appId, []))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Request, polling and execution metrics of the Qliksense/NPrinting API clients
+import re
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+
+guid = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+
+class MetricsHook:
+    '''Base class of the metrics hooks; override the methods of the events to receive.
+
+    on_request: every HTTP response (client, method, endpoint, status_code, latency, retries, nbytes)
+    on_execution: every finished task execution or reload (client, key, execId, status, polls, queue_time,
+                  run_time, wait_time), with queue_time/run_time from the server's timestamps when known
+    on_sleep: every wait of the pollers (seconds)'''
+
+    def on_request(self, client, method, endpoint, status_code, latency, retries, nbytes):
+        pass
+
+    def on_execution(self, client, key, execId, status, polls, queue_time, run_time, wait_time):
+        pass
+
+    def on_sleep(self, seconds):
+        pass
+
+
+class Metrics:
+    '''Registry of the hooks the clients report to. A failing hook never breaks the clients.'''
+
+    def __init__(self):
+        self.hooks = []
+
+    def __repr__(self):
+        return f"<Metrics with {len(self.hooks)} hooks>"
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def emit(self, event, **kwargs):
+        for hook in list(self.hooks):
+            try:
+                getattr(hook, 'on_' + event)(**kwargs)
+            except Exception:
+                pass
+
+    def report(self, url, method, status_code, latency, retries=0, nbytes=0):
+        path = urlsplit(url).path
+        client = 'nprinting' if path.startswith('/api/v1') else 'qliksense'
+        self.emit('request', client=client, method=method, endpoint=guid.sub('{id}', path),
+                  status_code=status_code, latency=latency, retries=retries, nbytes=nbytes)
+
+    def response_hook(self, r, *args, **kwargs):
+        '''requests response hook reporting the request metrics, registered on the pooled sessions'''
+        if not self.hooks:
+            return
+        retries = r.raw.retries if getattr(r.raw, 'retries', None) is not None else None
+        self.report(r.url, r.request.method, r.status_code, r.elapsed.total_seconds(),
+                    retries=len(retries.history) if retries else 0,
+                    nbytes=int(r.headers.get('Content-Length') or 0))
+
+    async def httpx_request_hook(self, request):
+        request.extensions['metrics_start'] = time.monotonic()
+
+    async def httpx_response_hook(self, r):
+        '''httpx response hook reporting the request metrics, registered on the clients of the async API clients'''
+        if not self.hooks:
+            return
+        start = r.request.extensions.get('metrics_start', time.monotonic())
+        self.report(str(r.url), r.request.method, r.status_code, time.monotonic() - start,
+                    nbytes=int(r.headers.get('Content-Length') or 0))
+
+
+class MetricsAggregator(MetricsHook):
+    '''In-memory aggregation of the metrics, exported as JSON or in the Prometheus text format'''
+
+    def __init__(self):
+        self.requests = {}      # (client, method, endpoint, status_code) -> [count, seconds, max seconds, bytes, retries]
+        self.executions = {}    # (client, status) -> [count, polls, queue seconds, run seconds, wait seconds]
+        self.sleeps = [0, 0.0]  # count, seconds
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<MetricsAggregator with {sum(v[0] for v in self.requests.values())} requests>"
+
+    def on_request(self, client, method, endpoint, status_code, latency, retries, nbytes):
+        with self._lock:
+            stats = self.requests.setdefault((client, method, endpoint, status_code), [0, 0.0, 0.0, 0, 0])
+            stats[0] = stats[0] + 1
+            stats[1] = stats[1] + latency
+            stats[2] = max(stats[2], latency)
+            stats[3] = stats[3] + nbytes
+            stats[4] = stats[4] + retries
+
+    def on_execution(self, client, key, execId, status, polls, queue_time, run_time, wait_time):
+        with self._lock:
+            stats = self.executions.setdefault((client, status), [0, 0, 0.0, 0.0, 0.0])
+            stats[0] = stats[0] + 1
+            stats[1] = stats[1] + (polls or 0)
+            stats[2] = stats[2] + (queue_time or 0)
+            stats[3] = stats[3] + (run_time or 0)
+            stats[4] = stats[4] + (wait_time or 0)
+
+    def on_sleep(self, seconds):
+        with self._lock:
+            self.sleeps[0] = self.sleeps[0] + 1
+            self.sleeps[1] = self.sleeps[1] + seconds
+
+    def reset(self):
+        with self._lock:
+            self.requests, self.executions, self.sleeps = {}, {}, [0, 0.0]
+
+    def as_dict(self):
+        with self._lock:
+            requests = [dict(client=client, method=method, endpoint=endpoint, status_code=status_code, count=v[0],
+                             seconds=round(v[1], 6), max_seconds=round(v[2], 6), bytes=v[3], retries=v[4])
+                        for (client, method, endpoint, status_code), v in self.requests.items()]
+            executions = [dict(client=client, status=status, count=v[0], polls=v[1], queue_seconds=round(v[2], 3),
+                               run_seconds=round(v[3], 3), wait_seconds=round(v[4], 3))
+                          for (client, status), v in self.executions.items()]
+            return dict(requests=requests, executions=executions,
+                        sleeps=dict(count=self.sleeps[0], seconds=round(self.sleeps[1], 3)))
+
+    def export_json(self, indent=None):
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def export_prometheus(self, prefix='qlik'):
+        data = self.as_dict()
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f'# HELP {prefix}_{name} {help}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{str(v)}"' for k, v in labels.items())
+                lines.append(f'{prefix}_{name}{{{label_text}}} {value}' if label_text else f'{prefix}_{name} {value}')
+
+        request_labels = [(dict(client=r['client'], method=r['method'], endpoint=r['endpoint'],
+                                status=r['status_code']), r) for r in data['requests']]
+        metric('requests_total', 'counter', 'HTTP requests sent.',
+               [(labels, r['count']) for labels, r in request_labels])
+        metric('request_seconds_total', 'counter', 'Total response time of the HTTP requests.',
+               [(labels, r['seconds']) for labels, r in request_labels])
+        metric('request_seconds_max', 'gauge', 'Slowest response time of the HTTP requests.',
+               [(labels, r['max_seconds']) for labels, r in request_labels])
+        metric('request_bytes_total', 'counter', 'Bytes received in the HTTP responses.',
+               [(labels, r['bytes']) for labels, r in request_labels])
+        metric('request_retries_total', 'counter', 'Connection retries of the HTTP requests.',
+               [(labels, r['retries']) for labels, r in request_labels])
+        execution_labels = [(dict(client=e['client'], status=e['status']), e) for e in data['executions']]
+        metric('executions_total', 'counter', 'Finished task executions and reloads.',
+               [(labels, e['count']) for labels, e in execution_labels])
+        metric('execution_polls_total', 'counter', 'Status checks of the executions.',
+               [(labels, e['polls']) for labels, e in execution_labels])
+        metric('execution_queue_seconds_total', 'counter', 'Time the executions waited in the queue.',
+               [(labels, e['queue_seconds']) for labels, e in execution_labels])
+        metric('execution_run_seconds_total', 'counter', 'Time the executions ran.',
+               [(labels, e['run_seconds']) for labels, e in execution_labels])
+        metric('execution_wait_seconds_total', 'counter', 'Time the clients waited for the executions.',
+               [(labels, e['wait_seconds']) for labels, e in execution_labels])
+        metric('sleeps_total', 'counter', 'Waits of the pollers.', [({}, data['sleeps']['count'])])
+        metric('sleep_seconds_total', 'counter', 'Time the pollers slept.', [({}, data['sleeps']['seconds'])])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
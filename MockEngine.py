@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Local stand-in of the Qlik Engine JSON API to try and test the Engine reloads without a Qlik site
+#   python -m Qlik.MockEngine   # check QlikEngine against the stand-in, exit with 1 on a failure
+import sys
+import json
+import asyncio
+import threading
+
+try:
+    # optional, websockets >= 13
+    from websockets.asyncio.server import serve
+except ImportError:
+    serve = None
+
+
+class MockEngine:
+    '''Websocket server answering OpenDoc, DoReload, GetProgress, CancelReload and DoSave like the Qlik Engine.
+    A reload takes reload_seconds and fails if the app ID is in fail_apps. start() runs the server in a
+    background thread and returns its ws:// URL for QlikEngine(url=...).'''
+
+    def __init__(self, reload_seconds=1, fail_apps=(), host='127.0.0.1', port=0):
+        if serve is None:
+            raise ImportError('The websockets package (>= 13) is required to run the Engine stand-in.')
+        self.reload_seconds = reload_seconds
+        self.fail_apps = set(fail_apps)
+        self.host = host
+        self.port = port
+        self.requests = []          # (method, params) of every request received
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    def __repr__(self):
+        return f"<MockEngine on ws://{self.host}:{self.port}>"
+
+    async def handle(self, ws):
+        appId, reloads = None, {}   # request id of DoReload -> task
+
+        async def reply(requestId, result):
+            await ws.send(json.dumps(dict(jsonrpc='2.0', id=requestId, result=result)))
+
+        async def do_reload(requestId, started):
+            await asyncio.sleep(self.reload_seconds)
+            await reply(requestId, dict(qReturn=appId not in self.fail_apps))
+
+        await ws.send(json.dumps(dict(jsonrpc='2.0', method='OnConnected', params=dict(qSessionState='SESSION_CREATED'))))
+        async for message in ws:
+            request = json.loads(message)
+            method, params, requestId = request['method'], request.get('params'), request['id']
+            self.requests.append((method, params))
+            if method == 'OpenDoc':
+                appId = params[0]
+                await reply(requestId, dict(qReturn=dict(qType='Doc', qHandle=1, qGenericId=appId)))
+            elif method == 'DoReload':
+                started = self.loop.time()
+                reloads[requestId] = (self.loop.create_task(do_reload(requestId, started)), started)
+            elif method == 'GetProgress':
+                task, started = reloads.get(params['qRequestId'], (None, self.loop.time()))
+                elapsed = self.loop.time() - started
+                await reply(requestId, dict(qProgressData=dict(
+                    qStarted=task is not None, qFinished=task is None or task.done(),
+                    qPersistentProgress=f'Lines fetched: {int(elapsed * 1000)}', qTransientProgress='')))
+            elif method == 'CancelReload':
+                for task, started in reloads.values():
+                    task.cancel()
+                await reply(requestId, {})
+            elif method == 'DoSave':
+                await reply(requestId, {})
+            else:
+                await ws.send(json.dumps(dict(jsonrpc='2.0', id=requestId,
+                                              error=dict(code=-32601, message='Method not found', parameter=method))))
+
+    async def _serve(self, started):
+        async with serve(self.handle, self.host, self.port) as server:
+            self.server = server
+            self.port = server.sockets[0].getsockname()[1]
+            started.set()
+            await server.serve_forever()
+
+    def start(self):
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self._serve(started),), daemon=True)
+        self.thread.start()
+        started.wait(10)
+        return f'ws://{self.host}:{self.port}'
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+            self.thread.join(10)
+
+
+def main():
+    '''Reload through QlikEngine a good app, an app whose reload fails and a reload longer than its timeout, and check
+    the events, errors and the cancellation of the timed out reload'''
+    from Qlik.Engine import QlikEngine
+
+    failures = []
+    server = MockEngine(reload_seconds=1, fail_apps={'bad-app'})
+    engine = QlikEngine(url=server.start())
+    try:
+        events = []
+        engine.reload_sync('good-app', events.append)
+        kinds = [event['event'] for event in events]
+        if kinds[-2:] != ['reloaded', 'saved'] or 'progress' not in kinds:
+            failures.append(f'unexpected events of a successful reload: {kinds}')
+        try:
+            engine.reload_sync('bad-app')
+            failures.append('the failed reload did not raise ChildProcessError')
+        except ChildProcessError:
+            pass
+        try:
+            engine.reload_sync('slow-app', timeout=0.3)
+            failures.append('the reload did not time out')
+        except TimeoutError:
+            if 'CancelReload' not in [method for method, params in server.requests]:
+                failures.append('the timed out reload was not cancelled')
+    finally:
+        server.stop()
+    for failure in failures:
+        print('Failed', failure)
+    print(f'{len(server.requests)} requests, {len(failures)} failures')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Local stand-in of an SMTP server to try and test the Mailer without a mail relay
+#   python -m Qlik.MockSMTP   # check Mailer against the stand-in, exit with 1 on a failure
+import sys
+import time
+import base64
+import asyncio
+import threading
+
+
+class MockSMTP:
+    '''SMTP server keeping the messages it receives in messages as (sender, recipients, data). Like Office365, it
+    answers 421 and closes the connection once max_messages (None for no limit) have been sent over it. If user is
+    set, it advertises AUTH PLAIN/LOGIN and refuses other credentials with 535. start() runs the server in a
+    background thread and returns its port for Mailer('127.0.0.1', port).'''
+
+    def __init__(self, max_messages=None, user=None, password=None, host='127.0.0.1', port=0):
+        self.max_messages = max_messages
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.connections = 0        # number of connections accepted
+        self.open_connections = 0   # number of connections not closed yet
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    def __repr__(self):
+        return f"<MockSMTP on {self.host}:{self.port}>"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def check_auth(self, mechanism, credentials):
+        if mechanism == 'PLAIN':
+            authzid, user, password = base64.b64decode(credentials).decode().split('\0')
+        else:
+            user, password = (base64.b64decode(credential).decode() for credential in credentials)
+        return user == self.user and password == self.password
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        sent, sender, recipients, authenticated = 0, None, [], self.user is None
+
+        async def reply(line):
+            writer.write(line.encode() + b'\r\n')
+            await writer.drain()
+
+        async def read_line():
+            return (await reader.readline()).decode().rstrip('\r\n')
+
+        await reply(f'220 {self.host} MockSMTP ready')
+        try:
+            while True:
+                line = await read_line()
+                if not line and reader.at_eof():
+                    break
+                command, _, arg = line.partition(' ')
+                command = command.upper()
+                if command in ('EHLO', 'HELO'):
+                    if command == 'EHLO' and self.user is not None:
+                        await reply(f'250-{self.host}')
+                        await reply('250 AUTH PLAIN LOGIN')
+                    else:
+                        await reply(f'250 {self.host}')
+                elif command == 'AUTH':
+                    mechanism, _, credentials = arg.partition(' ')
+                    mechanism = mechanism.upper()
+                    if mechanism == 'PLAIN' and not credentials:
+                        await reply('334 ')
+                        credentials = await read_line()
+                    elif mechanism == 'LOGIN':
+                        credentials = [credentials] if credentials else []
+                        while len(credentials) < 2:
+                            await reply('334 ' + base64.b64encode(b'Username:' if not credentials
+                                                                  else b'Password:').decode())
+                            credentials.append(await read_line())
+                    if self.user is not None and self.check_auth(mechanism, credentials):
+                        authenticated = True
+                        await reply('235 2.7.0 Authentication successful')
+                    else:
+                        await reply('535 5.7.8 Authentication credentials invalid')
+                elif command == 'MAIL':
+                    if self.max_messages is not None and sent >= self.max_messages:
+                        await reply('421 4.7.0 Too many messages on this connection')
+                        break
+                    if not authenticated:
+                        await reply('530 5.7.0 Authentication required')
+                        continue
+                    sender, recipients = arg.partition(':')[2].strip().strip('<>'), []
+                    await reply('250 OK')
+                elif command == 'RCPT':
+                    recipients.append(arg.partition(':')[2].strip().strip('<>'))
+                    await reply('250 OK')
+                elif command == 'DATA':
+                    await reply('354 End data with <CR><LF>.<CR><LF>')
+                    lines = []
+                    while True:
+                        line = await read_line()
+                        if line == '.' or reader.at_eof():
+                            break
+                        lines.append(line[1:] if line.startswith('..') else line)
+                    self.messages.append((sender, recipients, '\n'.join(lines)))
+                    sent = sent + 1
+                    await reply('250 OK')
+                elif command in ('RSET', 'NOOP'):
+                    sender, recipients = (None, []) if command == 'RSET' else (sender, recipients)
+                    await reply('250 OK')
+                elif command == 'QUIT':
+                    await reply('221 Bye')
+                    break
+                else:
+                    await reply(f'502 5.5.2 {command} is not implemented')
+        except ConnectionError:
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def _serve(self, started):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def start(self):
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self._serve(started),), daemon=True)
+        self.thread.start()
+        started.wait(10)
+        return self.port
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+            self.thread.join(10)
+
+
+def main():
+    '''Send a batch over a server with a limit of messages per connection, check that every message arrives once
+    and that a failed login leaves no connection open'''
+    import smtplib
+    from Qlik.SendMail import Mailer, build_message
+
+    failures = []
+    with MockSMTP(max_messages=3, user='mailer', password='secret') as server:
+        msgs = [build_message('me@example.com', f'to{i}@example.com', '', 'bcc@example.com', f'Report {i}', 'body')
+                for i in range(10)]
+        with Mailer(server.host, server.port, user='mailer', password='secret') as mailer:
+            errors = [error for msg, error in mailer.send_batch(msgs) if error]
+        connections = server.connections
+        if errors or len(server.messages) != len(msgs):
+            failures.append(f'send_batch delivered {len(server.messages)} of {len(msgs)} messages: {errors}')
+        if server.messages and server.messages[0][1] != ['to0@example.com', 'bcc@example.com']:
+            failures.append(f'unexpected recipients {server.messages[0][1]}')
+
+        mailer = Mailer(server.host, server.port, user='mailer', password='wrong', retry_limit=1)
+        try:
+            mailer.connect()
+            failures.append('the login with wrong credentials succeeded')
+        except smtplib.SMTPAuthenticationError:
+            pass
+        # the server sees the connection closed once the client has closed its socket
+        deadline = time.monotonic() + 5
+        while server.open_connections and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if mailer.smtp is not None or server.open_connections:
+            failures.append('the connection of the failed login is left open')
+    for failure in failures:
+        print('Failed', failure)
+    print(f'{len(msgs)} messages over {connections} connections, {len(failures)} failures')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Local stand-in of the Qliksense QRS and NPrinting APIs to measure the clients without a Qlik site
+import re
+import json
+import time
+import uuid
+import base64
+import hashlib
+import random
+import threading
+from collections import Counter
+from http.cookies import SimpleCookie
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+null_time = '1753-01-01T00:00:00.000Z'
+
+
+class HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # hundreds of clients connect at once in the benchmarks
+    request_queue_size = 1024
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class MockQlikServer:
+    '''HTTP server emulating the QRS and NPrinting endpoints used by the Qliksense and NPrinting clients.
+
+    Every task, app and connection ID exists on first use. A task execution, app reload or metadata reload takes
+    durations.get(ID, duration) seconds and fails if the ID is in fail_ids or at random with fail_rate; latency
+    delays every response. counts holds the number of requests per (method, route). reports generated reports of
+    report_size bytes are listed as completed On-Demand requests, and the first cut_downloads downloads break in the
+    middle to exercise the resumed downloads.
+    start() runs the server in a background thread and returns its base URL for both clients.'''
+
+    def __init__(self, duration=1.0, durations=None, fail_ids=(), fail_rate=0.0, latency=0.0, reports=0,
+                 report_size=1024*1024, cut_downloads=0, host='127.0.0.1', port=0):
+        self.duration = duration
+        self.durations = dict(durations or {})
+        self.fail_ids = set(fail_ids)
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.reports = {f'report-{i}': report_size for i in range(reports)}    # generated report ID -> size
+        self.cut_downloads = cut_downloads      # number of downloads to break in the middle
+        self.tokens = set()         # valid NPrinting XSRF tokens
+        self.qrs_sessions = set()   # valid QRS session cookies
+        self.counts = Counter()
+        self.executions = {}        # QRS execution ID -> execution
+        self.reloads = {}           # app ID -> (finish time, failed)
+        self.np_executions = {}     # NPrinting execution ID -> execution
+        self.np_reloads = {}        # connection ID -> (finish time, failed)
+        self.created_at = time.time()
+        self._lock = threading.Lock()
+        self.httpd = HTTPServer((host, port), self.handler())
+        self.thread = None
+
+    def __repr__(self):
+        return f"<MockQlikServer on {self.baseURL}>"
+
+    @property
+    def baseURL(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-qlik-server', daemon=True)
+        self.thread.start()
+        return self.baseURL
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def total_requests(self):
+        return sum(self.counts.values())
+
+    def run_for(self, objectId):
+        '''Return (seconds, fails) for a new run of the task/app/connection'''
+        fails = objectId in self.fail_ids or (self.fail_rate and random.random() < self.fail_rate)
+        return self.durations.get(objectId, self.duration), bool(fails)
+
+    # QRS objects
+    def app(self, appId):
+        now = time.time()
+        finish, failed = self.reloads.get(appId, (self.created_at, False))
+        lastReload = finish if finish <= now and not failed else self.created_at
+        return dict(id=appId, name=f'App {appId}', published=False, stream=None, lastReloadTime=iso(lastReload),
+                    modifiedDate=iso(self.created_at))
+
+    def task(self, taskId):
+        appId = f'app-{taskId}'
+        return dict(id=taskId, name=f'Reload {taskId}', enabled=True, isManuallyTriggered=True,
+                    app=dict(id=appId, name=f'App {appId}'), modifiedDate=iso(self.created_at))
+
+    def execution(self, execution):
+        now = time.time()
+        result = dict(execution['result'])
+        if now >= execution['finish']:
+            result.update(stopTime=iso(execution['finish']), status=8 if execution['failed'] else 7)
+        elif execution['stopped']:
+            result.update(stopTime=iso(execution['stopped']), status=6)
+        return result
+
+    def start_execution(self, taskId):
+        seconds, failed = self.run_for(taskId)
+        now = time.time()
+        execId = str(uuid.uuid4())
+        result = dict(id=str(uuid.uuid4()), executionID=execId, taskID=taskId, appID=f'app-{taskId}', status=2,
+                      createdDate=iso(now), startTime=iso(now), stopTime=null_time)
+        with self._lock:
+            self.executions[execId] = dict(result=result, finish=now + seconds, failed=failed, stopped=None)
+        return execId
+
+    def active_executions(self, appIds):
+        now = time.time()
+        return [execution['result'] for execution in list(self.executions.values())
+                if execution['result']['appID'] in appIds and now < execution['finish'] and not execution['stopped']]
+
+    # NPrinting objects
+    def np_execution(self, execId):
+        execution = self.np_executions[execId]
+        done = time.time() >= execution['finish']
+        status = ('Aborted' if execution['failed'] or execution.get('aborted') else 'Completed') if done else 'Running'
+        return dict(id=execId, task=execution['task'], status=status, created=iso(execution['created']),
+                    completed=iso(execution['finish']) if done else None)
+
+    def np_connection(self, connId):
+        finish, failed = self.np_reloads.get(connId, (self.created_at, False))
+        if time.time() < finish:
+            status = 'Generating'
+        else:
+            status = 'Failed' if failed else 'Generated'
+        return dict(id=connId, name=f'Connection {connId}', cacheStatus=status)
+
+    def expire_sessions(self):
+        '''Invalidate all NPrinting tokens and QRS sessions, like a restart of the services'''
+        with self._lock:
+            self.tokens.clear()
+            self.qrs_sessions.clear()
+
+    def authorize(self, path, headers):
+        '''Return (status code, extra headers) for a refused request, or (None, extra headers) for an accepted one.
+        The NPrinting API requires the XSRF token of a login; QRS emulates the NTLM handshake by setting a new session
+        cookie on the requests without a valid one.'''
+        cookies = SimpleCookie(headers.get('Cookie', ''))
+        with self._lock:
+            if path == '/api/v1/login/ntlm':
+                token = str(uuid.uuid4())
+                self.tokens.add(token)
+                return None, {'Set-Cookie': f'NPWEBCONSOLE_XSRF-TOKEN={token}; Path=/'}
+            if path.startswith('/api/v1/'):
+                return (None, {}) if headers.get('X-XSRF-TOKEN') in self.tokens else (403, {})
+            if 'X-Qlik-Session' in cookies and cookies['X-Qlik-Session'].value in self.qrs_sessions:
+                return None, {}
+            session = str(uuid.uuid4())
+            self.qrs_sessions.add(session)
+            self.counts[('NTLM', 'handshake')] += 1
+            return None, {'Set-Cookie': f'X-Qlik-Session={session}; Path=/; HttpOnly'}
+
+    def report_content(self, reportId, start, stop):
+        pattern = f'{reportId}:'.encode()
+        offset = start % len(pattern)
+        n = (stop - start + offset) // len(pattern) + 1
+        return (pattern * n)[offset:offset + stop - start]
+
+    def route(self, method, path, query, body):
+        '''Return (status code, JSON body or None, extra headers) and the route name for the request'''
+        parts = path.strip('/').split('/')
+        filter = query.get('filter', [''])[0]
+        # QRS
+        if path in ('/qrs/about', '/engine/healthcheck', '/printing/alive'):
+            return (200, dict(buildVersion='mock'), {}), path
+        if method == 'GET' and re.fullmatch(r'/qrs/(app|reloadtask|stream)/full', path):
+            qrs_type = parts[1]
+            objects = {'app': [self.app(f'app-{i}') for i in range(3)],
+                       'reloadtask': [self.task(f'task-{i}') for i in range(3)],
+                       'stream': []}[qrs_type]
+            return (200, objects, {}), f'/qrs/{qrs_type}/full'
+        if method == 'GET' and path == '/qrs/executionresult/full':
+            execIds = re.findall(r'ExecutionId eq ([\w-]+)', filter, re.I)
+            results = [self.execution(self.executions[execId]) for execId in execIds if execId in self.executions]
+            return (200, results, {}), '/qrs/executionresult/full'
+        if method == 'POST' and path == '/qrs/executionresult/table':
+            columns = [column['name'] for column in json.loads(body or '{}').get('columns', [])]
+            appIds = set(re.findall(r'appId eq ([\w-]+)', filter, re.I))
+            rows = [[result.get(column) for column in columns] for result in self.active_executions(appIds)]
+            return (201, dict(columnNames=columns, rows=rows), {}), '/qrs/executionresult/table'
+        if method == 'GET' and len(parts) == 3 and parts[:2] == ['qrs', 'app']:
+            return (200, self.app(parts[2]), {}), '/qrs/app/{id}'
+        if method == 'POST' and len(parts) == 4 and parts[1] == 'app' and parts[3] == 'reload':
+            seconds, failed = self.run_for(parts[2])
+            self.reloads[parts[2]] = (time.time() + seconds, failed)
+            return (204, None, {}), '/qrs/app/{id}/reload'
+        if method == 'GET' and len(parts) == 3 and parts[:2] == ['qrs', 'reloadtask']:
+            return (200, self.task(parts[2]), {}), '/qrs/reloadtask/{id}'
+        if method == 'POST' and len(parts) == 5 and parts[1] == 'task' and parts[3:] == ['start', 'synchronous']:
+            return (201, dict(value=self.start_execution(parts[2])), {}), '/qrs/task/{id}/start/synchronous'
+        if method == 'POST' and len(parts) == 4 and parts[1] == 'task' and parts[3] == 'stop':
+            for execution in list(self.executions.values()):
+                if execution['result']['taskID'] == parts[2] and not execution['stopped']:
+                    execution['stopped'] = time.time()
+            return (204, None, {}), '/qrs/task/{id}/stop'
+        # NPrinting
+        if path == '/api/v1/login/ntlm':
+            return (200, dict(data='mock'), {}), path
+        if parts[:3] == ['api', 'v1', 'tasks']:
+            if method == 'GET' and len(parts) == 4:
+                return (200, dict(data=dict(id=parts[3], name=f'Report {parts[3]}', enabled=True)), {}), '/api/v1/tasks/{id}'
+            if method == 'POST' and len(parts) == 5 and parts[4] == 'executions':
+                seconds, failed = self.run_for(parts[3])
+                execId = str(uuid.uuid4())
+                with self._lock:
+                    self.np_executions[execId] = dict(task=parts[3], created=time.time(),
+                                                      finish=time.time() + seconds, failed=failed)
+                return (202, dict(data=self.np_execution(execId)), {}), '/api/v1/tasks/{id}/executions'
+            if method == 'PUT' and len(parts) == 7 and parts[5] in self.np_executions and parts[6] == 'abort':
+                with self._lock:
+                    execution = self.np_executions[parts[5]]
+                    if time.time() < execution['finish']:
+                        execution.update(finish=time.time(), aborted=True)
+                return (200, None, {}), '/api/v1/tasks/{id}/executions/{id}/abort'
+            if method == 'GET' and len(parts) == 6 and parts[5] in self.np_executions:
+                return (200, dict(data=self.np_execution(parts[5])), {}), '/api/v1/tasks/{id}/executions/{id}'
+        if method == 'GET' and path == '/api/v1/ondemand/requests':
+            items = [dict(id=reportId, status='Completed', outputFormat='xlsx', created=iso(self.created_at),
+                          completed=iso(self.created_at)) for reportId in self.reports]
+            return (200, dict(data=dict(totalItems=len(items), offset=0, limit=len(items), items=items)), {}), path
+        if method == 'GET' and path == '/api/v1/connections':
+            items = [self.np_connection(connId) for connId in list(self.np_reloads)]
+            return (200, dict(data=dict(totalItems=len(items), offset=0, limit=len(items), items=items)), {}), path
+        if parts[:3] == ['api', 'v1', 'connections'] and len(parts) >= 4:
+            if method == 'GET' and len(parts) == 4:
+                return (200, dict(data=self.np_connection(parts[3])), {}), '/api/v1/connections/{id}'
+            if method == 'POST' and len(parts) == 5 and parts[4] == 'reload':
+                seconds, failed = self.run_for(parts[3])
+                self.np_reloads[parts[3]] = (time.time() + seconds, failed)
+                return (200, dict(data=self.np_connection(parts[3])), {}), '/api/v1/connections/{id}/reload'
+        return (404, dict(message=f'{method} {path} is not emulated'), {}), 'unknown'
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are sent separately, Nagle would delay the body of every keep-alive response
+            disable_nagle_algorithm = True
+
+            def download(self, reportId):
+                size = server.reports[reportId]
+                start = int(re.match(r'bytes=(\d+)-', self.headers.get('Range', 'bytes=0-')).group(1))
+                with server._lock:
+                    server.counts[('GET', '/api/v1/ondemand/requests/{id}/result')] += 1
+                    cut = server.cut_downloads > 0
+                    server.cut_downloads = server.cut_downloads - cut
+                digest = base64.b64encode(hashlib.sha256(server.report_content(reportId, 0, size)).digest()).decode()
+                self.send_response(206 if start else 200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(size - start))
+                if start:
+                    self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+                # the reports of the same template share their name
+                self.send_header('Content-Disposition', 'attachment; filename="Report.xlsx"')
+                self.send_header('Digest', f'sha-256={digest}')
+                self.end_headers()
+                stop = start + (size - start) // 2 if cut else size
+                for n in range(start, stop, 64 * 1024):
+                    self.wfile.write(server.report_content(reportId, n, min(n + 64 * 1024, stop)))
+                if cut:
+                    self.close_connection = True
+
+            def respond(self, method):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else ''
+                refused, auth_headers = server.authorize(url.path, self.headers)
+                result = re.fullmatch(r'/api/v1/ondemand/requests/([^/]+)/result', url.path)
+                if refused:
+                    (status_code, data, extra_headers), route = (refused, dict(message='Unauthorized'), {}), 'refused'
+                elif method == 'GET' and result and result.group(1) in server.reports:
+                    return self.download(result.group(1))
+                else:
+                    (status_code, data, extra_headers), route = server.route(method, url.path, parse_qs(url.query), body)
+                extra_headers = dict(extra_headers, **auth_headers)
+                with server._lock:
+                    server.counts[(method, route)] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                payload = b'' if data is None else json.dumps(data).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in extra_headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_POST(self):
+                self.respond('POST')
+
+            def do_PUT(self):
+                self.respond('PUT')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -2,31 +2,110 @@
 # coding: utf-8
 
 # NPrinting API v2
+import os
+import re
 import sys
 import time
 import json
+import base64
+import hashlib
 import pytz
 import requests
-from datetime import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dateutil import parser
-from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import ConnectionError
 from requests_ntlm import HttpNtlmAuth
 
-from airflow.models import Variable
+from Qlik.Metrics import metrics
+from Qlik.Polling import PollScheduler
+from Qlik.Sessions import get_credentials, session_pool
 
 est = pytz.timezone('US/Eastern')
 
+
+def check_execution(exec_data):
+    '''Return the status of a task execution once it is completed (Completed/CompletedWithWarning/Aborted), or None
+    while it is still running'''
+    # None or UTC datetime when completed (ex.2021-11-05T01:52:59.336405Z)
+    if exec_data['completed'] is not None:
+        return exec_data['status']
+    return None
+
+
+# Parsing of the API responses, shared by NPrinting and AsyncNPrinting which only differ in how they send the requests
+def parse_connection_status(r, connId):
+    if r.status_code == 200:
+        return r.json()['data']
+    raise ConnectionError(
+        f'Connection attempt with the connection ID {connId} to check the metadata status failed.')
+
+
+def check_meta_reload(r, connId):
+    if r.status_code != 200:
+        raise ConnectionError(
+            f'Connection attempt with the connection ID {connId} to reload metadata failed.')
+
+
+def parse_task_info(r, taskId):
+    if r.status_code == 200:
+        return r.json()['data']
+    raise ConnectionError(
+        f'Request to check the information of the task with task ID {taskId} failed.')
+
+
+def parse_start(r, taskId):
+    '''Return the execution ID of the response to a task execution request'''
+    if r.status_code == 202:
+        return r.json()['data']['id']
+    raise ConnectionError(
+        f'Request to execute the task with the task ID {taskId} failed.')
+
+
+def parse_execution(r, taskId):
+    if r.status_code == 200:
+        return r.json()['data']
+    raise ConnectionError(
+        f'Request to check the status of the task with task ID {taskId} failed.')
+
+
+def check_abort(r, taskId, execId):
+    if r.status_code in (200, 202, 204):
+        return True
+    raise ConnectionError(
+        f'Attempt to abort the execution {execId} of the task with task ID {taskId} failed. Please abort it manually in the NPrinting web console.')
+
+
+def timeout_error(timeout, taskId, execId):
+    return TimeoutError(
+        f'Timed out after {timeout} s while waiting the task {taskId} to complete. The execution {execId} has been aborted.')
+
+
+def completion_time(exec_data):
+    '''Return the completion time of a completed task execution in Eastern time'''
+    return parser.parse(exec_data['completed']).astimezone(est).strftime('%Y-%m-%d %H:%M:%S')
+
+
 class NPrinting:
-    __auth = Variable.get('np_authorization',deserialize_json=True)
+    __auth = 'np_authorization'     # Airflow variable with the url/userid/password, loaded on first use
+    # seconds between the status checks of the task executions and metadata reloads
+    poll_interval = 10
+    meta_poll_interval = 5
+    # metadata reloads being watched in the process, keyed by baseURL and connection ID, to be joined by other callers
+    meta_reloads = {}
+    meta_lock = threading.Lock()
 
     # baseURL='https://hvqlnp01:4993' ='https://10.10.11.11:4993'
-    def __init__(self, baseURL=__auth['url']):
+    def __init__(self, baseURL=None, history=None, token_cache=None):
         requests.packages.urllib3.disable_warnings()
+        baseURL = baseURL or get_credentials(self.__auth)['url']
         self.baseURL = baseURL
+        self.history = history      # optional RunHistory to predict the run time of tasks
+        self.token_cache = token_cache  # optional TokenCache to reuse the session of earlier processes
         self.api_baseURL = baseURL + '/api/v1'
         self.status_code = None
         self.session = None
+        self.credentials = None     # (userid, password) of the connection, to connect again to another baseURL
         self.connection_name = None
         self.conntction_id = None
         self.connection_status = None
@@ -45,87 +124,188 @@ class NPrinting:
     def set_baseURL(self, baseURL):
         self.baseURL = baseURL
         self.api_baseURL = baseURL + '/api/v1'
+        # Switch to the pooled session of the new baseURL, logged in on first use
+        if self.session is not None:
+            self.connect(*self.credentials)
+
+    def connect(self, userid=None, password=None):
+        if userid is None or password is None:
+            auth = get_credentials(self.__auth)
+            userid, password = userid or auth['userid'], password or auth['password']
+        # Reuse the keep-alive session of the process for the baseURL and credentials
+        s = session_pool.get(self.baseURL, userid, password)[0]
+        # Only one thread sets up and logs in on the shared session, the others wait for its token
+        with session_pool.lock(self.baseURL, userid, password):
+            # The session may have been created by Qliksense for the same baseURL
+            if not getattr(s, 'np_relogin', False):
+                s.hooks['response'].append(self._relogin_hook(s, userid, password))
+                s.np_relogin = True
+            if 'X-XSRF-TOKEN' not in s.headers:
+                # Reuse the session cookies of an earlier process, or log in
+                key = self.token_cache.key('nprinting', self.baseURL, userid, password) if self.token_cache else None
+                if not (key and self.token_cache.restore(key, s) and self.set_token(s)):
+                    self.login(s, userid, password)
+        self.status_code = 200
+        self.session = s
+        self.credentials = userid, password
+        return self
 
-    def connect(self, userid=__auth['userid'], password=__auth['password']):
-        # Set up the maximum attempt number and attemp interval of API connection
-        retry = Retry(connect=5, backoff_factor=0.5)
-        adapter = HTTPAdapter(
-            max_retries=retry, pool_connections=50, pool_maxsize=50)
-        # Set up a session for the API connection
-        s = requests.Session()
-        # Use adapter for all requests to endpoints that start with baseURL
-        s.mount(self.baseURL, adapter)
+    def login(self, s, userid, password, baseURL=None):
+        baseURL = baseURL or self.baseURL
         # set up user credentials
         user_auth = HttpNtlmAuth(userid, password)
         # set up connection to the NPrinting server
-        r = s.get(self.api_baseURL+'/login/ntlm',
+        r = s.get(baseURL+'/api/v1/login/ntlm',
                   auth=user_auth, verify=False, timeout=(10, 30))
+        if not self.set_token(s):
+            raise ConnectionError(f'Login to the NPrinting server {baseURL} failed.')
+        if self.token_cache:
+            self.token_cache.set(self.token_cache.key('nprinting', baseURL, userid, password), s.cookies)
+        return s
+
+    def set_token(self, s):
+        '''Set the XSRF token header from the cookie of the logged in session'''
         cookies = requests.utils.dict_from_cookiejar(s.cookies)
-        token = cookies['NPWEBCONSOLE_XSRF-TOKEN']
+        token = cookies.get('NPWEBCONSOLE_XSRF-TOKEN')
+        if token is None:
+            return None
         s.headers.update({"Upgrade-Insecure-Requests": "1", "Content-Type": "application/x-www-form-urlencoded",
                          "withCredentials": "True", "X-XSRF-TOKEN": token})
-        self.status_code = 200
-        self.session = s
-        return self
+        return s
+
+    def _relogin_hook(self, s, userid, password):
+        '''requests response hook logging in again and resending the request once if the session has expired'''
+        # the session belongs to the baseURL it was created for, even if set_baseURL is called later
+        baseURL = self.baseURL
+
+        def relogin(r, *args, **kwargs):
+            if r.status_code not in (401, 403) or not r.url.startswith(baseURL + '/api/v1') or '/login/' in r.url \
+                    or getattr(r.request, 'relogin', False):
+                return r
+            with session_pool.lock(baseURL, userid, password):
+                # Log in again unless another thread has already done it since the request was sent
+                if s.headers.get('X-XSRF-TOKEN') == r.request.headers.get('X-XSRF-TOKEN'):
+                    if self.token_cache:
+                        self.token_cache.invalidate(self.token_cache.key('nprinting', baseURL, userid, password))
+                    s.cookies.pop('NPWEBCONSOLE_XSRF-TOKEN', None)
+                    self.login(s, userid, password, baseURL)
+            request = r.request.copy()
+            request.relogin = True
+            request.headers['X-XSRF-TOKEN'] = s.headers['X-XSRF-TOKEN']
+            request.headers.pop('Cookie', None)
+            request.prepare_cookies(s.cookies)
+            return s.send(request, **kwargs)
+        return relogin
 
     def get_connection_status(self, connId):
         conn = self.session.get(
             self.api_baseURL+f'/connections/{connId}', verify=False, timeout=(3, 5))
-        if conn.status_code == 200:
-            return conn.json()['data']
-        else:
-            raise ConnectionError(
-                f'Connection attempt with the connection ID {connId} to check the metadata status failed.')
+        return parse_connection_status(conn, connId)
 
     def get_task_info(self, taskId):
         task_info = self.session.get(
             self.api_baseURL+f'/tasks/{taskId}', verify=False, timeout=(3, 5))
-        if task_info.status_code == 200:
-            return task_info.json()['data']
+        return parse_task_info(task_info, taskId)
+
+    def get_connections(self, limit=1000):
+        '''Return {connection ID: connection data} of the connections listed by NPrinting with one request'''
+        conns = self.session.get(self.api_baseURL+f'/connections?limit={limit}', verify=False, timeout=(3, 10))
+        if conns.status_code == 200:
+            return {conn['id']: conn for conn in conns.json()['data']['items']}
         else:
-            raise ConnectionError(
-                f'Request to check the information of the task with task ID {taskId} failed.')
+            raise ConnectionError('Request to list the metadata connections failed.')
 
-    def reload_meta(self, connId):
+    def reload_meta(self, connId, timeout=5*60):
         self.connection_id = connId
-        # reload the metadata connection
+        for connId, result in self.reload_metas([connId], timeout):
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+    def _trigger_meta(self, connId):
+        '''Reload the metadata connection unless it is being reloaded already'''
         connection_status = self.get_connection_status(connId)['cacheStatus']
         if connection_status in ['Enqueued', 'Generating']:
-            pass
-        else:
-            meta = self.session.post(
-                self.api_baseURL + f'/connections/{connId}/reload', timeout=(3, 5))
-            if meta.status_code != 200:
-                raise ConnectionError(
-                    f'Connection attempt with the connection ID {connId} to reload metadata failed.')
-
-        start_time = time.time()
-        interval = 5
-        timeout = 5 * 60
-        check_time = start_time + interval
-
-        while True:
-            time.sleep(1)
-            current_time = time.time()
-            if current_time - start_time > timeout:
-                raise TimeoutError(
-                    f'Timed out after {timeout} seconds while waiting the metadata reload for "{self.connection_name}" to complete.')
+            return
+        meta = self.session.post(
+            self.api_baseURL + f'/connections/{connId}/reload', timeout=(3, 5))
+        check_meta_reload(meta, connId)
+
+    def reload_metas(self, connIds, timeout=5*60, interval=None):
+        '''Reload the metadata of several connections at once and yield (connId, result) as each reload finishes, where
+        result is True or the exception reload_meta would raise for that connection.
+
+        The reloads are triggered in parallel and watched from one poller with the list of the connections. A reload of
+        the same connection already watched in the process (e.g. by another DAG task) is joined instead of polled
+        again.'''
+        connIds = list(dict.fromkeys(connIds))
+        owned, joined = {}, {}      # connection ID -> Future of the reload
+        with self.meta_lock:
+            for connId in connIds:
+                future = self.meta_reloads.get((self.baseURL, connId))
+                if future is not None and not future.done():
+                    joined[connId] = future
+                else:
+                    owned[connId] = self.meta_reloads[(self.baseURL, connId)] = Future()
+        names = {}
+
+        def finish(connId, result):
+            future = owned.pop(connId)
+            with self.meta_lock:
+                if self.meta_reloads.get((self.baseURL, connId)) is future:
+                    del self.meta_reloads[(self.baseURL, connId)]
+            if isinstance(result, Exception):
+                future.set_exception(result)
             else:
-                if int(current_time) >= int(check_time):
-                    conn_data = self.get_connection_status(connId)
-                    self.connection_name = conn_data['name']
-                    self.connection_status = conn_data['cacheStatus']
-                    # Enqueued/Generating/Generated/Aborted/Failed
-                    if self.connection_status == 'Generated':
-                        # print(f'The metadata for "{self.connection_name}" is reloaded successfully!')
-                        return True
-                        break
-                    elif self.connection_status == 'Aborted' or self.connection_status == 'Failed':
-                        raise Exception(
-                            f'Reload metadata is {self.connection_status}!')
-                    check_time = time.time() + interval
-
-    def execute_task(self, taskId):
+                future.set_result(result)
+            return connId, result
+
+        try:
+            if owned:
+                with ThreadPoolExecutor(max_workers=min(len(owned), 10)) as executor:
+                    triggers = list(zip(list(owned), executor.map(
+                        lambda connId: self._capture(self._trigger_meta, connId), list(owned))))
+                for connId, error in triggers:
+                    if error is not None:
+                        yield finish(connId, error)
+            for i in PollScheduler(interval=interval or self.meta_poll_interval, timeout=timeout):
+                if owned:
+                    connections = self.get_connections()
+                    for connId in list(owned):
+                        conn_data = connections.get(connId) or self.get_connection_status(connId)
+                        names[connId] = self.connection_name = conn_data['name']
+                        self.connection_status = conn_data['cacheStatus']
+                        # Enqueued/Generating/Generated/Aborted/Failed
+                        if conn_data['cacheStatus'] == 'Generated':
+                            yield finish(connId, True)
+                        elif conn_data['cacheStatus'] in ('Aborted', 'Failed'):
+                            yield finish(connId, Exception(f'Reload metadata is {conn_data["cacheStatus"]}!'))
+                for connId, future in list(joined.items()):
+                    if future.done():
+                        del joined[connId]
+                        yield connId, future.exception() or future.result()
+                if not owned and not joined:
+                    return
+            for connId in list(owned):
+                yield finish(connId, TimeoutError(
+                    f'Timed out after {timeout} seconds while waiting the metadata reload for "{names.get(connId, connId)}" to complete.'))
+            for connId in joined:
+                yield connId, TimeoutError(
+                    f'Timed out after {timeout} seconds while waiting the metadata reload for "{connId}" to complete.')
+        finally:
+            # Release the reloads no longer watched, so that the callers who joined them do not wait forever
+            for connId in list(owned):
+                finish(connId, RuntimeError(
+                    f'The metadata reload for the connection {connId} is no longer monitored.'))
+
+    @staticmethod
+    def _capture(function, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            return e
+
+    def execute_task(self, taskId, timeout=8*3600):
         self.task_id = taskId
         task_info = self.session.get(
             self.api_baseURL+f'/tasks/{taskId}', timeout=(3, 5))
@@ -133,47 +313,181 @@ class NPrinting:
             self.task_name = task_info.json()['data']['name']
             self.task_enabled = task_info.json()['data']['enabled']
         # execute the task
+        execId = self.start_task(taskId)
+        started = time.time()
+        first_check = self.history.first_check(taskId, self.poll_interval, timeout=timeout) if self.history else None
+        i = 0
+        for i in PollScheduler(interval=self.poll_interval, timeout=timeout, backoff=1/60, first_check=first_check):
+            exec_data = self.get_execution(taskId, execId)
+            self.task_status = exec_data['status']
+            # For testing only
+            # print(f'The status of task "{self.task_name}" is {self.task_status}, and checked at {datetime.now():%Y-%m-%d %H:%M:%S} with check number {i}.')
+            if check_execution(exec_data):
+                self.task_completed = completion_time(exec_data)
+                # print(f'The task "{self.task_name}" is completed on {self.task_completed}.')
+                # Running/Aborted/Completed/CompletedwithWarning
+                self._record_run(taskId, started, self.task_status, i + 1, execId)
+                return self.task_status
+        # Abort the execution so that it does not keep holding an NPrinting engine
+        self._record_run(taskId, started, 'Timeout', i + 1, execId)
+        if self.abort_execution(taskId, execId):
+            raise timeout_error(timeout, taskId, execId)
+
+    def start_task(self, taskId):
+        '''Start an execution of the task and return its execution ID'''
         task = self.session.post(
             self.api_baseURL+f'/tasks/{taskId}/executions', verify=False, timeout=(3, 5))
-        if task.status_code == 202:
-            execId = task.json()['data']['id']
-            start_time = time.time()
-            interval = 10
-            timeout = 8 * 3600
-            i = 0
-            check_time = start_time + interval
-
-            while True:
-                time.sleep(1)
-                current_time = time.time()
-                if current_time - start_time > timeout:
-                    raise TimeoutError(
-                        f'Timed out after {timeout} s while waiting the task "{self.task_name}" to complete.')
-                else:
-                    if int(current_time) >= int(check_time):
-                        task_status = self.session.get(
-                            self.api_baseURL+f'/tasks/{taskId}/executions/{execId}', verify=False, timeout=(3, 5))
-                        if task_status.status_code == 200:
-                            self.task_status = task_status.json()[
-                                'data']['status']
-                            task_completed = task_status.json()[
-                                'data']['completed']
-                            d = datetime.fromtimestamp(time.time()).strftime(
-                                '%Y-%m-%d %H:%M:%S')   # Check datetime - for testing only
-                            # For testing only
-                            # print(f'The status of task "{self.task_name}" is {self.task_status}, and checked at {d} with check number {i}. Current time is {current_time} and Check time is {check_time}.')
-                            # None or UTC datetime when completed (ex.2021-11-05T01:52:59.336405Z)
-                            if task_completed is not None:
-                                self.task_completed = parser.parse(task_completed).astimezone(est).strftime('%Y-%m-%d %H:%M:%S')
-                                # print(f'The task "{self.task_name}" is completed on {self.task_completed}.')
-                                # Running/Aborted/Completed/CompletedwithWarning
-                                return self.task_status
-                                break
-                            i = i + 1
-                            check_time = time.time() + interval*(1 + i/60)
-                        else:
-                            raise ConnectionError(
-                                f'Request to check the status of the task with task ID {taskId} failed.')
-        else:
-            raise ConnectionError(
-                f'Request to execute the task with the task ID {taskId} failed.')
+        return parse_start(task, taskId)
+
+    def get_execution(self, taskId, execId):
+        '''Return the status data of the task execution'''
+        task_status = self.session.get(
+            self.api_baseURL+f'/tasks/{taskId}/executions/{execId}', verify=False, timeout=(3, 5))
+        return parse_execution(task_status, taskId)
+
+    def abort_execution(self, taskId, execId):
+        '''Abort the running execution of the task, freeing its NPrinting engine'''
+        r = self.session.put(
+            self.api_baseURL+f'/tasks/{taskId}/executions/{execId}/abort', verify=False, timeout=(3, 5))
+        return check_abort(r, taskId, execId)
+
+    def _record_run(self, taskId, started, status, polls, execId):
+        '''Record the finished execution in the run history and report it to the metrics hooks'''
+        if self.history:
+            self.history.record(taskId, 'report', started, status=status, success=status.startswith('Completed'), polls=polls,
+                                execId=execId)
+        metrics.emit('execution', client='nprinting', key=taskId, execId=execId, status=status, polls=polls,
+                     queue_time=None, run_time=None, wait_time=time.time() - started)
+
+    def execute_tasks(self, taskIds, max_concurrency=4, timeout=8*3600, interval=None):
+        '''Execute several tasks with at most max_concurrency executions at a time (e.g. the number of NPrinting
+        engines) and monitor all running executions from one shared poller, which checks them in parallel once per
+        interval. (taskId, result, completed) is yielded as each task finishes, where result is the status
+        execute_task would return or the exception it would raise for that task, and completed the completion time.'''
+        if max_concurrency < 1:
+            raise ValueError(f'max_concurrency should be at least 1, not {max_concurrency}.')
+        pending = list(dict.fromkeys(taskIds))
+        jobs = {}           # execution ID -> job being monitored
+        scheduler = PollScheduler(interval=interval or self.poll_interval)
+        checks = iter(scheduler)
+
+        def check(execId):
+            try:
+                return self.get_execution(jobs[execId]['taskId'], execId)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            while pending or jobs:
+                # Start the pending tasks while there are free slots
+                while pending and len(jobs) < max_concurrency:
+                    taskId = pending.pop(0)
+                    try:
+                        execId = self.start_task(taskId)
+                    except Exception as e:
+                        yield taskId, e, None
+                        continue
+                    jobs[execId] = dict(taskId=taskId, start_time=time.monotonic(), started=time.time(), polls=0)
+                if not jobs:
+                    continue
+
+                # Wake up at the earliest timeout if it comes before the next check
+                deadline = min(job['start_time'] for job in jobs.values()) + timeout
+                if deadline < scheduler.check_time:
+                    scheduler.reschedule(deadline - time.monotonic())
+                next(checks)
+                execIds = list(jobs)
+                for execId, exec_data in zip(execIds, executor.map(check, execIds)):
+                    job = jobs[execId]
+                    taskId = job['taskId']
+                    job['polls'] = job['polls'] + 1
+                    completed = None
+                    if isinstance(exec_data, Exception):
+                        result = exec_data
+                    elif check_execution(exec_data):
+                        result = exec_data['status']
+                        completed = completion_time(exec_data)
+                        self._record_run(taskId, job['started'], result, job['polls'], execId)
+                    elif time.monotonic() - job['start_time'] >= timeout:
+                        # Abort the execution, otherwise it keeps an engine busy while its slot is reused
+                        self._record_run(taskId, job['started'], 'Timeout', job['polls'], execId)
+                        try:
+                            self.abort_execution(taskId, execId)
+                            result = timeout_error(timeout, taskId, execId)
+                        except Exception as e:
+                            result = e
+                    else:
+                        continue
+                    del jobs[execId]
+                    yield taskId, result, completed
+
+    def list_reports(self, since=None, status='Completed', limit=1000):
+        '''Return the generated reports (On-Demand requests) with the status, completed at or after since if given,
+        newest first. The API has no listing of the reports of a task execution, so pass since=the start of the
+        execution to get the reports generated since then. A since without a time zone is taken as local time.'''
+        r = self.session.get(self.api_baseURL+f'/ondemand/requests?limit={limit}&sort=-created', verify=False,
+                             timeout=(3, 30))
+        if r.status_code != 200:
+            raise ConnectionError('Request to list the generated reports failed.')
+        reports = [report for report in r.json()['data']['items'] if report['status'].lower() == status.lower()]
+        if since is not None:
+            since = (parser.parse(since) if isinstance(since, str) else since).astimezone()
+            reports = [report for report in reports
+                       if report.get('completed') and parser.parse(report['completed']).astimezone() >= since]
+        return reports
+
+    def download_report(self, reportId, directory, chunk_size=1024*1024, retries=3):
+        '''Download the generated report to the directory in chunks, resuming a broken download from the bytes already
+        written, and return {path, bytes, sha256}. The file is named {reportId}_{the name sent by NPrinting}, as the
+        reports of the same template share their name, and is only moved into place once complete; a checksum sent in
+        a Digest header is verified.'''
+        url = self.api_baseURL+f'/ondemand/requests/{reportId}/result'
+        part_path = os.path.join(directory, f'{reportId}.part')
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        for attempt in range(retries + 1):
+            size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={size}-'} if size else {}
+            try:
+                with self.session.get(url, headers=headers, stream=True, verify=False, timeout=(3, 60)) as r:
+                    if r.status_code == 404:
+                        raise FileNotFoundError(f'The report {reportId} is not found.')
+                    if r.status_code not in (200, 206):
+                        raise ConnectionError(
+                            f'Request to download the report {reportId} failed with the status code {r.status_code}.')
+                    # The server ignored the range, start over
+                    mode = 'ab' if r.status_code == 206 else 'wb'
+                    with open(part_path, mode) as f:
+                        for chunk in r.iter_content(chunk_size=chunk_size):
+                            f.write(chunk)
+                    total = r.headers.get('Content-Range', '').rpartition('/')[2] or r.headers.get('Content-Length')
+                    if total and total != '*' and os.path.getsize(part_path) != int(total):
+                        raise ConnectionError(f'The download of the report {reportId} is incomplete.')
+                    name = re.search(r'filename="?([^";]+)"?', r.headers.get('Content-Disposition', ''))
+                    digest = re.search(r'sha-256=([^,\s]+)', r.headers.get('Digest', ''))
+                break
+            except (requests.exceptions.RequestException, ConnectionError):
+                if attempt == retries:
+                    raise
+                PollScheduler.sleep(min(2 ** attempt, 30))
+
+        sha256 = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha256.update(chunk)
+        if digest and base64.b64decode(digest.group(1)) != sha256.digest():
+            os.remove(part_path)
+            raise ValueError(f'The checksum of the downloaded report {reportId} does not match.')
+        path = os.path.join(directory, f'{reportId}_{os.path.basename(name.group(1))}' if name else reportId)
+        os.replace(part_path, path)
+        return dict(path=path, bytes=os.path.getsize(path), sha256=sha256.hexdigest())
+
+    def download_reports(self, reportIds, directory, max_workers=4, chunk_size=1024*1024, retries=3):
+        '''Download several generated reports in parallel and yield (reportId, result) as each finishes, where result
+        is the download_report result or the exception it raised'''
+        os.makedirs(directory, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.download_report, reportId, directory, chunk_size, retries): reportId
+                       for reportId in dict.fromkeys(reportIds)}
+            for future in as_completed(futures):
+                yield futures[future], future.exception() or future.result()
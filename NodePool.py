@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Health-aware routing of the Qliksense repository calls over the nodes of a multi-node site
+import time
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError
+
+
+class NodeStats:
+    __slots__ = ('baseURL', 'healthy', 'latency', 'requests', 'failures', 'server_errors', 'checked_at')
+
+    def __init__(self, baseURL):
+        self.baseURL = baseURL
+        self.healthy = True         # until the first check says otherwise
+        self.latency = None         # moving average of the response time in seconds
+        self.requests = 0
+        self.failures = 0
+        self.server_errors = 0      # consecutive 5xx responses
+        self.checked_at = None
+
+    def __repr__(self):
+        return f"<NodeStats {self.baseURL} healthy={self.healthy} latency={self.latency}>"
+
+    def as_dict(self):
+        return dict(healthy=self.healthy, latency_ms=None if self.latency is None else round(self.latency * 1000, 1),
+                    requests=self.requests, failures=self.failures, checked_at=self.checked_at)
+
+
+class NodePool:
+    '''Pool of the base URLs of a multi-node Qliksense site.
+
+    A background thread checks the health and the latency of every node each check_interval
+    seconds, and best() returns the fastest healthy node for the next repository call. The response times and
+    failures of the real requests are recorded too, so a degrading node is avoided before its next check: a node
+    that does not respond at all is unhealthy at once, one answering with server errors after max_server_errors of
+    them in a row, since a single failing call would fail the same way on every node.'''
+
+    def __init__(self, baseURLs, check_interval=30, alpha=0.3, max_server_errors=3):
+        self.nodes = {baseURL: NodeStats(baseURL) for baseURL in baseURLs}
+        if not self.nodes:
+            raise ValueError('At least one base URL is required for the node pool.')
+        self.check_interval = check_interval
+        self.alpha = alpha          # weight of the latest response time in the moving average
+        self.max_server_errors = max_server_errors
+        self.check_node = None      # function of the base URL returning the status code of its health check
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f"<NodePool with {len(self.nodes)} nodes>"
+
+    @property
+    def baseURLs(self):
+        return list(self.nodes)
+
+    def record(self, baseURL, latency=None, failed=False, server_error=False):
+        '''Record a response time, a failure (no response or failed health check) or a server error of the node'''
+        with self._lock:
+            node = self.nodes[baseURL]
+            node.requests = node.requests + 1
+            if failed:
+                node.failures = node.failures + 1
+                node.healthy = False
+            elif server_error:
+                node.failures = node.failures + 1
+                node.server_errors = node.server_errors + 1
+                if node.server_errors >= self.max_server_errors:
+                    node.healthy = False
+            elif latency is not None:
+                node.healthy = True
+                node.server_errors = 0
+                node.latency = latency if node.latency is None else \
+                    self.alpha*latency + (1 - self.alpha)*node.latency
+
+    def best(self, exclude=()):
+        '''Return the healthy node with the lowest latency, or raise ConnectionError if no node is healthy'''
+        with self._lock:
+            nodes = [node for node in self.nodes.values() if node.healthy and node.baseURL not in exclude]
+        if not nodes:
+            raise ConnectionError(
+                f'No healthy Qliksense node is available among {", ".join(self.nodes)}.')
+        # nodes without measured latency yet come first to get measured
+        return min(nodes, key=lambda node: -1 if node.latency is None else node.latency).baseURL
+
+    def check(self, baseURL):
+        '''Check the health of one node and return whether it is healthy'''
+        start = time.monotonic()
+        try:
+            healthy = self.check_node()(baseURL) == 200
+        except Exception:
+            healthy = False
+        with self._lock:
+            node = self.nodes[baseURL]
+            node.checked_at = time.time()
+        self.record(baseURL, time.monotonic() - start, failed=not healthy)
+        return healthy
+
+    def check_all(self):
+        '''Check all nodes in parallel and return {baseURL: healthy}'''
+        with ThreadPoolExecutor(max_workers=len(self.nodes)) as executor:
+            return dict(zip(self.nodes, executor.map(self.check, self.nodes)))
+
+    def start(self, check_node):
+        '''Check all nodes now and then in the background with check_node(baseURL), which returns the status code.
+        A bound method is only weakly referenced, so that the pool does not keep its client alive; the checks stop
+        when the client is collected.'''
+        if hasattr(check_node, '__self__'):
+            self.check_node = weakref.WeakMethod(check_node)
+            weakref.finalize(check_node.__self__, self.stop)
+        else:
+            self.check_node = lambda: check_node
+        results = self.check_all()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='qliksense-node-checks', daemon=True)
+            self._thread.start()
+        return results
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            if self.check_node() is None:
+                break
+            self.check_all()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        '''Return {baseURL: {healthy, latency_ms, requests, failures, checked_at}}'''
+        with self._lock:
+            return {baseURL: node.as_dict() for baseURL, node in self.nodes.items()}
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Airflow operators executing QMC and NPrinting tasks, deferrable so that no worker slot is held while the tasks run
+import time
+import logging
+from airflow.models import BaseOperator
+
+from Qlik.NPrinting import NPrinting, timeout_error
+from Qlik.Qliksense import Qliksense
+from Qlik.Triggers import NPrintingExecutionTrigger, QliksenseExecutionTrigger
+
+log = logging.getLogger(__name__)
+
+
+def finish(outcomes):
+    '''Return the status of a single task or {task ID: status} of several, or raise ChildProcessError if any failed'''
+    failures = [f'{taskId}: {message}' for taskId, (success, message) in outcomes.items() if not success]
+    if failures:
+        raise ChildProcessError(f'{len(failures)} of {len(outcomes)} tasks failed. ' + ' '.join(failures))
+    statuses = {taskId: message for taskId, (success, message) in outcomes.items()}
+    return next(iter(statuses.values())) if len(statuses) == 1 else statuses
+
+
+class QliksenseTaskOperator(BaseOperator):
+    '''Execute one or several QMC tasks like Qliksense.execute_tasks, with at most max_concurrency tasks at a time
+    and the tasks for the same app one after another.
+
+    With deferrable (default), the worker only starts the tasks and QliksenseExecutionTrigger waits for them in
+    the triggerer; the operator resumes on a worker to start the next pending tasks or to return once all are done.
+    action is the same as for execute_task: proceed/skip/wait/stop/error.'''
+    template_fields = ('taskIds',)
+
+    def __init__(self, taskIds, action='proceed', timeout=36000, max_concurrency=10, poll_interval=None,
+                 deferrable=True, baseURL=None, **kwargs):
+        super().__init__(**kwargs)
+        if max_concurrency < 1:
+            raise ValueError(f'max_concurrency should be at least 1, not {max_concurrency}.')
+        self.taskIds = taskIds
+        self.action = action
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.deferrable = deferrable
+        self.baseURL = baseURL
+
+    def client(self):
+        return Qliksense(self.baseURL).connect()
+
+    def execute(self, context):
+        taskIds = [self.taskIds] if isinstance(self.taskIds, str) else list(self.taskIds)
+        qs = self.client()
+        if not self.deferrable:
+            return finish({taskId: (not isinstance(result, Exception),
+                                    f'{type(result).__name__}: {result}' if isinstance(result, Exception) else result)
+                           for taskId, result in qs.execute_tasks(taskIds, self.action, self.max_concurrency,
+                                                                  self.timeout, self.poll_interval)})
+        return self.schedule(qs, dict(pending=list(dict.fromkeys(taskIds)), jobs={}, outcomes={}))
+
+    def schedule(self, qs, state):
+        '''Start the pending tasks while there are free slots and defer until executions finish, or return the
+        result once no task is left'''
+        jobs, outcomes = state['jobs'], state['outcomes']
+        busy_apps = {job['appId'] for job in jobs.values()}
+        pending = []
+        for taskId in state['pending']:
+            if len(jobs) >= self.max_concurrency:
+                pending.append(taskId)
+                continue
+            try:
+                task_info = qs.get_task_info(taskId)
+                if task_info['app']['id'] in busy_apps:
+                    pending.append(taskId)
+                    continue
+                job = qs._start_job(taskId, task_info, self.action)
+            except Exception as e:
+                outcomes[taskId] = (False, f'{type(e).__name__}: {e}')
+                continue
+            if isinstance(job, str):
+                outcomes[taskId] = (True, job)
+                continue
+            del job['start_time']       # monotonic, meaningless in another process
+            job['deadline'] = time.time() + self.timeout
+            busy_apps.add(job['appId'])
+            jobs[job['execId']] = job
+        state['pending'] = pending
+        if not jobs:
+            return finish(outcomes)
+        trigger = QliksenseExecutionTrigger(
+            {execId: dict(appName=job['appName'], deadline=job['deadline']) for execId, job in jobs.items()},
+            poll_interval=self.poll_interval or qs.poll_interval, baseURL=qs.baseURL, any_done=bool(pending))
+        self.defer(trigger=trigger, method_name='execute_complete', kwargs=dict(state=state))
+
+    def execute_complete(self, context, event, state):
+        qs = self.client()
+        jobs, outcomes = state['jobs'], state['outcomes']
+        for execId, result in event.items():
+            job = jobs.pop(execId)
+            taskId = job['taskId']
+            try:
+                if result['status'] == 'Timeout':
+                    qs._record_run(job['execTaskId'], 'task', job['started'], 'Timeout', False, result['polls'], execId)
+                    if qs.stop_task(job['execTaskId']):
+                        outcomes[taskId] = (False, f'TimeoutError: Timed out after {self.timeout}s while waiting the task {job["execTaskId"]} for the app "{job["appName"]}" to complete. The task {job["execTaskId"]} has been stopped.')
+                elif result['success'] and job['then_start']:
+                    # The active execution is completed, start the task itself
+                    job.update(execId=qs.start_task(taskId), execTaskId=taskId, then_start=False, started=time.time(),
+                               polls=0, deadline=time.time() + self.timeout)
+                    jobs[job['execId']] = job
+                else:
+                    qs._record_run(job['execTaskId'], 'task', job['started'], result['status'], result['success'],
+                                   result['polls'], execId, result['result'])
+                    outcomes[taskId] = (True, result['status'] + job['suffix']) if result['success'] else \
+                        (False, f'ChildProcessError: {result["error"]}')
+            except Exception as e:
+                outcomes[taskId] = (False, f'{type(e).__name__}: {e}')
+        return self.schedule(qs, state)
+
+
+class NPrintingTaskOperator(BaseOperator):
+    '''Execute one or several NPrinting tasks like NPrinting.execute_tasks, with at most max_concurrency executions at
+    a time, failing if any execution is not completed.
+
+    With deferrable (default), the worker only starts the executions and NPrintingExecutionTrigger waits for them
+    in the triggerer; the operator resumes on a worker to start the next pending tasks or to return once all are done.'''
+    template_fields = ('taskIds',)
+
+    def __init__(self, taskIds, timeout=8*3600, max_concurrency=4, poll_interval=None, deferrable=True, baseURL=None,
+                 **kwargs):
+        super().__init__(**kwargs)
+        if max_concurrency < 1:
+            raise ValueError(f'max_concurrency should be at least 1, not {max_concurrency}.')
+        self.taskIds = taskIds
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.deferrable = deferrable
+        self.baseURL = baseURL
+
+    def client(self):
+        return NPrinting(self.baseURL).connect()
+
+    def execute(self, context):
+        taskIds = [self.taskIds] if isinstance(self.taskIds, str) else list(dict.fromkeys(self.taskIds))
+        np = self.client()
+        if not self.deferrable:
+            outcomes = {}
+            for taskId, result, completed in np.execute_tasks(taskIds, self.max_concurrency, self.timeout,
+                                                              self.poll_interval):
+                outcomes[taskId] = (False, f'{type(result).__name__}: {result}') if isinstance(result, Exception) \
+                    else (result.startswith('Completed'), result)
+            return finish(outcomes)
+        return self.schedule(np, dict(pending=taskIds, executions={}, outcomes={}))
+
+    def schedule(self, np, state):
+        '''Start the pending tasks while there are free slots and defer until executions finish, or return the
+        result once no task is left'''
+        executions, pending = state['executions'], state['pending']
+        while pending and len(executions) < self.max_concurrency:
+            try:
+                execId = np.start_task(pending[0])
+            except Exception:
+                # Do not leave the executions already started running unmonitored
+                for execId, execution in executions.items():
+                    try:
+                        np.abort_execution(execution['taskId'], execId)
+                    except Exception as e:
+                        log.warning(f'The execution {execId} of the task {execution["taskId"]} could not be aborted: {e}')
+                raise
+            executions[execId] = dict(taskId=pending.pop(0), deadline=time.time() + self.timeout, started=time.time())
+        if not executions:
+            return finish(state['outcomes'])
+        trigger = NPrintingExecutionTrigger(
+            {execId: dict(taskId=execution['taskId'], deadline=execution['deadline'])
+             for execId, execution in executions.items()},
+            poll_interval=self.poll_interval or np.poll_interval, baseURL=np.baseURL, any_done=bool(pending))
+        self.defer(trigger=trigger, method_name='execute_complete', kwargs=dict(state=state))
+
+    def execute_complete(self, context, event, state):
+        np = self.client()
+        executions, outcomes = state['executions'], state['outcomes']
+        for execId, result in event.items():
+            execution = executions.pop(execId)
+            taskId = execution['taskId']
+            np._record_run(taskId, execution['started'], result['status'], result['polls'], execId)
+            if result['status'] == 'Timeout':
+                try:
+                    np.abort_execution(taskId, execId)
+                    outcomes[taskId] = (False, f'TimeoutError: {timeout_error(self.timeout, taskId, execId)}')
+                except Exception as e:
+                    outcomes[taskId] = (False, f'{type(e).__name__}: {e}')
+            else:
+                outcomes[taskId] = (result['success'], result['status'])
+        return self.schedule(np, state)
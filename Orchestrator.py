@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Dependency-graph orchestration of Qlik app reloads, QMC tasks and NPrinting metadata reloads/tasks
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+log = logging.getLogger(__name__)
+# client and method used to run each kind of node
+kinds = {'task': ('qliksense', 'execute_task'), 'app': ('qliksense', 'reload_app'),
+         'meta': ('nprinting', 'reload_meta'), 'report': ('nprinting', 'execute_task')}
+
+
+class ReloadNode:
+    '''One step of the reload graph.
+    kind is "task" (QMC task ID), "app" (app ID), "meta" (NPrinting connection ID) or "report" (NPrinting task ID),
+    target is the ID, and engine is the Qlik engine node/NPrinting server whose capacity the step takes.
+    duration is the expected run time in seconds used to find the critical path; without it the p50 of the
+    run history is used if there is one.'''
+
+    def __init__(self, name, kind, target, parents=(), engine=None, duration=None, **kwargs):
+        if kind not in kinds:
+            raise ValueError(f'The kind of the node "{name}" should be one of {", ".join(kinds)}.')
+        self.name = name
+        self.kind = kind
+        self.target = target
+        self.parents = list(parents)
+        self.engine = engine or kinds[kind][0]
+        self.duration = duration
+        self.kwargs = kwargs        # extra arguments of the client method, e.g. action or timeout
+
+    def __repr__(self):
+        return f"<ReloadNode {self.name}: {self.kind} {self.target}>"
+
+
+class ReloadOrchestrator:
+    '''Run a graph of reload steps, starting each step as soon as all its parents have succeeded.
+
+    At most capacity[engine] steps run at a time on each engine (default_capacity if not given), and the ready steps
+    with the longest remaining chain (critical path) start first. The succeeded steps are saved in state_path, so
+    a rerun after a failure resumes with the failed and the not yet started steps only. state_path is removed once
+    every step has succeeded, so the next run starts from scratch.
+    qliksense and nprinting are callables returning connected clients; each running step gets its own client.'''
+
+    def __init__(self, nodes, qliksense=None, nprinting=None, capacity=None, default_capacity=2, state_path=None, history=None):
+        self.nodes = {node.name: node for node in nodes}
+        self.clients = {'qliksense': qliksense or self._qliksense, 'nprinting': nprinting or self._nprinting}
+        self.capacity = capacity or {}
+        self.default_capacity = default_capacity
+        self.state_path = state_path
+        self.history = history
+        self.results = {}
+        self.order = self._check_graph()
+        self.priority = self.critical_path()
+
+    def __repr__(self):
+        return f"<ReloadOrchestrator with {len(self.nodes)} nodes>"
+
+    def _qliksense(self):
+        from Qlik.Qliksense import Qliksense
+        return Qliksense(history=self.history).connect()
+
+    def _nprinting(self):
+        from Qlik.NPrinting import NPrinting
+        return NPrinting(history=self.history).connect()
+
+    def _check_graph(self):
+        '''Return the node names in topological order'''
+        for node in self.nodes.values():
+            for parent in node.parents:
+                if parent not in self.nodes:
+                    raise KeyError(f'The parent "{parent}" of the node "{node.name}" is not in the graph.')
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f'The reload graph has a cycle through the node "{name}".')
+            visiting.add(name)
+            for parent in self.nodes[name].parents:
+                visit(parent)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def expected_duration(self, node):
+        if node.duration is not None:
+            return node.duration
+        if self.history:
+            p50 = self.history.p50(node.target)
+            if p50 is not None:
+                return p50
+        return 60
+
+    def critical_path(self):
+        '''Return {name: expected seconds from the start of the node to the end of its longest chain of children}'''
+        children = {name: [] for name in self.nodes}
+        for node in self.nodes.values():
+            for parent in node.parents:
+                children[parent].append(node.name)
+        priority = {}
+        for name in reversed(self.order):
+            priority[name] = self.expected_duration(self.nodes[name]) + \
+                max((priority[child] for child in children[name]), default=0)
+        return priority
+
+    def load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return set(json.load(f)['succeeded']) & set(self.nodes)
+        return set()
+
+    def save_state(self, succeeded):
+        if self.state_path:
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'succeeded': sorted(succeeded)}, f)
+            os.replace(tmp_path, self.state_path)
+
+    def clear_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def run_node(self, node):
+        client_name, method = kinds[node.kind]
+        client = self.clients[client_name]()
+        result = getattr(client, method)(node.target, **node.kwargs)
+        # NPrinting returns the final status of the execution rather than raising
+        if node.kind == 'report' and not str(result).startswith('Completed'):
+            raise ChildProcessError(
+                f'The NPrinting task {node.target} of the node "{node.name}" ended with the status {result}.')
+        return result
+
+    def run(self, resume=True, raise_on_failure=True):
+        '''Run the graph and return {name: result}, where result is the return value of the client method, the
+        exception it raised, or None if the node was skipped because a parent failed'''
+        succeeded = self.load_state() if resume else set()
+        self.results = {name: 'Succeeded in a previous run' for name in succeeded}
+        failed, blocked, running = set(), set(), {}     # running: future -> node
+        busy = {}                                       # engine -> number of running nodes
+        max_workers = sum(self.capacity.get(engine, self.default_capacity)
+                          for engine in {node.engine for node in self.nodes.values()})
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            while True:
+                started = set(self.results) | {node.name for node in running.values()}
+                ready = [node for name, node in self.nodes.items() if name not in started
+                         and all(parent in succeeded for parent in node.parents)]
+                for node in sorted(ready, key=lambda node: -self.priority[node.name]):
+                    if busy.get(node.engine, 0) < self.capacity.get(node.engine, self.default_capacity):
+                        busy[node.engine] = busy.get(node.engine, 0) + 1
+                        running[executor.submit(self.run_node, node)] = node
+                        log.info(f'Started {node.kind} {node.target} for the node "{node.name}".')
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    busy[node.engine] = busy[node.engine] - 1
+                    try:
+                        self.results[node.name] = future.result()
+                        succeeded.add(node.name)
+                        self.save_state(succeeded)
+                    except Exception as e:
+                        log.error(f'The node "{node.name}" failed: {e}')
+                        self.results[node.name] = e
+                        failed.add(node.name)
+                        for name in self.descendants(node.name):
+                            if name not in self.results:
+                                self.results[name] = None
+                                blocked.add(name)
+
+        if succeeded == set(self.nodes):
+            self.clear_state()
+        if failed and raise_on_failure:
+            raise RuntimeError(
+                f'{len(failed)} reload steps failed ({", ".join(sorted(failed))}) and {len(blocked)} steps were skipped. '
+                f'Rerun to resume from the failed steps.')
+        return self.results
+
+    def descendants(self, name):
+        names, stack = set(), [name]
+        while stack:
+            parent = stack.pop()
+            for node in self.nodes.values():
+                if parent in node.parents and node.name not in names:
+                    names.add(node.name)
+                    stack.append(node.name)
+        return names
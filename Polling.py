@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Polling scheduler shared by the Qliksense and NPrinting API clients
+import time
+import random
+import asyncio
+
+from Qlik.Metrics import metrics
+
+
+class PollScheduler:
+    '''Schedule the status checks while waiting for a task, a reload or an execution to complete.
+
+    Iterating the scheduler (with for or async for) sleeps exactly until the next check is due and yields the check
+    number (0, 1, 2, ...).
+    The iteration stops when the timeout is reached, so the code after the loop handles the timeout.
+    After i checks the wait for the next one is interval * (1 + backoff*i) * multiplier**i, capped at max_interval
+    and randomized by +/- jitter (a fraction of the wait), e.g. backoff=1/60 grows the wait by 1/60 after every check.'''
+
+    def __init__(self, interval=10, timeout=None, backoff=0, multiplier=1, max_interval=None, jitter=0, first_check=None):
+        self.interval = interval
+        self.timeout = timeout
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.checks = 0
+        self.expired = False
+        self.start_time = time.monotonic()
+        self.deadline = None if timeout is None else self.start_time + timeout
+        self.check_time = self.start_time + \
+            (interval if first_check is None else first_check)
+
+    def __repr__(self):
+        return f"<PollScheduler every {self.interval}s with timeout {self.timeout}s after {self.checks} checks>"
+
+    def __iter__(self):
+        while True:
+            now = time.monotonic()
+            if self.deadline is not None and self.check_time > self.deadline:
+                self.sleep(self.deadline - now)
+                self.expired = True
+                return
+            self.sleep(self.check_time - now)
+            yield self.checks
+            self.checks = self.checks + 1
+            self.check_time = time.monotonic() + self.next_interval(self.checks)
+
+    async def __aiter__(self):
+        '''Same as iterating, for the coroutines: the waits are asyncio sleeps, so they are cancellable'''
+        while True:
+            now = time.monotonic()
+            if self.deadline is not None and self.check_time > self.deadline:
+                await self.async_sleep(self.deadline - now)
+                self.expired = True
+                return
+            await self.async_sleep(self.check_time - now)
+            yield self.checks
+            self.checks = self.checks + 1
+            self.check_time = time.monotonic() + self.next_interval(self.checks)
+
+    @staticmethod
+    def sleep(seconds):
+        if seconds > 0:
+            metrics.emit('sleep', seconds=seconds)
+            time.sleep(seconds)
+
+    @staticmethod
+    async def async_sleep(seconds):
+        if seconds > 0:
+            metrics.emit('sleep', seconds=seconds)
+            await asyncio.sleep(seconds)
+
+    def next_interval(self, i):
+        '''Return the wait in seconds before the next check after i checks'''
+        wait = self.interval * (1 + self.backoff*i) * self.multiplier**i
+        if self.max_interval is not None:
+            wait = min(wait, self.max_interval)
+        if self.jitter:
+            wait = wait * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return wait
+
+    def reschedule(self, delay):
+        '''Move the next check to delay seconds from now'''
+        self.check_time = time.monotonic() + delay
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def remaining(self):
+        '''Return the seconds left before the timeout, or None without timeout'''
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
@@ -5,33 +5,204 @@
 import sys
 import time
 import json
+import logging
 import requests
 import pytz
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dateutil import parser
-from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import ConnectionError
 from requests_ntlm import HttpNtlmAuth
 
-from airflow.models import Variable
+from Qlik.Cache import TTLCache
+from Qlik.Engine import QlikEngine
+from Qlik.Inventory import QRSInventory
+from Qlik.Metrics import metrics
+from Qlik.NodePool import NodePool
+from Qlik.Polling import PollScheduler
+from Qlik.Sessions import get_credentials, session_pool
 
+try:
+    # optional, to parse large responses incrementally
+    import ijson
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
 est = pytz.timezone('US/Eastern')
 xrf = 'iX83QmNlvu87yyAB'
 # set up necessary headers
 headers = {'X-Qlik-xrfkey': xrf,
            "Content-Type": "application/json",
            "User-Agent": "Windows"}
+# stop time and execution ID reported by QRS for executions that have not finished or started
+null_time = '1753-01-01T00:00:00.000Z'
+null_id = '00000000-0000-0000-0000-000000000000'
+all_status = {0: "NeverStarted", 1: "Triggered", 2: "Started", 3: "Queued", 4: "AbortInitiated", 5: "Aborting", 6: "Aborted",
+              7: "FinishedSuccess", 8: "FinishedFail", 9: "Skipped", 10: "Retry", 11: "Error", 12: "Reset", }
+# Triggered/Started/Queued/AbortInitiated/Aborting/Retry
+active_status = (1, 2, 3, 4, 5, 10)
+active_filter = f"stopTime eq '{null_time}' and executionID ne {null_id} and (" + \
+    ' or '.join(f'status eq {statusId}' for statusId in active_status) + ')'
+
+
+def check_execution(exec_info, appName=None):
+    '''Return the status of an execution result that finished successfully, None while it is still running,
+    and raise ChildProcessError if it is completed but with errors'''
+    statusId = exec_info['status']
+    status = all_status[statusId]
+    if exec_info['stopTime'] == null_time:
+        return None
+    if statusId == 7:
+        return status
+    raise ChildProcessError(
+        f'The task {exec_info["taskID"]} with execution {exec_info["executionID"]} for the app "{appName}" is completed but with errors. The status of the task execution is {status}.')
+
+
+# Building of the QRS requests and parsing of their responses, shared by Qliksense and AsyncQliksense which only
+# differ in how they send the requests
+health_checks = {'Qlik Repository': '/qrs/about', 'Qlik Engine': '/engine/healthcheck', 'Qlik Printing': '/printing/alive'}
+# columns of the executionresult table to find the running executions of apps
+active_columns = ['executionID', 'taskID', 'appID', 'status', 'stopTime']
+
+
+def check_health_results(status_codes):
+    '''Raise SystemError for the first service of health_checks that did not respond with 200'''
+    for item, status_code in zip(health_checks, status_codes):
+        if status_code != 200:
+            raise SystemError(f'{item} is not running properly!')
+    return True
+
+
+def parse_task_info(r, taskId):
+    if r.status_code == 200:
+        return r.json()
+    raise ConnectionError(
+        f'Attempt to check the status for the task with task ID {taskId} failed.')
+
+
+def parse_app_info(r, appId):
+    if r.status_code == 200:
+        return r.json()
+    raise ConnectionError(
+        f'Connection attempt to the app with the app ID {appId} failed.')
+
+
+def reload_time(app_info):
+    '''Return the last reload time of the app in Eastern time'''
+    return parser.parse(app_info['lastReloadTime']).astimezone(est)
+
+
+def table_request(qrs_type, columns, filter=None, skip=0, take=200, sort_column=None, ascending=True):
+    '''Return the path and JSON body of the request for one page of the /table endpoint'''
+    body = json.dumps({'entity': qrs_type, 'columns': [
+        dict(name=column, columnType='Property', definition=column) for column in columns]})
+    query = f'&filter={filter}' if filter else ''
+    if sort_column:
+        query = query + f'&sortColumn={sort_column}&orderAscending={str(ascending).lower()}'
+    return f'/qrs/{qrs_type}/table?skip={skip}&take={take}&xrfkey={xrf}{query}', body
+
+
+def check_table_response(r, qrs_type, filter):
+    if r.status_code not in (200, 201):
+        raise ConnectionError(
+            f'Request to load the {qrs_type} objects with the filter "{filter}" failed.')
+
+
+def active_executions_filter(appIds):
+    return '(' + ' or '.join(f'appId eq {appId}' for appId in appIds) + f') and {active_filter}'
+
+
+def active_execution(exec):
+    '''Return (execution ID, task ID) of a row of active_columns if the execution is running, otherwise None'''
+    if exec['stopTime'] == null_time and exec['executionID'] != null_id:
+        return exec['executionID'], exec['taskID']
+
+
+def add_active_execution(active_execs, exec):
+    '''Add the row of active_columns to {app ID: (execution ID, task ID)} if it is running, keeping the first (latest
+    started) execution of each app'''
+    if active_execution(exec):
+        active_execs.setdefault(exec['appID'], active_execution(exec))
+    return active_execs
+
+
+def execution_path(execIds):
+    query = ' or '.join(f'ExecutionId eq {execId}' for execId in execIds)
+    return f'/qrs/executionresult/full?filter={query}&xrfkey={xrf}'
+
+
+def parse_executions(r, execIds):
+    '''Return {execution ID: execution result} of the response to execution_path'''
+    if r.status_code == 200:
+        return {exec['executionID']: exec for exec in r.json()}
+    raise ConnectionError(
+        f'Request to check the status of task executions {", ".join(execIds)} failed.')
+
+
+def parse_execution(r, execId):
+    if r.status_code == 200:
+        return r.json()[0]
+    raise ConnectionError(
+        f'Request to check the status of task execution "{execId}" failed.')
+
+
+def parse_start(r, taskId):
+    '''Return the execution ID of the response to a task start'''
+    execId = r.json()['value']
+    if r.status_code == 201 and execId != null_id:
+        return execId
+    raise ConnectionError(
+        f'Attempt to start the task with task ID {taskId} failed. Bad connection, incorrect task ID or another running task for the same app.')
+
+
+def check_stop(r, taskId, active_exec=None, appName=None):
+    '''Raise if the task stop was refused, or if active_exec, the execution still running for the app afterwards'''
+    if r.status_code != 204:
+        raise ConnectionError(
+            f'Attempt to stop the task with task ID {taskId} failed. Please stop the task manually in QMC.')
+    if active_exec:
+        raise RuntimeError(
+            f'Attempt to stop the task with task ID {taskId} failed. Another task with task ID {active_exec[1]} for the app {appName} is still running. Please stop the active task manually in QMC.')
+    return True
+
+
+def app_busy_error(taskId, active_taskId, appName):
+    return RuntimeError(
+        f'Attempt to exec the task with task ID {taskId} failed. Another task with task ID {active_taskId} for the app {appName} is still running.')
+
+
+def timeout_error(timeout, taskId, appName):
+    return TimeoutError(f'Timed out after {timeout}s while waiting the task {taskId} for the app "{appName}" to complete. The task {taskId} has been stopped.')
+
 
 class Qliksense:
-    __auth = Variable.get('qs_authorization',deserialize_json=True)
+    __auth = 'qs_authorization'     # Airflow variable with the url/userid/password, loaded on first use
+    # app and reloadtask metadata shared by all instances in the process
+    metadata_cache = TTLCache(maxsize=1024, ttl=300)
+    # bulk inventory of tasks, apps and streams per baseURL
+    inventories = {}
+    # successful health checks per baseURL
+    health_cache = TTLCache(maxsize=64, ttl=60)
+    # seconds between the status checks of the running executions and reloads
+    poll_interval = 10
 
-    def __init__(self, baseURL=__auth['url']):
+    def __init__(self, baseURL=None, history=None, nodes=None, token_cache=None):
+        '''nodes is an optional list of the base URLs of a multi-node site, over which the repository calls are
+        routed to the fastest healthy node. token_cache is an optional TokenCache to reuse the session cookies of
+        earlier processes.'''
         requests.packages.urllib3.disable_warnings()
+        baseURL = baseURL or (nodes[0] if nodes else get_credentials(self.__auth)['url'])
         self.baseURL = baseURL
+        self.history = history      # optional RunHistory to predict the run time of tasks and app reloads
+        self.token_cache = token_cache  # optional TokenCache to reuse the session of earlier processes
+        self.nodes = NodePool(nodes) if nodes else None
         self.api_baseURL = baseURL + '/qrs{}?xrfkey={}'
         self.user_auth = None
+        self.credentials = None     # (userid, password) of the connection, to switch to another baseURL
         self.status_code = None
         self.session = None
+        self.sessions = {}          # session per node
+        self.token_keys = {}        # token cache key per node
         self.app_id = None
         self.app_name = None
         self.app_lastReload = None
@@ -47,205 +218,353 @@ class Qliksense:
     def __del__(self):
         return f"Qliksense instance is deleted!"
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''Stop the background health checks of the node pool'''
+        if self.nodes:
+            self.nodes.stop()
+
     def set_baseURL(self, baseURL):
         self.baseURL = baseURL
         self.api_baseURL = baseURL + '/qrs{}?xrfkey={}'
+        # Switch to the pooled session and token cache entry of the new baseURL
+        if self.session is not None:
+            userid, password = self.credentials
+            self.session, created = session_pool.get(baseURL, userid, password)
+            self.sessions[baseURL] = self.session
+            if self.token_cache:
+                self.token_keys[baseURL] = self.token_cache.key('qliksense', baseURL, userid, password)
+                if created:
+                    self.token_cache.restore(self.token_keys[baseURL], self.session)
 
-    def connect(self, userid=__auth['userid'], password=__auth['password']):
-        # Set up the maximum attempt number and attemp interval of API connection
-        retry = Retry(connect=5, backoff_factor=0.5)
-        adapter = HTTPAdapter(
-            max_retries=retry, pool_connections=50, pool_maxsize=50)
-        # Set up a session for the API connection
-        s = requests.Session()
-        # Use adapter for all requests to endpoints that start with baseURL
-        s.mount(self.baseURL, adapter)
+    def connect(self, userid=None, password=None):
+        if userid is None or password is None:
+            auth = get_credentials(self.__auth)
+            userid, password = userid or auth['userid'], password or auth['password']
+        # Reuse the keep-alive session of the process for the baseURL and credentials
+        self.session, created = session_pool.get(self.baseURL, userid, password)
+        self.sessions = {self.baseURL: self.session}
+        new_sessions = {self.baseURL} if created else set()
         # set up user credentials
         self.user_auth = HttpNtlmAuth(userid, password)
-        # check the health of Qliksense server
-        check_items = {'Qlik Repository': '/qrs/about',
-                       'Qlik Engine': '/engine/healthcheck', 'Qlik Printing': '/printing/alive'}
-        for item in check_items.items():
-            r = s.get(self.baseURL+f'{item[1]}?xrfkey={xrf}', headers=headers,
-                      auth=self.user_auth, verify=False, timeout=(5, 10))
-            if r.status_code != 200:
-                raise SystemError(f'{item[0]} is not running properly!')
+        self.credentials = userid, password
+        if self.nodes:
+            for baseURL in self.nodes.baseURLs:
+                if baseURL not in self.sessions:
+                    self.sessions[baseURL], created = session_pool.get(baseURL, userid, password)
+                    if created:
+                        new_sessions.add(baseURL)
+        # Start the new sessions with the cookies of an earlier process to skip the NTLM handshake
+        entries = {}
+        if self.token_cache:
+            self.token_keys = {baseURL: self.token_cache.key('qliksense', baseURL, userid, password) for baseURL in self.sessions}
+            for baseURL in new_sessions:
+                entries[baseURL] = self.token_cache.restore(self.token_keys[baseURL], self.sessions[baseURL])
+        if self.nodes:
+            # Fail only if none of the nodes is healthy, the others are checked again in the background
+            if not any(self.nodes.start(self._check_node).values()):
+                self.nodes.stop()
+                raise SystemError(
+                    f'None of the Qliksense nodes {", ".join(self.nodes.baseURLs)} is running properly!')
+        else:
+            entry = entries.get(self.baseURL)
+            if entry and entry.get('checked') and time.time() - entry['checked'] < self.health_cache.ttl:
+                self.health_cache.set(self.baseURL, True)
+            else:
+                self.check_health()
+                if self.token_cache:
+                    self.token_cache.set(self.token_keys[self.baseURL], self.session.cookies, checked=time.time())
         self.status_code = 200
-        self.session = s
         return self
 
+    def _check_node(self, baseURL):
+        return self.sessions[baseURL].get(baseURL+f'/qrs/about?xrfkey={xrf}', headers=headers,
+                                          auth=self.user_auth, verify=False, timeout=(5, 10)).status_code
+
+    def request(self, method, path, timeout=(3, 5), retry=None, **kwargs):
+        '''Send the request for the path (e.g. /qrs/about?xrfkey=...) to the baseURL, or to the fastest healthy node
+        with a node pool. GET requests (or any request with retry=True) are retried on another healthy node if the
+        node fails to respond or responds with a server error.'''
+        if not self.nodes:
+            return self._save_cookies(self.baseURL, self.session.request(
+                method, self.baseURL + path, headers=headers, auth=self.user_auth, verify=False, timeout=timeout,
+                **kwargs))
+        retry = method == 'GET' if retry is None else retry
+        tried = []
+        while True:
+            baseURL = self.nodes.best(exclude=tried)
+            tried.append(baseURL)
+            start = time.monotonic()
+            try:
+                r = self.sessions[baseURL].request(method, baseURL + path, headers=headers, auth=self.user_auth,
+                                                   verify=False, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                self.nodes.record(baseURL, failed=True)
+                if retry and len(tried) < len(self.nodes.nodes):
+                    continue
+                raise
+            self.nodes.record(baseURL, time.monotonic() - start, server_error=r.status_code >= 500)
+            if r.status_code >= 500 and retry and len(tried) < len(self.nodes.nodes):
+                continue
+            return self._save_cookies(baseURL, r)
+
+    def _save_cookies(self, baseURL, r):
+        '''Keep the cookies of the session in the token cache whenever the server sets new ones, e.g. after an NTLM
+        handshake'''
+        if self.token_cache and ('Set-Cookie' in r.headers or any('Set-Cookie' in h.headers for h in r.history)):
+            self.token_cache.set(self.token_keys[baseURL], self.sessions[baseURL].cookies)
+        return r
+
+    def node_stats(self):
+        '''Return the health and latency stats per node, or None without a node pool'''
+        return self.nodes.stats() if self.nodes else None
+
+    def check_health(self, refresh=False):
+        '''Check the health of Qliksense server, with the three checks in parallel and the result cached for
+        health_cache.ttl seconds unless refresh'''
+        if not refresh and self.health_cache.get(self.baseURL):
+            return True
+
+        def check(path):
+            return self.session.get(self.baseURL+f'{path}?xrfkey={xrf}', headers=headers,
+                                    auth=self.user_auth, verify=False, timeout=(5, 10)).status_code
+
+        with ThreadPoolExecutor(max_workers=len(health_checks)) as executor:
+            check_health_results(list(executor.map(check, health_checks.values())))
+        return self.health_cache.set(self.baseURL, True)
+
     def reload_app(self, appId, timeout=21600):
         '''A task with the name "Manually triggered reload of ..." will be created automatically in QMC if not exists, otherwise
         the existing "Manually triggered reload of ..." task will be started'''
         self.app_id = appId
         # get app information
-        app_info = self.get_app_info(appId)
+        app_info = self.get_app_info(appId, refresh=True)
         self.app_name = app_info['name']
-        lastRT = parser.parse(app_info['lastReloadTime']).astimezone(est)
+        lastRT = reload_time(app_info)
         # reload data in the app
-        reload = self.session.post(self.api_baseURL.format(
-            f'/app/{appId}/reload', xrf), headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
+        reload = self.request('POST', f'/qrs/app/{appId}/reload?xrfkey={xrf}')
+        self.invalidate(appId=appId)
         if reload.status_code == 204:
-            start_time = time.time()
-            interval = 10
-            # timeout = 6 * 3600
+            started = time.time()
+            first_check = self.history.first_check(appId, self.poll_interval, timeout=timeout) if self.history else None
             i = 0
-            check_time = start_time + interval
-
-            while True:
-                time.sleep(1)
-                current_time = time.time()
-                if current_time - start_time > timeout:
-                    raise TimeoutError(
-                        f'Timed out after {timeout} s while waiting the data reload for the app "{self.app_name}" to complete.')
-                else:
-                    if int(current_time) >= int(check_time):
-                        d = datetime.fromtimestamp(time.time()).strftime(
-                            '%Y-%m-%d %H:%M:%S')   # Check datetime - for testing only
-                        # For testing only
-                        # print(
-                        #     f'The status of app "{self.app_name}" is checked at {d} with check number {i}. Current time is {current_time} and Check time is {check_time}.')
-                        app_info = self.get_app_info(appId)
-                        newRT = parser.parse(
-                            app_info['lastReloadTime']).astimezone(est)
-                        if newRT > lastRT:
-                            # for testing only
-                            # print(
-                            #     f'The data in the app "{self.app_name}" is reloaded successfully!')
-                            self.app_lastReload = newRT.strftime(
-                                '%Y-%m-%d %H:%M:%S')
-                            return True
-                            break
-                        i = i + 1
-                        check_time = time.time() + interval*(1 + i/60)
+            for i in PollScheduler(interval=self.poll_interval, timeout=timeout, backoff=1/60, first_check=first_check):
+                # For testing only
+                # print(
+                #     f'The status of app "{self.app_name}" is checked at {datetime.now():%Y-%m-%d %H:%M:%S} with check number {i}.')
+                app_info = self.get_app_info(appId, refresh=True)
+                newRT = reload_time(app_info)
+                if newRT > lastRT:
+                    # for testing only
+                    # print(
+                    #     f'The data in the app "{self.app_name}" is reloaded successfully!')
+                    self.app_lastReload = newRT.strftime(
+                        '%Y-%m-%d %H:%M:%S')
+                    self._record_run(appId, 'app', started, 'Reloaded', True, i + 1)
+                    return True
+            self._record_run(appId, 'app', started, 'Timeout', False, i + 1)
+            raise TimeoutError(
+                f'Timed out after {timeout} s while waiting the data reload for the app "{self.app_name}" to complete.')
         else:
             raise ConnectionError(
                 f'Attemp to request the reload for the app "{self.app_name}" with the app ID {appId} failed.')
 
-    def get_task_info(self, taskId):
-        t = self.session.get(self.api_baseURL.format(
-            f'/reloadtask/{taskId}', xrf), headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
-        if t.status_code == 200:
-            task = dict(name=t.json()['name'], enabled=t.json()[
-                        'enabled'], isManuallyTriggered=t.json()['isManuallyTriggered'])
-            task_info = dict(app=t.json()['app'], task=task)
+    def reload_app_engine(self, appId, timeout=21600, on_event=None):
+        '''Reload the app through the Qlik Engine API, which reports the completion as soon as it happens instead of
+        polling QRS. Every progress/reloaded/saved event is passed to on_event. Use QlikEngine(self).reload for the
+        async interface.'''
+        self.app_id = appId
+        started = time.time()
+        try:
+            QlikEngine(self).reload_sync(appId, on_event, timeout)
+        except (ChildProcessError, TimeoutError) as e:
+            self._record_run(appId, 'app', started, 'Timeout' if isinstance(e, TimeoutError) else 'Failed', False, 0)
+            raise
+        app_info = self.get_app_info(appId, refresh=True)
+        self.app_name = app_info['name']
+        self.app_lastReload = reload_time(app_info).strftime('%Y-%m-%d %H:%M:%S')
+        self._record_run(appId, 'app', started, 'Reloaded', True, 0)
+        return True
+
+    def get_task_info(self, taskId, refresh=False):
+        '''Return the app and task metadata of the reloadtask, cached for metadata_cache.ttl seconds unless refresh'''
+        key = (self.baseURL, 'reloadtask', taskId)
+        task_info = None if refresh else self.metadata_cache.get(key)
+        if task_info:
             return task_info
-        else:
-            raise ConnectionError(
-                f'Attempt to check the status for the task with task ID {taskId} failed.')
+        t = self.request('GET', f'/qrs/reloadtask/{taskId}?xrfkey={xrf}')
+        return self.cache_task_info(parse_task_info(t, taskId))
+
+    def cache_task_info(self, data):
+        '''Cache and return the task metadata of a reloadtask object returned by QRS'''
+        task = dict(name=data['name'], enabled=data['enabled'], isManuallyTriggered=data['isManuallyTriggered'])
+        task_info = dict(app=data['app'], task=task)
+        return self.metadata_cache.set((self.baseURL, 'reloadtask', data['id']), task_info)
+
+    def get_app_info(self, appId, refresh=False):
+        '''Return the app metadata, cached for metadata_cache.ttl seconds unless refresh'''
+        key = (self.baseURL, 'app', appId)
+        app_info = None if refresh else self.metadata_cache.get(key)
+        if app_info:
+            return app_info
+        r = self.request('GET', f'/qrs/app/{appId}?xrfkey={xrf}')
+        return self.metadata_cache.set(key, parse_app_info(r, appId))
+
+    def invalidate(self, taskId=None, appId=None):
+        '''Drop the cached metadata of the task and/or the app'''
+        if taskId:
+            self.metadata_cache.invalidate((self.baseURL, 'reloadtask', taskId))
+        if appId:
+            self.metadata_cache.invalidate((self.baseURL, 'app', appId))
 
-    def get_app_info(self, appId):
-        r = self.session.get(self.api_baseURL.format(
-            f'/app/{appId}', xrf), headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
+    def get_full(self, qrs_type, filter=None):
+        '''Return all the objects of the QRS type (e.g. reloadtask, app, stream) with one bulk /full request'''
+        query = f'&filter={filter}' if filter else ''
+        r = self.request('GET', f'/qrs/{qrs_type}/full?xrfkey={xrf}{query}', timeout=(5, 60))
         if r.status_code == 200:
             return r.json()
         else:
             raise ConnectionError(
-                f'Connection attempt to the app with the app ID {appId} failed.')
+                f'Request to load all the objects of the type {qrs_type} failed.')
+
+    def inventory(self, max_age=300, full=False):
+        '''Return the inventory of all reload tasks, apps and streams, refreshed with only the objects modified since
+        the last load if it is older than max_age seconds'''
+        inventory = self.inventories.get(self.baseURL)
+        if inventory is None:
+            inventory = self.inventories.setdefault(self.baseURL, QRSInventory(self))
+        inventory.client = self
+        if full or inventory.age() is None or inventory.age() > max_age:
+            inventory.refresh(full)
+        return inventory
+
+    def resolve_task(self, name, app=None):
+        '''Return the ID of the reload task with the name, e.g. to execute a task by its name'''
+        return self.inventory().resolve_task(name, app)
+
+    def resolve_app(self, name, stream=None):
+        '''Return the ID of the app with the name'''
+        return self.inventory().resolve_app(name, stream)
+
+    def iter_table(self, qrs_type, columns, filter=None, page_size=200, sort_column=None, ascending=True):
+        '''Yield the QRS objects as dicts of the columns (properties), requesting one page of page_size rows at a time
+        from the /table endpoint and parsing each page incrementally if ijson is installed'''
+        skip = 0
+        while True:
+            path, body = table_request(qrs_type, columns, filter, skip, page_size, sort_column, ascending)
+            r = self.request('POST', path, timeout=(3, 30), retry=True, data=body, stream=ijson is not None)
+            check_table_response(r, qrs_type, filter)
+            if ijson is not None:
+                r.raw.decode_content = True
+                rows = ijson.items(r.raw, 'rows.item')
+            else:
+                rows = r.json()['rows']
+            n = 0
+            try:
+                for row in rows:
+                    n = n + 1
+                    yield dict(zip(columns, row))
+            finally:
+                r.close()
+            if n < page_size:
+                break
+            skip = skip + page_size
 
     def get_active_execution(self, appId):
-        url = self.baseURL + \
-            f'/qrs/executionresult/full?filter=appId eq {appId}&xrfkey={xrf}'
-        exec_result = self.session.get(
-            url, headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
-        if exec_result.status_code == 200:
-            for exec in exec_result.json():
-                if exec['stopTime'] == '1753-01-01T00:00:00.000Z' and exec['executionID'] != '00000000-0000-0000-0000-000000000000':
-                    return exec['executionID'], exec['taskID']
-        else:
-            raise ConnectionError(
-                f'Connection attempt to obtain the active execution for the app "{appId}" failed.')
+        '''Return (execution ID, task ID) of the running execution for the app, or None if there is none'''
+        for exec in self.iter_table('executionresult', active_columns, active_executions_filter([appId]),
+                                    page_size=50, sort_column='startTime', ascending=False):
+            active_exec = active_execution(exec)
+            if active_exec:
+                return active_exec
+
+    def get_active_executions(self, appIds, batch_size=50):
+        '''Return {app ID: (execution ID, task ID)} of the running executions for many apps with batched requests'''
+        appIds = list(appIds)
+        active_execs = {}
+        for n in range(0, len(appIds), batch_size):
+            for exec in self.iter_table('executionresult', active_columns, active_executions_filter(appIds[n:n + batch_size]),
+                                        sort_column='startTime', ascending=False):
+                add_active_execution(active_execs, exec)
+        return active_execs
 
     def start_task(self, taskId):
-        url = self.baseURL + \
-            f'/qrs/task/{taskId}/start/synchronous?xrfkey={xrf}'
-        t = self.session.post(url, headers=headers,
-                              auth=self.user_auth, verify=False, timeout=(3, 5))
-        execId = t.json()['value']
-        if t.status_code == 201 and execId != '00000000-0000-0000-0000-000000000000':
-            return execId
-        else:
-            raise ConnectionError(
-                f'Attempt to start the task with task ID {taskId} failed. Bad connection, incorrect task ID or another running task for the same app.')
+        t = self.request('POST', f'/qrs/task/{taskId}/start/synchronous?xrfkey={xrf}')
+        self.invalidate(taskId=taskId)
+        return parse_start(t, taskId)
 
     def stop_task(self, taskId):
-        url = self.api_baseURL.format(f'/task/{taskId}/stop', xrf)
-        t = self.session.post(url, headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
+        t = self.request('POST', f'/qrs/task/{taskId}/stop?xrfkey={xrf}')
+        self.invalidate(taskId=taskId)
         time.sleep(5)
-        if t.status_code == 204:
-            app = self.get_task_info(taskId)['app']
-            appId = app['id']
-            appName = app['name']
-            active_exec = self.get_active_execution(appId)
-            if not active_exec:
-                return True
-            else:
-                raise RuntimeError(
-                    f'Attempt to stop the task with task ID {taskId} failed. Another task with task ID {active_exec[1]} for the app {appName} is still running. Please stop the active task manually in QMC.')
-        else:
-            raise ConnectionError(
-                f'Attempt to stop the task with task ID {taskId} failed. Please stop the task manually in QMC.')
+        check_stop(t, taskId)
+        app = self.get_task_info(taskId)['app']
+        return check_stop(t, taskId, self.get_active_execution(app['id']), app['name'])
+
+    def _record_run(self, key, kind, started, status, success, polls, execId=None, exec_result=None):
+        '''Record the finished run in the run history and report it to the metrics hooks, with the queue time
+        (createdDate to startTime) and run time (startTime to stopTime) of the QRS execution result if given'''
+        if self.history:
+            self.history.record(key, kind, started, status=status, success=success, polls=polls, execId=execId)
+        if metrics.hooks:
+            queue_time, run_time = None, None
+            if exec_result and exec_result.get('startTime', null_time) != null_time:
+                startTime = parser.parse(exec_result['startTime']).timestamp()
+                if exec_result.get('createdDate'):
+                    queue_time = max(0, startTime - parser.parse(exec_result['createdDate']).timestamp())
+                if exec_result['stopTime'] != null_time:
+                    run_time = parser.parse(exec_result['stopTime']).timestamp() - startTime
+            metrics.emit('execution', client='qliksense', key=key, execId=execId, status=status, polls=polls,
+                         queue_time=queue_time, run_time=run_time, wait_time=time.time() - started)
 
     def loop_execution_status(self, execId, timeout=36000):
-        url = self.baseURL + \
-            f'/qrs/executionresult/full?filter=ExecutionId eq {execId}&xrfkey={xrf}'
-        all_status = {0: "NeverStarted", 1: "Triggered", 2: "Started", 3: "Queued", 4: "AbortInitiated", 5: "Aborting", 6: "Aborted",
-                      7: "FinishedSuccess", 8: "FinishedFail", 9: "Skipped", 10: "Retry", 11: "Error", 12: "Reset", }
-        exec_info = self.session.get(
-            url, headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
-        if exec_info.status_code == 200:
-            taskId = exec_info.json()[0]['taskID']
-            task_info = self.get_task_info(taskId)
-            appName = task_info['app']['name']
-        else:
-            raise ConnectionError(
-                f'Request to check the status of task execution "{execId}" failed.')
+        path = execution_path([execId])
+        exec_result = parse_execution(self.request('GET', path), execId)
+        taskId = exec_result['taskID']
+        appName = self.get_task_info(taskId)['app']['name']
 
-        start_time = time.time()
-        interval = 10
-        # timeout = 10 * 3600
-        i = 0
-        check_time = start_time + interval
+        # Stay idle until shortly before the expected finish time if the task has a run history
+        started = time.time()
+        if exec_result['startTime'] != null_time:
+            started = min(started, parser.parse(exec_result['startTime']).timestamp())
+        first_check, envelope = None, None
+        if self.history:
+            first_check = self.history.first_check(taskId, self.poll_interval, elapsed=time.time() - started,
+                                                   timeout=timeout)
+            envelope = self.history.envelope(taskId)
 
-        while True:
-            time.sleep(1)
-            current_time = time.time()
-            if current_time - start_time > timeout:
-                if self.stop_task(taskId):
-                    raise TimeoutError(f'Timed out after {timeout}s while waiting the task {taskId} for the app "{appName}" to complete. The task {taskId} has been stopped.')
-            else:
-                if int(current_time) >= int(check_time):
-                    exec_info = self.session.get(
-                        url, headers=headers, auth=self.user_auth, verify=False, timeout=(3, 5))
-                    if exec_info.status_code == 200:
-                        startTime = exec_info.json()[0]['startTime']
-                        stopTime = exec_info.json()[0]['stopTime']
-                        statusId = exec_info.json()[0]['status']
-                        status = all_status[statusId]
-                        d = datetime.fromtimestamp(time.time()).strftime(
-                            '%Y-%m-%d %H:%M:%S')   # Check datetime - for testing only
-                        # For testing only
-                        # print(
-                        #     f'The status of task {taskId} with execution {execId} for the app "{appName}" is {status}, and checked at {d} with check number {i}. Current time is {current_time} and Check time is {check_time}.')
-                        if stopTime != '1753-01-01T00:00:00.000Z' and statusId == 7:
-                            appId = exec_info.json()[0]['appID']
-                            app_info = self.get_app_info(appId)
-                            self.app_lastReload = parser.parse(app_info['lastReloadTime']).astimezone(
-                                est).strftime('%Y-%m-%d %H:%M:%S')
-                            # For testing only
-                            # print(
-                            #     f'The task {taskId} with execution {execId} for the app "{appName}" is completed on {self.app_lastReload}!')
-                            return status
-                            break
-                        else:
-                            if stopTime != '1753-01-01T00:00:00.000Z' and statusId != 7:
-                                raise ChildProcessError(
-                                    f'The task {taskId} with execution {execId} for the app "{appName}" is completed but with errors. The status of the task execution is {status}.')
-                        i = i + 1
-                        check_time = time.time() + interval*(1 + i/60)
-                    else:
-                        raise ConnectionError(
-                            f'Request to check the status of task execution "{execId}" failed.')
+        i = 0
+        for i in PollScheduler(interval=self.poll_interval, timeout=timeout, backoff=1/60, first_check=first_check):
+            exec_result = parse_execution(self.request('GET', path), execId)
+            # For testing only
+            # print(
+            #     f'The status of task {taskId} with execution {execId} for the app "{appName}" is {all_status[exec_result["status"]]}, and checked at {datetime.now():%Y-%m-%d %H:%M:%S} with check number {i}.')
+            try:
+                status = check_execution(exec_result, appName)
+            except ChildProcessError:
+                self._record_run(taskId, 'task', started, all_status[exec_result['status']], False, i + 1, execId,
+                                 exec_result)
+                raise
+            if status:
+                self._record_run(taskId, 'task', started, status, True, i + 1, execId, exec_result)
+                app_info = self.get_app_info(exec_result['appID'], refresh=True)
+                self.app_lastReload = reload_time(app_info).strftime('%Y-%m-%d %H:%M:%S')
+                # For testing only
+                # print(
+                #     f'The task {taskId} with execution {execId} for the app "{appName}" is completed on {self.app_lastReload}!')
+                return status
+            if envelope and time.time() - started > envelope:
+                log.warning(
+                    f'The task {taskId} with execution {execId} for the app "{appName}" has been running for {time.time() - started:.0f}s, longer than its usual run time of {envelope:.0f}s.')
+                envelope = None
+        self._record_run(taskId, 'task', started, 'Timeout', False, i + 1, execId, exec_result)
+        if self.stop_task(taskId):
+            raise timeout_error(timeout, taskId, appName)
 
     # action=proceed/skip/wait/stop/error
     def execute_task(self, taskId, action='proceed',timeout=36000):
@@ -273,13 +592,12 @@ class Qliksense:
                 if action == 'wait':
                     active_execId = active_exec[0]
                     active_taskId = active_exec[1]
-                    if self.loop_execuion_status(active_execId):
+                    if self.loop_execution_status(active_execId):
                         execId = self.start_task(taskId)
                         status = self.loop_execution_status(execId,timeout)
                         status = f'{status} after another running task {active_taskId} is completed'
                     else:
-                        raise RuntimeError(
-                            f'Attempt to exec the task with task ID {taskId} failed. Another task with task ID {active_taskId} for the app {self.app_name} is still running.')
+                        raise app_busy_error(taskId, active_taskId, self.app_name)
                 # Stop the active running task and then execute the new task
                 if action == 'stop':
                     active_execId = active_exec[0]
@@ -294,8 +612,7 @@ class Qliksense:
                 # Raise error if there is an active running task
                 if action == 'error':                                   
                     active_taskId = active_exec[1]
-                    raise RuntimeError(
-                        f'Attempt to exec the task with task ID {taskId} failed. Another task with task ID {active_taskId} for the app {self.app_name} is still running.')
+                    raise app_busy_error(taskId, active_taskId, self.app_name)
             else:
                 execId = self.start_task(taskId)
                 status = self.loop_execution_status(execId,timeout)
@@ -303,3 +620,131 @@ class Qliksense:
         else:
             raise PermissionError(
                 f'{self.task_name} with task ID {taskId} is not enabled to execute!')
+
+    def get_executions(self, execIds, batch_size=50):
+        '''Fetch the execution results of several task executions with one batched request, keyed by execution ID'''
+        execIds = list(execIds)
+        executions = {}
+        for n in range(0, len(execIds), batch_size):
+            batch = execIds[n:n + batch_size]
+            executions.update(parse_executions(self.request('GET', execution_path(batch)), batch))
+        return executions
+
+    def _start_job(self, taskId, task_info, action):
+        '''Apply the action for one task of execute_tasks and return the execution to monitor, or the final status if
+        there is nothing to monitor'''
+        options = ['proceed', 'skip', 'wait', 'stop', 'error']
+        appName = task_info['app']['name']
+        if not task_info['task']['enabled']:
+            raise PermissionError(
+                f'{task_info["task"]["name"]} with task ID {taskId} is not enabled to execute!')
+        job = dict(taskId=taskId, appId=task_info['app']['id'], appName=appName, then_start=False, suffix='')
+        active_exec = self.get_active_execution(job['appId'])
+        if active_exec:
+            active_execId, active_taskId = active_exec
+            # Proceed with the active running task by monitoring its status
+            if action == 'proceed' or action not in options:
+                job.update(execId=active_execId, execTaskId=active_taskId,
+                           suffix=f' with the active execution {active_execId} for the task {active_taskId} instead')
+            # Skip the active running task without monitoring its status
+            elif action == 'skip':
+                return f'Skipped with another task {active_taskId} running'
+            # Wait to execute the new task until the active running task is completed
+            elif action == 'wait':
+                job.update(execId=active_execId, execTaskId=active_taskId, then_start=True,
+                           suffix=f' after another running task {active_taskId} is completed')
+            # Stop the active running task and then execute the new task
+            elif action == 'stop':
+                if not self.stop_task(active_taskId):
+                    raise RuntimeError(
+                        f'Attempt to stop the active task with task ID {active_taskId} for the app {appName} failed.')
+                job.update(execId=self.start_task(taskId), execTaskId=taskId,
+                           suffix=f' by stopping another running task {active_taskId}')
+            # Raise error if there is an active running task
+            elif action == 'error':
+                raise app_busy_error(taskId, active_taskId, appName)
+        else:
+            job.update(execId=self.start_task(taskId), execTaskId=taskId)
+        job.update(start_time=time.monotonic(), started=time.time(), polls=0)
+        return job
+
+    # action=proceed/skip/wait/stop/error
+    def execute_tasks(self, taskIds, action='proceed', max_concurrency=10, timeout=36000, interval=None):
+        '''Execute several tasks and monitor all of their executions from one shared poller, which checks every running
+        execution with one batched request per interval. At most max_concurrency tasks run at a time, and tasks for the
+        same app are executed one after another. (taskId, result) is yielded as each task finishes, where result is
+        the status execute_task would return or the exception it would raise for that task.'''
+        if max_concurrency < 1:
+            raise ValueError(f'max_concurrency should be at least 1, not {max_concurrency}.')
+        pending = list(dict.fromkeys(taskIds))
+        task_infos = {}
+        jobs = {}           # execution ID -> job being monitored
+        busy_apps = set()   # apps with a job being monitored
+        scheduler = PollScheduler(interval=interval or self.poll_interval)
+        checks = iter(scheduler)
+
+        while pending or jobs:
+            # Start the pending tasks while there are free slots
+            n = 0
+            while n < len(pending) and len(jobs) < max_concurrency:
+                taskId = pending[n]
+                try:
+                    if taskId not in task_infos:
+                        task_infos[taskId] = self.get_task_info(taskId)
+                    if task_infos[taskId]['app']['id'] in busy_apps:
+                        n = n + 1
+                        continue
+                    del pending[n]
+                    job = self._start_job(taskId, task_infos[taskId], action)
+                except Exception as e:
+                    if taskId in pending:
+                        del pending[n]
+                    yield taskId, e
+                    continue
+                if isinstance(job, str):
+                    yield taskId, job
+                    continue
+                busy_apps.add(job['appId'])
+                jobs[job['execId']] = job
+            if not jobs:
+                continue
+
+            # Wake up at the earliest timeout if it comes before the next check
+            deadline = min(job['start_time'] for job in jobs.values()) + timeout
+            if deadline < scheduler.check_time:
+                scheduler.reschedule(deadline - time.monotonic())
+            next(checks)
+            executions = self.get_executions(jobs)
+            for execId, job in list(jobs.items()):
+                taskId = job['taskId']
+                job['polls'] = job['polls'] + 1
+                try:
+                    exec_info = executions.get(execId)
+                    status = check_execution(exec_info, job['appName']) if exec_info else None
+                    if status and job['then_start']:
+                        # The active execution is completed, start the task itself
+                        del jobs[execId]
+                        job.update(execId=self.start_task(taskId), execTaskId=taskId,
+                                   then_start=False, start_time=time.monotonic(), started=time.time(), polls=0)
+                        jobs[job['execId']] = job
+                        continue
+                    if status:
+                        self._record_run(job['execTaskId'], 'task', job['started'], status, True, job['polls'],
+                                         execId, exec_info)
+                        result = status + job['suffix']
+                    elif time.monotonic() - job['start_time'] >= timeout:
+                        self._record_run(job['execTaskId'], 'task', job['started'], 'Timeout', False, job['polls'],
+                                         execId, exec_info)
+                        result = None
+                        if self.stop_task(job['execTaskId']):
+                            result = timeout_error(timeout, job['execTaskId'], job['appName'])
+                    else:
+                        continue
+                except Exception as e:
+                    if isinstance(e, ChildProcessError):
+                        self._record_run(job['execTaskId'], 'task', job['started'],
+                                         all_status[exec_info['status']], False, job['polls'], execId, exec_info)
+                    result = e
+                jobs.pop(job['execId'], None)
+                busy_apps.discard(job['appId'])
+                yield taskId, result
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Runtime history of the Qliksense/NPrinting task executions and app reloads
+import os
+import time
+import sqlite3
+from contextlib import closing
+
+default_path = os.path.join(os.path.expanduser('~'), '.qlik', 'run_history.db')
+
+
+class RunHistory:
+    '''Local SQLite store of past executions keyed by taskId/appId, used to predict how long the next run will take.
+
+    The pollers use it to stay idle until shortly before the expected finish time and then poll at the normal
+    interval, and to warn when a run exceeds its historical envelope long before the timeout.'''
+
+    def __init__(self, path=None, min_runs=3, max_runs=50):
+        self.path = path or os.environ.get('QLIK_RUN_HISTORY', default_path)
+        self.min_runs = min_runs    # number of successful runs needed before predicting
+        self.max_runs = max_runs    # number of the latest successful runs used for the prediction
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute('''CREATE TABLE IF NOT EXISTS runs (
+                              key TEXT NOT NULL, kind TEXT NOT NULL, exec_id TEXT, start REAL NOT NULL,
+                              stop REAL NOT NULL, status TEXT, success INTEGER NOT NULL, polls INTEGER)''')
+            db.execute('CREATE INDEX IF NOT EXISTS runs_key ON runs (key, success, stop)')
+
+    def __repr__(self):
+        return f"<{self.path} RunHistory object>"
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, key, kind, start, stop=None, status=None, success=True, polls=None, execId=None):
+        '''Record a finished run, with start/stop as epoch seconds and kind such as "task", "app" or "report"'''
+        stop = time.time() if stop is None else stop
+        with closing(self._connect()) as db, db:
+            db.execute('INSERT INTO runs (key, kind, exec_id, start, stop, status, success, polls) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (key, kind, execId, start, stop, status, int(bool(success)), polls))
+
+    def durations(self, key, limit=None):
+        '''Return the durations in seconds of the latest successful runs, sorted ascending'''
+        with closing(self._connect()) as db:
+            rows = db.execute('SELECT stop - start FROM runs WHERE key = ? AND success = 1 ORDER BY stop DESC LIMIT ?',
+                              (key, limit or self.max_runs)).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def percentile(self, key, q):
+        '''Return the q-th percentile (0-100) of the successful run durations, or None without enough history'''
+        durations = self.durations(key)
+        if len(durations) < self.min_runs:
+            return None
+        # nearest-rank percentile
+        rank = max(1, -(-q * len(durations) // 100))
+        return durations[int(rank) - 1]
+
+    def p50(self, key):
+        return self.percentile(key, 50)
+
+    def p95(self, key):
+        return self.percentile(key, 95)
+
+    def first_check(self, key, interval, elapsed=0, lead=0.9, timeout=None):
+        '''Return the seconds to wait before the first status check: lead * p50 of the past runs minus the time the
+        run has already been going, but never less than the normal interval. With a timeout, the wait is at most
+        timeout - interval, so that the status is checked at least once before the timeout.'''
+        expected = self.p50(key)
+        wait = interval if expected is None else max(interval, expected*lead - elapsed)
+        if timeout is not None:
+            wait = min(wait, max(0, timeout - interval))
+        return wait
+
+    def envelope(self, key, tolerance=1.25):
+        '''Return the run time after which a run is considered overrunning, or None without enough history'''
+        p95 = self.p95(key)
+        return None if p95 is None else p95 * tolerance
+
+    def is_overrunning(self, key, elapsed, tolerance=1.25):
+        envelope = self.envelope(key, tolerance)
+        return envelope is not None and elapsed > envelope
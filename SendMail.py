@@ -1,3 +1,4 @@
+import time
 import smtplib
 from os.path import basename
 from email.header import Header
@@ -9,9 +10,8 @@ from email.utils import COMMASPACE, formatdate, formataddr
 from airflow.configuration import conf
 
 
-def send_mail(send_from, send_to, send_cc, send_bcc, subject, html, files=None,
-              server="smtp.office365.com"):
-
+def build_message(send_from, send_to, send_cc, send_bcc, subject, html, files=None):
+    '''Return the message and its list of recipients'''
     msgRoot = MIMEMultipart('related')
     msgRoot['From'] = send_from
     msgRoot['To'] = send_to
@@ -19,7 +19,7 @@ def send_mail(send_from, send_to, send_cc, send_bcc, subject, html, files=None,
     msgRoot['Bcc'] = send_bcc
     msgRoot['Date'] = formatdate(localtime=True)
     msgRoot['Subject'] = subject
-    rcpt = send_to.split(',')+send_cc.split(',')+send_bcc.split(',')
+    rcpt = [addr for addr in send_to.split(',')+send_cc.split(',')+send_bcc.split(',') if addr.strip()]
 
     msgAlt = MIMEMultipart('alternative')
     msgRoot.attach(msgAlt)
@@ -44,33 +44,123 @@ def send_mail(send_from, send_to, send_cc, send_bcc, subject, html, files=None,
         # After the file is closed
         part['Content-Disposition'] = 'attachment; filename="%s"' % basename(f)
         msgRoot.attach(part)
+    return msgRoot, rcpt
+
+
+def send_mail(send_from, send_to, send_cc, send_bcc, subject, html, files=None,
+              server="smtp.office365.com"):
+
+    msgRoot, rcpt = build_message(send_from, send_to, send_cc, send_bcc, subject, html, files)
+    with Mailer.from_conf() as mailer:
+        mailer.send(msgRoot, rcpt)
+
+
+class Mailer:
+    '''SMTP connection kept open and logged in for a batch of messages, instead of one connection per message.
 
-    smtp_server = conf.get('smtp', 'SMTP_HOST')
-    smtp_port = conf.getint('smtp', 'SMTP_PORT')
-    smtp_starttls = conf.getboolean('smtp', 'SMTP_STARTTLS')
-    smtp_ssl = conf.getboolean('smtp', 'SMTP_SSL')
-    smtp_retry_limit = conf.getint('smtp', 'SMTP_RETRY_LIMIT')
-    smtp_timeout = conf.getint('smtp', 'SMTP_TIMEOUT')
-    smtp_user = conf.get('smtp', 'SMTP_USER')
-    smtp_password = conf.get('smtp', 'SMTP_PASSWORD')
+    The connection is opened on the first message and opened again if the server drops it; rate_limit is the
+    maximum number of messages per second (e.g. 0.5 for Office365's 30 messages a minute), None for no limit.'''
+
+    def __init__(self, host, port=25, starttls=False, ssl=False, user=None, password=None, timeout=30,
+                 retry_limit=3, rate_limit=None):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.ssl = ssl
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.retry_limit = max(1, retry_limit)
+        self.rate_limit = rate_limit
+        self.smtp = None
+        self.connections = 0        # number of connections opened
+        self.last_sent = None
+
+    def __repr__(self):
+        return f"<{self.host}:{self.port} Mailer object for SMTP connection>"
+
+    @classmethod
+    def from_conf(cls, **kwargs):
+        '''Mailer with the [smtp] settings of Airflow, overridden by the keyword arguments'''
+        settings = dict(host=conf.get('smtp', 'SMTP_HOST'), port=conf.getint('smtp', 'SMTP_PORT'),
+                        starttls=conf.getboolean('smtp', 'SMTP_STARTTLS'), ssl=conf.getboolean('smtp', 'SMTP_SSL'),
+                        retry_limit=conf.getint('smtp', 'SMTP_RETRY_LIMIT'),
+                        timeout=conf.getint('smtp', 'SMTP_TIMEOUT'), user=conf.get('smtp', 'SMTP_USER'),
+                        password=conf.get('smtp', 'SMTP_PASSWORD'))
+        settings.update(kwargs)
+        return cls(**settings)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self):
+        self.close()
+        for attempt in range(1, self.retry_limit + 1):
+            try:
+                if self.ssl:
+                    smtp = smtplib.SMTP_SSL(host=self.host, port=self.port, timeout=self.timeout)
+                else:
+                    smtp = smtplib.SMTP(host=self.host, port=self.port, timeout=self.timeout)
+            except smtplib.SMTPServerDisconnected:
+                if attempt < self.retry_limit:
+                    continue
+                raise
+            break
 
-    for attempt in range(1, smtp_retry_limit + 1):
         try:
-            if smtp_ssl:
-                smtp = smtplib.SMTP_SSL(
-                    host=smtp_server, port=smtp_port, timeout=smtp_timeout)
-            else:
-                smtp = smtplib.SMTP(
-                    host=smtp_server, port=smtp_port, timeout=smtp_timeout)
-        except smtplib.SMTPServerDisconnected:
-            if attempt < smtp_retry_limit:
-                continue
+            if self.starttls:
+                smtp.starttls()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            # not kept in self.smtp yet, so close it here
+            smtp.close()
             raise
+        self.smtp = smtp
+        self.connections += 1
+        return smtp
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPServerDisconnected:
+                pass
+            self.smtp = None
+
+    def wait_rate_limit(self):
+        if self.rate_limit and self.last_sent is not None:
+            delay = self.last_sent + 1 / self.rate_limit - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.last_sent = time.monotonic()
+
+    def send(self, msg, rcpt, send_from=None):
+        '''Send the message to the recipients over the open connection, reconnecting if the server has closed it,
+        and return the refused recipients as sendmail does'''
+        self.wait_rate_limit()
+        for attempt in range(1, self.retry_limit + 1):
+            if self.smtp is None:
+                self.connect()
+            try:
+                return self.smtp.sendmail(send_from or msg['From'], rcpt, msg.as_string())
+            except smtplib.SMTPException:
+                if self.smtp.sock is not None:
+                    raise
+                # the connection is closed: dropped when idle, or a 421 reply to a command at the server's limit of
+                # messages per connection
+                self.smtp = None
+                if attempt == self.retry_limit:
+                    raise
 
-        if smtp_starttls:
-            smtp.starttls()
-        if smtp_user and smtp_password:
-            smtp.login(smtp_user, smtp_password)
-        smtp.sendmail(send_from, rcpt, msgRoot.as_string())
-        smtp.quit()
-        break
+    def send_batch(self, messages):
+        '''Send the (message, recipients) pairs one after another over the connection, and yield
+        (message, result) as each is sent, where result is the refused recipients or the exception raised'''
+        for msg, rcpt in messages:
+            try:
+                yield msg, self.send(msg, rcpt)
+            except (smtplib.SMTPException, OSError) as e:
+                yield msg, e
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Process-wide session pool and lazy credential loading for the Qliksense/NPrinting API clients
+import hashlib
+import threading
+import requests
+from functools import lru_cache
+from requests.adapters import HTTPAdapter, Retry
+
+from Qlik.Metrics import metrics
+
+try:
+    # optional, for the async API clients
+    import httpx
+    from httpx_ntlm import HttpNtlmAuth as AsyncNtlmAuth
+except ImportError:
+    httpx = None
+
+
+@lru_cache(maxsize=None)
+def get_credentials(name):
+    '''Load the Airflow variable with the url/userid/password once per process, on first use'''
+    from airflow.models import Variable
+    return Variable.get(name, deserialize_json=True)
+
+
+class SessionPool:
+    '''Thread-safe registry of keep-alive requests sessions shared by all the client instances of the process,
+    keyed by baseURL and credentials, so that the connections (and their NTLM authentication) are reused'''
+
+    def __init__(self, pool_maxsize=50):
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._locks = {}            # lock per key, held while a client logs in on the session
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<SessionPool with {len(self._sessions)} sessions>"
+
+    @staticmethod
+    def key(baseURL, userid, password):
+        return baseURL, userid, hashlib.sha256(f'{password}'.encode()).hexdigest()
+
+    def new_session(self, baseURL):
+        # Set up the maximum attempt number and attemp interval of API connection
+        retry = Retry(connect=5, backoff_factor=0.5)
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize)
+        s = requests.Session()
+        # Use adapter for all requests to endpoints that start with baseURL
+        s.mount(baseURL, adapter)
+        # report every response to the metrics hooks
+        s.hooks['response'].append(metrics.response_hook)
+        return s
+
+    def get(self, baseURL, userid, password):
+        '''Return (session, created), where created is True if the session is new and needs to be set up'''
+        key = self.key(baseURL, userid, password)
+        with self._lock:
+            s = self._sessions.get(key)
+            if s is not None:
+                return s, False
+            s = self._sessions[key] = self.new_session(baseURL)
+            return s, True
+
+    def lock(self, baseURL, userid, password):
+        '''Return the lock of the session for the baseURL and credentials, so that only one thread logs in on it'''
+        key = self.key(baseURL, userid, password)
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def discard(self, baseURL, userid, password):
+        with self._lock:
+            s = self._sessions.pop(self.key(baseURL, userid, password), None)
+        if s is not None:
+            s.close()
+
+    def clear(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for s in sessions:
+            s.close()
+
+
+session_pool = SessionPool()
+
+
+def new_async_client(userid, password, headers=None, max_connections=100):
+    '''Return a connection-pooled httpx client with NTLM authentication for the async API clients, to be closed with
+    aclose() on the event loop that used it'''
+    if httpx is None:
+        raise ImportError('The httpx and httpx-ntlm packages are required for the async API clients.')
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    # Set up the maximum attempt number of API connection
+    transport = httpx.AsyncHTTPTransport(retries=5, verify=False, limits=limits)
+    return httpx.AsyncClient(transport=transport, auth=AsyncNtlmAuth(userid, password), headers=headers,
+                             verify=False, event_hooks={'request': [metrics.httpx_request_hook],
+                                                        'response': [metrics.httpx_response_hook]})
+
+
+def timeout(connect, read):
+    '''Return the httpx timeout of the (connect, read) timeout of requests'''
+    return httpx.Timeout(read, connect=connect)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# On-disk cache of the session cookies and XSRF tokens shared by the processes of the host
+import os
+import hmac
+import json
+import time
+import secrets
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+try:
+    # optional, not available on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
+
+default_path = os.path.join(os.path.expanduser('~'), '.qlik', 'tokens.json')
+
+
+class TokenCache:
+    '''JSON file of the session cookies per baseURL and credentials, read and written under a file lock, so that a new
+    process reuses the authenticated session of an earlier one instead of logging in again. Pass one to the clients
+    to use it, e.g. Qliksense(token_cache=TokenCache()).
+
+    The entries are keyed by an HMAC of the credentials with a random salt of the file, so the file does not give
+    away a password hash that could be cracked offline.
+
+    An entry expires ttl seconds after it is saved or when its first cookie expires; a client that gets 401/403 with
+    a cached session invalidates the entry and logs in again. The file is only readable by its owner.'''
+
+    def __init__(self, path=None, ttl=8*3600):
+        self.path = path or os.environ.get('QLIK_TOKEN_CACHE', default_path)
+        self.ttl = ttl
+        self._salt = None
+
+    def __repr__(self):
+        return f"<{self.path} TokenCache object>"
+
+    def key(self, client, baseURL, userid, password):
+        if self._salt is None:
+            with self._locked(exclusive=True):
+                content = self._read()
+                if not content.get('salt'):
+                    content = dict(salt=secrets.token_hex(16), entries={})
+                    self._write(content)
+                self._salt = content['salt']
+        digest = hmac.new(bytes.fromhex(self._salt), f'{userid}\0{password}'.encode(), hashlib.sha256).hexdigest()
+        return '|'.join((client, baseURL, userid, digest))
+
+    @contextmanager
+    def _locked(self, exclusive):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        '''Return the content {salt, entries} of the file'''
+        try:
+            with open(self.path) as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return content if isinstance(content.get('entries'), dict) else {}
+
+    def _entries(self):
+        content = self._read()
+        # the keys are only valid with the salt they were made with
+        return content['entries'] if content.get('salt') == self._salt else {}
+
+    def _write(self, content):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', prefix='.tokens.')
+        os.chmod(tmp_path, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        '''Return the entry {cookies, saved, checked} of the key, or None if there is none or it has expired'''
+        with self._locked(exclusive=False):
+            entry = self._entries().get(key)
+        if entry is None or self.expired(entry):
+            return None
+        return entry
+
+    def expired(self, entry):
+        now = time.time()
+        expires = [cookie['expires'] for cookie in entry['cookies'] if cookie.get('expires')]
+        return now - entry['saved'] > self.ttl or (expires and min(expires) <= now)
+
+    def set(self, key, cookies, checked=None):
+        '''Save the cookies of the session, and the time of its last successful health check if given'''
+        entry = dict(cookies=[dict(name=c.name, value=c.value, domain=c.domain, path=c.path, expires=c.expires,
+                                   secure=c.secure) for c in cookies], saved=time.time(), checked=checked)
+        with self._locked(exclusive=True):
+            entries = {k: v for k, v in self._entries().items() if not self.expired(v)}
+            if checked is None and key in entries:
+                entry['checked'] = entries[key].get('checked')
+            entries[key] = entry
+            self._write(dict(salt=self._salt, entries=entries))
+        return entry
+
+    def invalidate(self, key):
+        with self._locked(exclusive=True):
+            entries = self._entries()
+            if entries.pop(key, None) is not None:
+                self._write(dict(salt=self._salt, entries=entries))
+
+    def restore(self, key, session):
+        '''Load the cached cookies of the key into the requests session and return the entry, or None'''
+        entry = self.get(key)
+        if entry is None:
+            return None
+        for cookie in entry['cookies']:
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                                expires=cookie['expires'], secure=cookie['secure'])
+        return entry
+
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Airflow triggers waiting in the triggerer for the QMC and NPrinting task executions started by the deferrable operators
+import time
+import asyncio
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+from Qlik.AsyncNPrinting import AsyncNPrinting
+from Qlik.AsyncQliksense import AsyncQliksense
+from Qlik.NPrinting import check_execution as check_report
+from Qlik.Polling import PollScheduler
+from Qlik.Qliksense import all_status, check_execution
+
+
+class QliksenseExecutionTrigger(BaseTrigger):
+    '''Wait for QMC task executions to reach a terminal status, checking all of them with one batched request per poll.
+
+    executions is {execution ID: {"appName": ..., "deadline": epoch seconds}}. The event is
+    {execution ID: {"status", "success", "error", "polls", "result"}} for the finished executions, with the status
+    "Timeout" for the executions past their deadline. It is fired once all executions are finished, or as soon as one
+    is if any_done, without the executions still running.'''
+
+    def __init__(self, executions, poll_interval=10, baseURL=None, any_done=False):
+        super().__init__()
+        self.executions = executions
+        self.poll_interval = poll_interval
+        self.baseURL = baseURL
+        self.any_done = any_done
+
+    def serialize(self):
+        return 'Qlik.Triggers.QliksenseExecutionTrigger', dict(
+            executions=self.executions, poll_interval=self.poll_interval, baseURL=self.baseURL, any_done=self.any_done)
+
+    async def run(self):
+        running = dict(self.executions)
+        results = {}
+        deadline = max(execution['deadline'] for execution in running.values())
+        async with AsyncQliksense(self.baseURL) as qs:
+            i = 0
+            scheduler = PollScheduler(interval=self.poll_interval, timeout=max(0, deadline - time.time()))
+            async for i in scheduler:
+                executions = await qs.get_executions(running)
+                for execId, exec_info in executions.items():
+                    try:
+                        status = check_execution(exec_info, running[execId]['appName'])
+                        if not status:
+                            continue
+                        results[execId] = dict(status=status, success=True, error=None, polls=i + 1, result=exec_info)
+                    except ChildProcessError as e:
+                        results[execId] = dict(status=all_status[exec_info['status']], success=False, error=str(e),
+                                               polls=i + 1, result=exec_info)
+                    del running[execId]
+                for execId, execution in list(running.items()):
+                    if time.time() >= execution['deadline']:
+                        results[execId] = dict(status='Timeout', success=False, error=None, polls=i + 1, result=None)
+                        del running[execId]
+                if not running or (self.any_done and results):
+                    break
+            # Past the last deadline, otherwise the executions still running are left out of the event
+            if scheduler.expired:
+                for execId in running:
+                    results[execId] = dict(status='Timeout', success=False, error=None, polls=i + 1, result=None)
+        yield TriggerEvent(results)
+
+
+class NPrintingExecutionTrigger(BaseTrigger):
+    '''Wait for NPrinting task executions to be completed, checking them concurrently on every poll.
+
+    executions is {execution ID: {"taskId": ..., "deadline": epoch seconds}}. The event is
+    {execution ID: {"status", "success", "completed", "polls"}} for the completed executions, with the status
+    "Timeout" for the executions past their deadline. It is fired once all executions are completed, or as soon as
+    one is if any_done, without the executions still running.'''
+
+    def __init__(self, executions, poll_interval=10, baseURL=None, any_done=False):
+        super().__init__()
+        self.executions = executions
+        self.poll_interval = poll_interval
+        self.baseURL = baseURL
+        self.any_done = any_done
+
+    def serialize(self):
+        return 'Qlik.Triggers.NPrintingExecutionTrigger', dict(
+            executions=self.executions, poll_interval=self.poll_interval, baseURL=self.baseURL, any_done=self.any_done)
+
+    async def run(self):
+        running = dict(self.executions)
+        results = {}
+        deadline = max(execution['deadline'] for execution in running.values())
+        async with AsyncNPrinting(self.baseURL) as np:
+            i = 0
+            scheduler = PollScheduler(interval=self.poll_interval, timeout=max(0, deadline - time.time()))
+            async for i in scheduler:
+                execIds = list(running)
+                executions = await asyncio.gather(*(np.get_execution(running[execId]['taskId'], execId)
+                                                    for execId in execIds))
+                for execId, exec_data in zip(execIds, executions):
+                    # Running/Aborted/Completed/CompletedwithWarning
+                    status = check_report(exec_data)
+                    if status:
+                        results[execId] = dict(status=status, success=status.startswith('Completed'),
+                                               completed=exec_data['completed'], polls=i + 1)
+                        del running[execId]
+                    elif time.time() >= running[execId]['deadline']:
+                        results[execId] = dict(status='Timeout', success=False, completed=None, polls=i + 1)
+                        del running[execId]
+                if not running or (self.any_done and results):
+                    break
+            # Past the last deadline, otherwise the executions still running are left out of the event
+            if scheduler.expired:
+                for execId in running:
+                    results[execId] = dict(status='Timeout', success=False, completed=None, polls=i + 1)
+        yield TriggerEvent(results)
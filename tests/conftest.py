@@ -0,0 +1,45 @@
+# Fixtures of the tests, run from the directory containing the Qlik package: python -m pytest Qlik/tests
+import json
+import asyncio
+import importlib
+
+import pytest
+
+from Qlik.MockServer import MockQlikServer
+from Qlik import Sessions
+
+
+@pytest.fixture
+def server(monkeypatch):
+    '''MockQlikServer whose URL and credentials are returned for the Airflow variables'''
+    with MockQlikServer(duration=0.5) as server:
+        from airflow.models import Variable
+        monkeypatch.setattr(Variable, 'get', staticmethod(
+            lambda name, deserialize_json=False: dict(url=server.baseURL, userid='test', password='test')))
+        Sessions.get_credentials.cache_clear()
+        yield server
+        Sessions.get_credentials.cache_clear()
+        Sessions.session_pool.clear()
+
+
+def run_operator(operator):
+    '''Execute the operator like Airflow, running every trigger it defers to until it returns, and return
+    (result, events) with the events fired by the triggers'''
+    from airflow.exceptions import TaskDeferred
+    events = []
+    try:
+        return operator.execute({}), events
+    except TaskDeferred as deferred:
+        while True:
+            path, kwargs = deferred.trigger.serialize()
+            module, name = path.rsplit('.', 1)
+            trigger = getattr(importlib.import_module(module), name)(**json.loads(json.dumps(kwargs)))
+
+            async def first_event():
+                async for event in trigger.run():
+                    return event.payload
+            events.append(json.loads(json.dumps(asyncio.run(first_event()))))
+            try:
+                return getattr(operator, deferred.method_name)({}, event=events[-1], **deferred.kwargs), events
+            except TaskDeferred as again:
+                deferred = again
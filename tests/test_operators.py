@@ -0,0 +1,40 @@
+import pytest
+
+from conftest import run_operator
+from Qlik.NPrinting import NPrinting
+from Qlik.Operators import NPrintingTaskOperator, QliksenseTaskOperator
+
+
+def test_nprinting_operator_starts_at_most_max_concurrency_executions(server):
+    server.durations.update(r1=0.5, r2=2, r3=0.5)
+    operator = NPrintingTaskOperator(taskIds=['r1', 'r2', 'r3'], max_concurrency=2, poll_interval=0.2, timeout=60)
+    result, events = run_operator(operator)
+
+    assert result == {'r1': 'Completed', 'r2': 'Completed', 'r3': 'Completed'}
+    # r3 is started only once r1 is completed, while r2 is still running
+    assert len(events) == 2 and list(events[0].values())[0]['status'] == 'Completed'
+
+
+def test_nprinting_operator_aborts_started_executions_if_a_start_fails(server, monkeypatch):
+    start_task = NPrinting.start_task
+
+    def start_or_fail(self, taskId):
+        if taskId == 'bad':
+            raise ConnectionError(f'Request to execute the task with the task ID {taskId} failed.')
+        return start_task(self, taskId)
+    monkeypatch.setattr(NPrinting, 'start_task', start_or_fail)
+    server.durations.update(r1=30)
+    with pytest.raises(ConnectionError):
+        run_operator(NPrintingTaskOperator(taskIds=['r1', 'bad'], max_concurrency=2, poll_interval=0.2))
+    assert [execution.get('aborted') for execution in server.np_executions.values()] == [True]
+
+
+@pytest.mark.parametrize('operator', [QliksenseTaskOperator, NPrintingTaskOperator])
+def test_max_concurrency_below_1_is_refused(operator):
+    with pytest.raises(ValueError):
+        operator(taskIds=['t1'], max_concurrency=0)
+
+
+def test_nprinting_execute_tasks_refuses_max_concurrency_below_1():
+    with pytest.raises(ValueError):
+        list(NPrinting('http://127.0.0.1:1').execute_tasks(['r1'], max_concurrency=0))
@@ -0,0 +1,47 @@
+import os
+
+from Qlik.Orchestrator import ReloadNode, ReloadOrchestrator
+
+
+class Client:
+    '''Stand-in client recording the targets it runs and failing the reports in aborted'''
+
+    def __init__(self, aborted=()):
+        self.runs = []
+        self.aborted = set(aborted)
+
+    def execute_task(self, target, **kwargs):
+        self.runs.append(target)
+        return 'Aborted' if target in self.aborted else 'Completed'
+
+    def reload_meta(self, target, **kwargs):
+        self.runs.append(target)
+        return True
+
+
+def orchestrator(client, state_path):
+    nodes = [ReloadNode('meta', 'meta', 'c1'), ReloadNode('report', 'report', 'r1', parents=['meta']),
+             ReloadNode('after', 'report', 'r2', parents=['report'])]
+    return ReloadOrchestrator(nodes, nprinting=lambda: client, state_path=state_path)
+
+
+def test_successful_run_is_not_skipped_next_time(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    client = Client()
+    orchestrator(client, state_path).run()
+    assert not os.path.exists(state_path)
+    results = orchestrator(client, state_path).run()
+    assert client.runs == ['c1', 'r1', 'r2'] * 2
+    assert results == {'meta': True, 'report': 'Completed', 'after': 'Completed'}
+
+
+def test_failed_run_resumes_from_the_failed_step(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    failing = Client(aborted={'r1'})
+    results = orchestrator(failing, state_path).run(raise_on_failure=False)
+    assert isinstance(results['report'], ChildProcessError) and results['after'] is None
+    client = Client()
+    results = orchestrator(client, state_path).run()
+    assert client.runs == ['r1', 'r2']
+    assert results['meta'] == 'Succeeded in a previous run'
+    assert not os.path.exists(state_path)
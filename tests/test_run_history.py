@@ -0,0 +1,36 @@
+from Qlik.NPrinting import NPrinting
+from Qlik.Qliksense import Qliksense
+from Qlik.RunHistory import RunHistory
+
+
+def history_of(tmp_path, key, seconds, runs=3):
+    history = RunHistory(path=str(tmp_path / 'history.db'))
+    for n in range(runs):
+        history.record(key, 'report', start=1000.0 * n, stop=1000.0 * n + seconds, status='Completed')
+    return history
+
+
+def test_first_check_comes_before_the_timeout(tmp_path):
+    history = history_of(tmp_path, 'r1', 100)
+    assert history.first_check('r1', 1) == 90
+    assert history.first_check('r1', 1, timeout=30) == 29
+    assert history.first_check('r1', 10, timeout=5) == 0
+
+
+def test_execution_shorter_than_its_history_is_checked_before_the_timeout(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(NPrinting, 'poll_interval', 0.2)
+    history = history_of(tmp_path, 'r1', 100)
+    np = NPrinting(server.baseURL, history=history).connect('test', 'test')
+    assert np.execute_task('r1', timeout=3) == 'Completed'
+    assert ('PUT', '/api/v1/tasks/{id}/executions/{id}/abort') not in server.counts
+
+
+def test_execute_tasks_records_the_timeouts(server, tmp_path):
+    server.durations.update(t2=30)
+    history = RunHistory(path=str(tmp_path / 'history.db'))
+    qs = Qliksense(server.baseURL, history=history).connect('test', 'test')
+    results = dict(qs.execute_tasks(['t1', 't2'], timeout=2, interval=0.2))
+    assert results['t1'] == 'FinishedSuccess'
+    assert isinstance(results['t2'], TimeoutError)
+    with history._connect() as db:
+        assert db.execute("SELECT status, success FROM runs WHERE key = 't2'").fetchall() == [('Timeout', 0)]
@@ -0,0 +1,15 @@
+from Qlik.MockServer import MockQlikServer
+from Qlik.Qliksense import Qliksense
+from Qlik.TokenCache import TokenCache
+
+
+def test_set_baseURL_switches_the_session_and_token_key(server, tmp_path):
+    token_cache = TokenCache(path=str(tmp_path / 'tokens.json'))
+    with MockQlikServer(duration=0.5) as other:
+        qs = Qliksense(server.baseURL, token_cache=token_cache).connect('test', 'test')
+        session = qs.session
+        qs.set_baseURL(other.baseURL)
+        assert qs.session is not session
+        # the first response of the other server sets a session cookie to be cached under its key
+        assert qs.get_task_info('t1')['app']['id']
+        assert token_cache.get(token_cache.key('qliksense', other.baseURL, 'test', 'test'))
@@ -0,0 +1,14 @@
+from conftest import run_operator
+from Qlik.Operators import QliksenseTaskOperator
+
+
+def test_any_done_leaves_running_executions_to_the_next_trigger(server):
+    # t1 and t2 run first, t1 finishes while t2 is still running and t3 is pending
+    server.durations.update(t1=0.5, t2=3, t3=0.5)
+    operator = QliksenseTaskOperator(taskIds=['t1', 't2', 't3'], max_concurrency=2, poll_interval=0.2, timeout=60)
+    result, events = run_operator(operator)
+
+    assert len(events) > 1
+    assert all(result['status'] != 'Timeout' for event in events for result in event.values())
+    assert ('POST', '/qrs/task/{id}/stop') not in server.counts
+    assert result == {'t1': 'FinishedSuccess', 't2': 'FinishedSuccess', 't3': 'FinishedSuccess'}